@@ -1,14 +1,22 @@
+import time
 from typing import List
 
 import uvicorn as uvicorn
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
+from fastapi.openapi.models import APIKey
 from fastapi.openapi.utils import get_openapi
+from prometheus_client import CONTENT_TYPE_LATEST
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 
+from commons.metrics import HTTP_REQUEST_SECONDS, GaugeCollector, generate_metrics
+from commons.mongo_utils import mongo_pool_stats
 from memory import Memory
 from settings import settings
+from webapp.auth_controler import check_auth_token
 from webapp.routes import router
+from webapp.utils.async_utils import io_pool_stats, run_io
+from webapp.utils.celery_utils import broker_pool_stats, queue_depths
 
 
 memory = Memory.getInstance()
@@ -60,7 +68,44 @@ if settings.SWAGGER_UI:
     app.openapi = custom_openapi
 
 
-EXEMPT_URLS: List[str] = ["/health/", "/favicon.ico", "/docs", "/openapi.json"]
+EXEMPT_URLS: List[str] = [
+    "/health/",
+    "/metrics",
+    "/favicon.ico",
+    "/docs",
+    "/openapi.json",
+]
+
+# the depth of the queues is read from the broker when the metrics are scraped
+queue_depth_collector = GaugeCollector(
+    "email_fraud_queue_depth",
+    "Messages waiting in the queues of the broker",
+    "queue",
+    queue_depths,
+)
+
+
+@app.get("/health/", summary="Check that the API is up")
+def health() -> dict:
+    return {"status": "ok", "version": settings.APP_VERSION}
+
+
+@app.get(
+    "/health/pools",
+    summary="Get the utilization of the I/O threads, broker and MongoDB connection pools",
+)
+async def pools(api_key: APIKey = Depends(check_auth_token)) -> dict:
+    return {
+        "io_threads": io_pool_stats(),
+        "broker": broker_pool_stats(),
+        "mongo": mongo_pool_stats(),
+    }
+
+
+@app.get("/metrics", summary="Get the metrics in the Prometheus text format")
+async def metrics() -> Response:
+    content = await run_io(generate_metrics, queue_depth_collector)
+    return Response(content, media_type=CONTENT_TYPE_LATEST)
 
 
 @app.middleware("http")
@@ -79,6 +124,21 @@ async def token_auth_middleware(request: Request, call_next):
     return response
 
 
+@app.middleware("http")
+async def latency_middleware(request: Request, call_next):
+    # outside of the authentication, so that the rejected requests are measured too
+    start = time.perf_counter()
+    response = await call_next(request)
+    # the route template, not the path, which contains emails and task ids
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        method=request.method,
+        route=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    ).observe(time.perf_counter() - start)
+    return response
+
+
 if __name__ == "__main__":
     uvicorn_log_config = uvicorn.config.LOGGING_CONFIG
     uvicorn_log_config["loggers"] = {
@@ -0,0 +1,324 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, TextIO, Tuple
+
+from commons.constants import INTERESTING_COLUMN
+from commons.model_serving import predict_emails_proba
+from commons.model_training import get_model_meta_data, get_serving_model_id, load_model
+
+FORMATS = ["csv", "ndjson", "parquet"]
+EXTENSIONS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".parquet": "parquet",
+}
+
+# the id and the model of a scoring process, inherited from the parent process
+# when the pool is forked, loaded by the initializer of the pool otherwise
+_scoring_model = (None, None)
+
+
+def file_format(path: str, given_format: str = None) -> str:
+    """
+    Get the format of a file, given or guessed from its extension
+
+    Args:
+        path (str): The path of the file, "-" for stdin/stdout
+        given_format (str, optional): The format, one of FORMATS. Defaults to the extension of the path.
+
+    Returns:
+        str: the format of the file
+    """
+    if given_format:
+        return given_format
+    if path == "-":
+        return "csv"
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError(f"Unknown format of '{path}', use one of {FORMATS}")
+    return EXTENSIONS[extension]
+
+
+def _import_pyarrow():
+    # optional dependency, only needed for the Parquet files
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def _chunks(emails: Iterator[str], chunk_size: int) -> Iterator[List[str]]:
+    chunk = []
+    for email in emails:
+        chunk.append(email)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_csv(stream: TextIO) -> Iterator[str]:
+    # the `email` column if the file has a header, otherwise the first column
+    rows = (row for row in csv.reader(stream) if row)
+    first = next(rows, None)
+    if first is None:
+        return
+    header = [column.strip() for column in first]
+    if INTERESTING_COLUMN.EMAIL_COLUMN in header:
+        index = header.index(INTERESTING_COLUMN.EMAIL_COLUMN)
+    else:
+        index = 0
+        yield first[index]
+    for row in rows:
+        yield row[index]
+
+
+def _read_ndjson(stream: TextIO) -> Iterator[str]:
+    # each line is a JSON string or an object with an `email` field
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            record = record[INTERESTING_COLUMN.EMAIL_COLUMN]
+        yield str(record)
+
+
+def read_email_chunks(
+    path: str, chunk_size: int, input_format: str = None
+) -> Iterator[List[str]]:
+    """
+    Read the emails of a file in chunks, without loading the whole file
+
+    Args:
+        path (str): The path of a CSV, NDJSON or Parquet file, "-" for stdin
+        chunk_size (int): The number of emails per chunk
+        input_format (str, optional): The format of the file. Defaults to its extension, CSV for stdin.
+
+    Returns:
+        Iterator[List[str]]: the chunks of emails, in the file order
+    """
+    input_format = file_format(path, input_format)
+    if input_format == "parquet":
+        if path == "-":
+            raise ValueError("Parquet can not be read from stdin")
+        _, pq = _import_pyarrow()
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(
+            batch_size=chunk_size, columns=[INTERESTING_COLUMN.EMAIL_COLUMN]
+        ):
+            yield batch.column(0).to_pylist()
+        return
+
+    stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+    try:
+        reader = _read_csv if input_format == "csv" else _read_ndjson
+        yield from _chunks(reader(stream), chunk_size)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+class ResultWriter:
+    """
+    Append the scored chunks to a CSV, NDJSON or Parquet file as they come
+    """
+
+    def __init__(self, path: str, output_format: str = None) -> None:
+        self.format = file_format(path, output_format)
+        self._parquet_writer = None
+        if self.format == "parquet":
+            if path == "-":
+                raise ValueError("Parquet can not be written to stdout")
+            self.path = path
+            return
+        self._stream = (
+            sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+        )
+        if self.format == "csv":
+            self._csv_writer = csv.writer(self._stream)
+            self._csv_writer.writerow(
+                [INTERESTING_COLUMN.EMAIL_COLUMN, "proba", "model_id"]
+            )
+
+    def write(self, emails: List[str], probas: List[float], model_id: str) -> None:
+        if self.format == "csv":
+            self._csv_writer.writerows(
+                (email, proba, model_id) for email, proba in zip(emails, probas)
+            )
+        elif self.format == "ndjson":
+            self._stream.writelines(
+                json.dumps(
+                    {
+                        INTERESTING_COLUMN.EMAIL_COLUMN: email,
+                        "proba": proba,
+                        "model_id": model_id,
+                    }
+                )
+                + "\n"
+                for email, proba in zip(emails, probas)
+            )
+        else:
+            pa, pq = _import_pyarrow()
+            table = pa.table(
+                {
+                    INTERESTING_COLUMN.EMAIL_COLUMN: emails,
+                    "proba": probas,
+                    "model_id": [model_id] * len(emails),
+                }
+            )
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+
+    def close(self) -> None:
+        if self.format == "parquet":
+            if self._parquet_writer is not None:
+                self._parquet_writer.close()
+        elif self._stream is sys.stdout:
+            self._stream.flush()
+        else:
+            self._stream.close()
+
+
+def _load_scoring_model(model_id: str) -> None:
+    global _scoring_model
+    if _scoring_model[0] != model_id:
+        _scoring_model = (model_id, load_model(model_id))
+
+
+def _score_chunk(emails: List[str]) -> List[float]:
+    return predict_emails_proba(_scoring_model[1], emails, len(emails))
+
+
+def _ordered_results(
+    executor: ProcessPoolExecutor,
+    chunks: Iterator[List[str]],
+    pending: list,
+    window: int,
+) -> Iterator[Tuple[List[str], List[float]]]:
+    # only the probabilities come back from the scoring processes
+    for chunk in chunks:
+        pending.append((chunk, executor.submit(_score_chunk, chunk)))
+        if len(pending) >= window:
+            chunk, future = pending.pop(0)
+            yield chunk, future.result()
+    while pending:
+        chunk, future = pending.pop(0)
+        yield chunk, future.result()
+
+
+def bulk_score(
+    input_path: str,
+    output_path: str,
+    model_id: str = None,
+    chunk_size: int = 10000,
+    processes: int = None,
+    input_format: str = None,
+    output_format: str = None,
+    report_interval: float = 10.0,
+) -> dict:
+    """
+    Score all the emails of a file with a registered model and stream the
+    results to another file, in the input order. The chunks are scored by a
+    pool of processes, with at most two chunks per process in memory.
+
+    Args:
+        input_path (str): The CSV, NDJSON or Parquet file of the emails, "-" for stdin
+        output_path (str): The CSV, NDJSON or Parquet file of the results, "-" for stdout
+        model_id (str, optional): The id of the model. Defaults to the serving model.
+        chunk_size (int, optional): The number of emails scored per call. Defaults to 10000.
+        processes (int, optional): The number of scoring processes. Defaults to the number of cores.
+        input_format (str, optional): The format of the input. Defaults to its extension.
+        output_format (str, optional): The format of the output. Defaults to its extension.
+        report_interval (float, optional): Seconds between two progress reports on stderr. Defaults to 10.
+
+    Returns:
+        dict: the id of the model, the number of rows, the duration and the rows/s
+    """
+    model_id = model_id or get_serving_model_id()
+    if model_id is None:
+        raise Exception("No model is serving, give the id of a model")
+    if get_model_meta_data(model_id) is None:
+        raise Exception(f"Model '{model_id}' not found")
+    processes = processes or os.cpu_count()
+    # loaded (and compiled if needed) once, before the pool is forked
+    _load_scoring_model(model_id)
+
+    writer = ResultWriter(output_path, output_format)
+    chunks = read_email_chunks(input_path, chunk_size, input_format)
+    executor, pending = None, []
+    rows, start, last_report = 0, time.perf_counter(), time.perf_counter()
+    try:
+        if processes == 1:
+            results = ((chunk, _score_chunk(chunk)) for chunk in chunks)
+        else:
+            executor = ProcessPoolExecutor(
+                processes, initializer=_load_scoring_model, initargs=(model_id,)
+            )
+            # a bounded window of chunks in flight, written back in the input order
+            results = _ordered_results(executor, chunks, pending, 2 * processes)
+        for emails, probas in results:
+            writer.write(emails, probas, model_id)
+            rows += len(emails)
+            if time.perf_counter() - last_report > report_interval:
+                last_report = time.perf_counter()
+                print(
+                    f"{rows} rows scored ({rows / (last_report - start):.0f} rows/s)",
+                    file=sys.stderr,
+                )
+    finally:
+        writer.close()
+        if executor is not None:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown()
+
+    duration = time.perf_counter() - start
+    return {
+        "model_id": model_id,
+        "rows": rows,
+        "duration": duration,
+        "rows_per_second": rows / duration if duration else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Score the emails of a CSV, NDJSON or Parquet file (or stdin) "
+        "with a registered model, and stream the results to a file (or stdout)"
+    )
+    parser.add_argument("input", help='the file of the emails, "-" for stdin')
+    parser.add_argument("output", help='the file of the results, "-" for stdout')
+    parser.add_argument("--model-id", help="the model, defaults to the serving model")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument(
+        "--processes", type=int, help="scoring processes, defaults to the cores"
+    )
+    parser.add_argument("--input-format", choices=FORMATS)
+    parser.add_argument("--output-format", choices=FORMATS)
+    args = parser.parse_args()
+
+    result = bulk_score(
+        args.input,
+        args.output,
+        model_id=args.model_id,
+        chunk_size=args.chunk_size,
+        processes=args.processes,
+        input_format=args.input_format,
+        output_format=args.output_format,
+    )
+    print(
+        f"{result['rows']} rows scored with model '{result['model_id']}' in "
+        f"{result['duration']:.1f} s ({result['rows_per_second']:.0f} rows/s)",
+        file=sys.stderr,
+    )
@@ -0,0 +1,532 @@
+import json
+import os
+import re
+import shutil
+import unicodedata
+from typing import List, Tuple
+
+import numpy as np
+
+from commons.constants import INTERESTING_COLUMN
+
+_WHITE_SPACES = re.compile(r"\s\s+")
+# emails exercising the preprocessing: case, accents, white spaces, short strings
+PARITY_EDGE_CASES = [
+    "",
+    " ",
+    "a",
+    "ab",
+    "FRAUDE@GMAIL.COM",
+    "élève.ça@école.fr",
+    "ﬁ@ﬂ.com",
+    "john  doe@\tmail.com",
+    "用户@例子.广告",
+    "x" * 300 + "@gmail.com",
+]
+# the largest difference of probability with the pipeline of a compiled model
+PARITY_ATOL = 1e-9
+
+
+def _strip_accents_unicode(text: str) -> str:
+    try:
+        text.encode("ASCII", errors="strict")
+        return text
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize("NFKD", text)
+        return "".join([c for c in normalized if not unicodedata.combining(c)])
+
+
+def _strip_accents_ascii(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode("ASCII")
+
+
+def _char_ngrams(text: str, min_n: int, max_n: int) -> List[str]:
+    text_len = len(text)
+    return [
+        text[i : i + n]
+        for n in range(min_n, min(max_n + 1, text_len + 1))
+        for i in range(text_len - n + 1)
+    ]
+
+
+def _char_wb_ngrams(text: str, min_n: int, max_n: int) -> List[str]:
+    ngrams = []
+    for word in text.split():
+        word = " " + word + " "
+        word_len = len(word)
+        for n in range(min_n, max_n + 1):
+            offset = 0
+            ngrams.append(word[offset : offset + n])
+            while offset + n < word_len:
+                offset += 1
+                ngrams.append(word[offset : offset + n])
+            if offset == 0:
+                break
+    return ngrams
+
+
+def _flatten_trees(trees: list) -> dict:
+    # the nodes of all the trees in one set of arrays, with the leaves at -1
+    # and the children indices shifted by the offset of their tree
+    node_counts = np.array([len(tree["feature"]) for tree in trees])
+    offsets = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+    children_left = np.concatenate(
+        [
+            np.where(tree["children_left"] == -1, -1, tree["children_left"] + offset)
+            for tree, offset in zip(trees, offsets)
+        ]
+    )
+    children_right = np.concatenate(
+        [
+            np.where(tree["children_right"] == -1, -1, tree["children_right"] + offset)
+            for tree, offset in zip(trees, offsets)
+        ]
+    )
+    return {
+        "roots": offsets.astype(np.int64),
+        "feature": np.concatenate([tree["feature"] for tree in trees]).astype(np.int64),
+        "threshold": np.concatenate([tree["threshold"] for tree in trees]),
+        "children_left": children_left.astype(np.int64),
+        "children_right": children_right.astype(np.int64),
+        "value": np.concatenate([tree["value"] for tree in trees]),
+        "max_depth": np.array(max(tree["max_depth"] for tree in trees)),
+    }
+
+
+def _compile_gradient_boosting(model, n_features: int) -> Tuple[dict, dict]:
+    if model.n_trees_per_iteration_ != 1:
+        raise ValueError("Only binary classifiers can be compiled")
+    trees = [
+        {
+            "feature": tree.feature,
+            "threshold": tree.threshold,
+            "children_left": tree.children_left,
+            "children_right": tree.children_right,
+            "value": tree.value[:, 0, 0],
+            "max_depth": tree.max_depth,
+        }
+        for tree in (estimator.tree_ for estimator in model.estimators_[:, 0])
+    ]
+    arrays = _flatten_trees(trees)
+    arrays["init_raw_prediction"] = np.asarray(
+        model._raw_predict_init(np.zeros((1, n_features), dtype=np.float32))[0],
+        dtype=np.float64,
+    )
+    # the trees compare single precision features to double precision thresholds
+    config = {"learning_rate": model.learning_rate, "features_dtype": "float32"}
+    return config, arrays
+
+
+def _compile_hist_gradient_boosting(model) -> Tuple[dict, dict]:
+    if model.n_trees_per_iteration_ != 1:
+        raise ValueError("Only binary classifiers can be compiled")
+    if model.is_categorical_ is not None:
+        raise ValueError("Categorical features can not be compiled")
+    trees = []
+    for predictors in model._predictors:
+        nodes = predictors[0].nodes
+        trees.append(
+            {
+                "feature": nodes["feature_idx"],
+                "threshold": nodes["num_threshold"],
+                "children_left": np.where(nodes["is_leaf"], -1, nodes["left"]),
+                "children_right": np.where(nodes["is_leaf"], -1, nodes["right"]),
+                "value": nodes["value"],
+                "max_depth": int(nodes["depth"].max()),
+            }
+        )
+    arrays = _flatten_trees(trees)
+    arrays["init_raw_prediction"] = np.asarray(
+        model._baseline_prediction, dtype=np.float64
+    ).ravel()
+    # the leaf values are already shrunk, the features compared in double
+    # precision: the thresholds fall on values of the features, which the
+    # engine computes to the last bit of sklearn (see CompiledModel.transform)
+    config = {"learning_rate": 1.0, "features_dtype": "float64"}
+    return config, arrays
+
+
+def _compile_linear(model) -> Tuple[dict, dict]:
+    if model.coef_.shape[0] != 1:
+        raise ValueError("Only binary classifiers can be compiled")
+    # the logistic regression has no loss parameter
+    loss = getattr(model, "loss", "log_loss")
+    if loss not in ("log_loss", "modified_huber"):
+        raise ValueError(f"The loss '{loss}' does not predict probabilities")
+    link = "modified_huber" if loss == "modified_huber" else "logistic"
+    arrays = {
+        "coef": np.asarray(model.coef_[0], dtype=np.float64),
+        "intercept": np.asarray(model.intercept_, dtype=np.float64).ravel(),
+    }
+    return {"link": link}, arrays
+
+
+def compile_pipeline(pipeline) -> dict:
+    """
+    Compile a fitted pipeline built by `train_model` into plain NumPy arrays:
+    the char n-gram vocabulary, the IDF vector and the flattened trees (or the
+    coefficients of a linear model)
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline to compile
+
+    Returns:
+        dict: the arrays of the compiled model, as saved by `save_compiled_model`
+    """
+    steps = (
+        pipeline.named_steps["preprocessing"]
+        .named_transformers_["email_transformer"]
+        .named_steps
+    )
+    if "tf_idf_vectorizer" not in steps:
+        # the engine looks the n-grams up in the sorted vocabulary, which a
+        # hashing vectorizer does not have (its murmurhash is not reimplemented)
+        raise ValueError("Only the tf-idf vectorizer can be compiled")
+    vectorizer = steps["tf_idf_vectorizer"]
+    model = pipeline.named_steps["model"]
+    if hasattr(model, "steps"):
+        # the classifier after the dense conversion of the histogram-based boosting
+        model = model.steps[-1][1]
+
+    if vectorizer.analyzer not in ("char", "char_wb"):
+        raise ValueError(f"Analyzer '{vectorizer.analyzer}' can not be compiled")
+    if vectorizer.strip_accents not in (None, "unicode", "ascii"):
+        raise ValueError(
+            "Only the 'unicode' and 'ascii' accent stripping can be compiled"
+        )
+    if vectorizer.preprocessor is not None or vectorizer.norm not in (None, "l2", "l1"):
+        raise ValueError("The vectorizer can not be compiled")
+
+    config = {
+        "analyzer": vectorizer.analyzer,
+        "ngram_range": list(vectorizer.ngram_range),
+        "lowercase": vectorizer.lowercase,
+        "strip_accents": vectorizer.strip_accents,
+        "binary": vectorizer.binary,
+        "sublinear_tf": vectorizer.sublinear_tf,
+        "use_idf": vectorizer.use_idf,
+        "norm": vectorizer.norm,
+    }
+    # sorted terms, looked up with a binary search, and the column of each term
+    terms = np.array(sorted(vectorizer.vocabulary_), dtype=str)
+    n_features = len(terms)
+
+    if hasattr(model, "coef_"):
+        model_config, model_arrays = _compile_linear(model)
+        config["kind"] = "linear"
+    elif hasattr(model, "_predictors"):
+        model_config, model_arrays = _compile_hist_gradient_boosting(model)
+        config["kind"] = "trees"
+    else:
+        model_config, model_arrays = _compile_gradient_boosting(model, n_features)
+        config["kind"] = "trees"
+    config.update(model_config)
+
+    return {
+        "config": np.array(json.dumps(config)),
+        "vocabulary": terms,
+        "vocabulary_index": np.array(
+            [vectorizer.vocabulary_[term] for term in terms.tolist()], dtype=np.int64
+        ),
+        "idf": (
+            vectorizer.idf_.astype(np.float64)
+            if vectorizer.use_idf
+            else np.ones(n_features, dtype=np.float64)
+        ),
+        "classes": np.asarray(model.classes_),
+        **model_arrays,
+    }
+
+
+def save_compiled_model(arrays: dict, path: str) -> None:
+    """
+    Save the arrays of a compiled model to a folder, one uncompressed `.npy`
+    file per array, so that they can be memory-mapped
+
+    Args:
+        arrays (dict): The arrays returned by `compile_pipeline`
+        path (str): The path of the folder
+    """
+    # written in a temporary folder then renamed, so that a reader never sees a partial model
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{key}.npy"), array, allow_pickle=False)
+    # the previous version of the model (a retrained default model) is moved
+    # aside, the processes mapping it keep reading it
+    old_path = f"{path}.{os.getpid()}.old"
+    try:
+        os.rename(path, old_path)
+    except OSError:
+        pass
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process compiled the same model in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class SparseFeatures:
+    """
+    The TF-IDF matrix of a batch of emails returned by `CompiledModel.transform`:
+    the row, the column and the value of each non-zero entry. The entries of a
+    row are in the order sklearn stores them (decreasing columns), so that the
+    sums over a row are rounded as those of the pipeline.
+    """
+
+    def __init__(
+        self,
+        rows: np.ndarray,
+        columns: np.ndarray,
+        values: np.ndarray,
+        shape: Tuple[int, int],
+    ) -> None:
+        self.rows = rows
+        self.columns = columns
+        self.values = values
+        self.shape = shape
+
+    def toarray(self) -> np.ndarray:
+        X = np.zeros(self.shape, dtype=np.float64)
+        X[self.rows, self.columns] = self.values
+        return X
+
+
+def _coordinates(X) -> SparseFeatures:
+    # the features given as a SparseFeatures, a scipy sparse matrix or a dense array
+    if isinstance(X, SparseFeatures):
+        return X
+    if hasattr(X, "tocoo"):
+        X = X.tocoo()
+        return SparseFeatures(
+            X.row.astype(np.int64), X.col.astype(np.int64), X.data, X.shape
+        )
+    X = np.asarray(X)
+    rows, columns = np.nonzero(X)
+    return SparseFeatures(rows, columns, X[rows, columns], X.shape)
+
+
+class CompiledModel:
+    """
+    Scoring engine of a compiled pipeline. It scores raw email strings with
+    NumPy only and mirrors `Pipeline.predict_proba`.
+    """
+
+    def __init__(self, arrays: dict) -> None:
+        config = json.loads(arrays["config"].item())
+        self.analyzer = config["analyzer"]
+        self.min_n, self.max_n = config["ngram_range"]
+        self.lowercase = config["lowercase"]
+        self.strip_accents = {
+            None: None,
+            "unicode": _strip_accents_unicode,
+            "ascii": _strip_accents_ascii,
+        }[config["strip_accents"]]
+        self.binary = config["binary"]
+        self.sublinear_tf = config["sublinear_tf"]
+        self.norm = config["norm"]
+        # models compiled before the linear models were supported are trees
+        self.kind = config.get("kind", "trees")
+
+        self.vocabulary = arrays["vocabulary"]
+        if "vocabulary_index" in arrays:
+            self.vocabulary_index = arrays["vocabulary_index"]
+        else:
+            # models compiled before the vocabulary was sorted
+            order = np.argsort(self.vocabulary)
+            self.vocabulary, self.vocabulary_index = self.vocabulary[order], order
+        self.n_features = len(self.vocabulary)
+        self.idf = arrays["idf"]
+        self.classes_ = arrays["classes"]
+        if self.kind == "linear":
+            self.link = config["link"]
+            self.coef = arrays["coef"]
+            self.intercept = float(arrays["intercept"][0])
+            return
+        self.link = "logistic"
+        self.learning_rate = config["learning_rate"]
+        self.features_dtype = np.dtype(config.get("features_dtype", "float32"))
+        self.init_raw_prediction = float(arrays["init_raw_prediction"][0])
+        self.roots = arrays["roots"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.children_left = arrays["children_left"]
+        self.children_right = arrays["children_right"]
+        self.value = arrays["value"]
+        self.max_depth = int(arrays["max_depth"])
+        # the trees only read the columns they split on, gathered in a dense matrix
+        self.split_features = np.unique(self.feature[self.children_left != -1])
+        self.split_column = np.full(self.n_features, -1, dtype=np.int64)
+        self.split_column[self.split_features] = np.arange(len(self.split_features))
+        self.node_column = np.maximum(self.split_column[self.feature], 0)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r") -> "CompiledModel":
+        """
+        Load a compiled model saved by `save_compiled_model`. The arrays are
+        memory-mapped read-only by default, so the processes serving the same
+        model share their pages through the page cache instead of each holding a copy.
+
+        Args:
+            path (str): The folder of the model, or the `.npz` file of a model saved by a previous version
+            mmap_mode (str, optional): The memory-map mode of the arrays, None to read them in memory. Defaults to "r".
+
+        Returns:
+            CompiledModel: the compiled model
+        """
+        if not os.path.isdir(path):
+            with np.load(path, allow_pickle=False) as arrays:
+                return cls({key: arrays[key] for key in arrays.files})
+        return cls(
+            {
+                file_name[: -len(".npy")]: np.load(
+                    os.path.join(path, file_name), mmap_mode=mmap_mode
+                )
+                for file_name in os.listdir(path)
+                if file_name.endswith(".npy")
+            }
+        )
+
+    def _ngrams(self, email: str) -> List[str]:
+        if self.lowercase:
+            email = email.lower()
+        if self.strip_accents is not None:
+            email = self.strip_accents(email)
+        email = _WHITE_SPACES.sub(" ", email)
+        if self.analyzer == "char_wb":
+            return _char_wb_ngrams(email, self.min_n, self.max_n)
+        return _char_ngrams(email, self.min_n, self.max_n)
+
+    def transform(self, emails: List[str]) -> SparseFeatures:
+        """
+        Compute the sparse TF-IDF matrix of a list of emails, with the values
+        of `Pipeline.transform` to the last bit
+        """
+        ngrams, lengths = [], []
+        for email in emails:
+            email_ngrams = self._ngrams(email)
+            ngrams.extend(email_ngrams)
+            lengths.append(len(email_ngrams))
+        keys = np.zeros(0, dtype=np.int64)
+        if ngrams and self.n_features:
+            # one binary search in the sorted vocabulary for all the n-grams of the batch
+            ngrams = np.array(ngrams)
+            positions = np.searchsorted(self.vocabulary, ngrams)
+            np.minimum(positions, self.n_features - 1, out=positions)
+            known = self.vocabulary[positions] == ngrams
+            rows = np.repeat(np.arange(len(emails), dtype=np.int64), lengths)[known]
+            keys = rows * self.n_features + self.vocabulary_index[positions[known]]
+        # the counts of the (row, column) pairs, the columns of a row decreasing
+        keys, counts = np.unique(keys, return_counts=True)
+        keys, values = keys[::-1], counts[::-1].astype(np.float64)
+        rows, columns = keys // max(self.n_features, 1), keys % max(self.n_features, 1)
+
+        if self.binary:
+            np.minimum(values, 1, out=values)
+        if self.sublinear_tf:
+            np.log(values, out=values)
+            values += 1
+        values *= self.idf[columns]
+        if self.norm is not None:
+            if self.norm == "l2":
+                norms = np.sqrt(np.bincount(rows, values * values, len(emails)))
+            else:
+                norms = np.bincount(rows, np.abs(values), len(emails))
+            norms[norms == 0] = 1
+            values /= norms[rows]
+        return SparseFeatures(rows, columns, values, (len(emails), self.n_features))
+
+    def decision_function(self, X) -> np.ndarray:
+        """
+        Compute the raw predictions of the trees (or of the linear model) for a TF-IDF matrix
+        """
+        X = _coordinates(X)
+        n_rows = X.shape[0]
+        if self.kind == "linear":
+            # summed row by row in the order of the entries, like a sparse product
+            return (
+                np.bincount(X.rows, X.values * self.coef[X.columns], n_rows)
+                + self.intercept
+            )
+        split = self.split_column[X.columns] >= 0
+        X_split = np.zeros(
+            (n_rows, len(self.split_features)), dtype=self.features_dtype
+        )
+        X_split[X.rows[split], self.split_column[X.columns[split]]] = X.values[split]
+        rows = np.arange(n_rows)[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (n_rows, len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.children_left[nodes]
+            is_leaf = left == -1
+            if is_leaf.all():
+                break
+            go_left = X_split[rows, self.node_column[nodes]] <= self.threshold[nodes]
+            nodes = np.where(
+                is_leaf, nodes, np.where(go_left, left, self.children_right[nodes])
+            )
+
+        raw_predictions = np.full(n_rows, self.init_raw_prediction)
+        leaf_values = self.value[nodes]
+        for tree in range(leaf_values.shape[1]):
+            raw_predictions += self.learning_rate * leaf_values[:, tree]
+        return raw_predictions
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Predict the class probabilities of a list of emails
+
+        Args:
+            X: the emails, as a list of strings or a DataFrame with an email column
+
+        Returns:
+            np.ndarray: the probabilities, of shape (n_emails, 2), in the order of `classes_`
+        """
+        if hasattr(X, "columns"):
+            X = X[INTERESTING_COLUMN.EMAIL_COLUMN].tolist()
+        return self.predict_proba_features(self.transform(X))
+
+    def predict_proba_features(self, X) -> np.ndarray:
+        """
+        Predict the class probabilities for a TF-IDF matrix returned by `transform`
+        (or a scipy sparse or dense matrix)
+        """
+        decision = self.decision_function(X)
+        if self.link == "modified_huber":
+            proba = (np.clip(decision, -1, 1) + 1) / 2
+        else:
+            proba = 1 / (1 + np.exp(-decision))
+        return np.column_stack([1 - proba, proba])
+
+
+def check_parity(
+    pipeline, compiled: CompiledModel, emails: List[str], atol: float = PARITY_ATOL
+) -> float:
+    """
+    Check that a compiled model scores raw emails, and PARITY_EDGE_CASES, as
+    the pipeline it was compiled from
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        compiled (CompiledModel): The compiled model
+        emails (List[str]): The emails to score
+        atol (float, optional): The largest difference of probability. Defaults to PARITY_ATOL.
+
+    Raises:
+        ValueError: if a probability differs by more than atol
+
+    Returns:
+        float: the largest difference of probability
+    """
+    import pandas as pd
+
+    emails = list(emails) + PARITY_EDGE_CASES
+    expected = pipeline.predict_proba(
+        pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: emails})
+    )
+    error = float(np.abs(expected - compiled.predict_proba(emails)).max())
+    if error > atol:
+        raise ValueError(
+            f"The compiled model diverges from the pipeline (max abs error {error:.3e})"
+        )
+    return error
@@ -21,6 +21,9 @@ class AllPaths(BaseModel):
     MODELS_FOLDER = "data/models/"
     DATA_POINTS_FILES = "data/data_points.csv"
     MODEL_META_DATA_FILE = "data/model_meta_data.json"
+    MODEL_REGISTRY_FILE = "data/model_registry.sqlite3"
+    DATASET_CACHE_FOLDER = "data/cache/dataset/"
+    FEATURE_CACHE_FOLDER = "data/cache/features/"
 
     def __init__(self) -> None:
         super().__init__()
@@ -0,0 +1,97 @@
+import csv
+import fcntl
+import io
+import json
+import os
+from typing import List, Tuple, Union
+
+from commons.constants import ALL_PATH, INTERESTING_COLUMN
+
+
+def _count_rows(file) -> int:
+    # the records after the header, as read by pandas: an email with a line
+    # break is quoted across lines, and the blank lines are skipped
+    file.seek(0)
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        records = sum(1 for record in csv.reader(text) if record)
+    finally:
+        text.detach()
+    return max(records - 1, 0)
+
+
+def _row_count_path(path: str) -> str:
+    return path + ".rows"
+
+
+def _read_row_count(path: str, stat: os.stat_result) -> Union[int, None]:
+    # the rows recorded by the last append, unless the file changed since
+    try:
+        with open(_row_count_path(path), "r") as file:
+            row_count = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(row_count, dict) or (
+        row_count.get("size"),
+        row_count.get("mtime_ns"),
+    ) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return row_count.get("rows")
+
+
+def _write_row_count(path: str, stat: os.stat_result, rows: int) -> None:
+    tmp_path = f"{_row_count_path(path)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(
+            {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "rows": rows}, file
+        )
+    os.replace(tmp_path, _row_count_path(path))
+
+
+def append_labeled_emails(examples: List[Tuple[str, int]], path: str = None) -> int:
+    """
+    Append labeled emails to the CSV file of the dataset. The rows are only
+    ever appended, so the rows a model was trained on keep their index, and
+    the appends of concurrent processes are serialized by a lock on the file.
+    The number of rows is kept with the size and mtime of the file in
+    `<path>.rows`, and only recounted when it is missing or the CSV was changed
+    by something else than an append.
+
+    Args:
+        examples (List[Tuple[str, int]]): The emails and their label
+        path (str, optional): The CSV file of the dataset. Defaults to ALL_PATH.DATA_POINTS_FILES.
+
+    Returns:
+        int: the number of rows of the dataset after the append
+    """
+    path = path or ALL_PATH.DATA_POINTS_FILES
+    with open(path, "ab+") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            rows = _read_row_count(path, os.fstat(file.fileno()))
+            file.seek(0)
+            header = next(csv.reader([file.readline().decode("utf-8-sig")]), None)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            if not header:
+                header = [INTERESTING_COLUMN.EMAIL_COLUMN, INTERESTING_COLUMN.TARGET]
+                writer.writerow(header)
+            else:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    buffer.write("\n")
+            for email, label in examples:
+                values = {
+                    INTERESTING_COLUMN.EMAIL_COLUMN: email,
+                    INTERESTING_COLUMN.TARGET: label,
+                }
+                writer.writerow([values.get(column, "") for column in header])
+            file.write(buffer.getvalue().encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+            # each example is one record, whatever the line breaks of its email
+            rows = _count_rows(file) if rows is None else rows + len(examples)
+            _write_row_count(path, os.fstat(file.fileno()), rows)
+            return rows
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
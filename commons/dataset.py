@@ -0,0 +1,226 @@
+import hashlib
+import os
+import shutil
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from commons.constants import ALL_PATH, INTERESTING_COLUMN, SEED
+from settings import settings
+
+TEST_SIZE = 0.2
+
+
+@lru_cache(maxsize=16)
+def _hash_file(path: str, mtime_ns: int, size: int) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Get the hash of a file content. It is only recomputed when the
+    modification time or the size of the file changes.
+
+    Args:
+        path (str): The path of the file
+
+    Returns:
+        str: the sha1 of the file content
+    """
+    stat = os.stat(path)
+    return _hash_file(path, stat.st_mtime_ns, stat.st_size)
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    # write then rename, so that concurrent workers never read a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.save(file, array)
+    os.replace(tmp_path, path)
+
+
+class Dataset:
+    """
+    The labeled emails, converted once from the CSV file to `.npy` arrays
+    and memory-mapped
+    """
+
+    def __init__(self, fingerprint: str, emails: np.ndarray, labels: np.ndarray):
+        self.fingerprint = fingerprint
+        self.emails = emails
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def folder(self) -> str:
+        return os.path.join(ALL_PATH.DATASET_CACHE_FOLDER, self.fingerprint)
+
+    def frame(self, indices: np.ndarray = None) -> pd.DataFrame:
+        """
+        Build the DataFrame of some rows of the dataset
+
+        Args:
+            indices (np.ndarray, optional): The rows to select. Defaults to None, selecting all the rows.
+
+        Returns:
+            pd.DataFrame: the email and label columns of the rows
+        """
+        emails, labels = self.emails, self.labels
+        if indices is not None:
+            emails, labels = emails[indices], labels[indices]
+        return pd.DataFrame(
+            {
+                INTERESTING_COLUMN.EMAIL_COLUMN: emails.astype(object),
+                INTERESTING_COLUMN.TARGET: np.asarray(labels),
+            }
+        )
+
+    def split(
+        self, seed: int = SEED, test_size: float = TEST_SIZE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the train/test split indices of the dataset. They are the same as
+        `train_test_split(df, test_size=test_size, random_state=seed)` and are
+        cached on disk and in the process for each (dataset, seed).
+
+        Args:
+            seed (int, optional): The random state of the split. Defaults to SEED.
+            test_size (float, optional): The proportion of the test set. Defaults to TEST_SIZE.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the indices of the train rows and of the test rows
+        """
+        return _split_indices(self.fingerprint, len(self), seed, test_size)
+
+
+@lru_cache(maxsize=32)
+def _split_indices(
+    fingerprint: str, n_rows: int, seed: int, test_size: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    path = os.path.join(
+        ALL_PATH.DATASET_CACHE_FOLDER, fingerprint, f"split_{seed}_{test_size}.npz"
+    )
+    if os.path.exists(path):
+        with np.load(path) as split:
+            return split["train"], split["test"]
+
+    from sklearn.model_selection import train_test_split
+
+    train_indices, test_indices = train_test_split(
+        np.arange(n_rows), test_size=test_size, random_state=seed
+    )
+    # the folder of an evicted dataset is created again
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(file, train=train_indices, test=test_indices)
+    os.replace(tmp_path, path)
+    return train_indices, test_indices
+
+
+def split_rows(
+    start: int, stop: int, seed: int = SEED, test_size: float = TEST_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split the rows `start` to `stop` of a dataset in train and test rows. The
+    rows from 0 are split as by `Dataset.split`, so the rows appended to a
+    dataset can be split in turn without moving the previous rows.
+
+    Args:
+        start (int): The first row
+        stop (int): The row after the last one
+        seed (int, optional): The random state of the split. Defaults to SEED.
+        test_size (float, optional): The proportion of the test rows. Defaults to TEST_SIZE.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the indices of the train rows and of the test rows
+    """
+    rows = np.arange(start, stop)
+    if len(rows) < 2:
+        # too few rows to hold some out
+        return rows, rows[:0]
+
+    from sklearn.model_selection import train_test_split
+
+    train_indices, test_indices = train_test_split(
+        rows, test_size=test_size, random_state=seed
+    )
+    return train_indices, test_indices
+
+
+def evict_stale_datasets(fingerprint: str) -> None:
+    """
+    Delete the cached arrays and features of the datasets other than the
+    DATASET_CACHE_KEEP last used ones (counting the current one). A process
+    still mapping their arrays keeps reading them until it unmaps them.
+
+    Args:
+        fingerprint (str): The fingerprint of the current dataset
+    """
+    folders = [
+        folder
+        for folder in os.listdir(ALL_PATH.DATASET_CACHE_FOLDER)
+        if folder != fingerprint
+        and os.path.isdir(os.path.join(ALL_PATH.DATASET_CACHE_FOLDER, folder))
+    ]
+    folders.sort(
+        key=lambda folder: os.path.getmtime(
+            os.path.join(ALL_PATH.DATASET_CACHE_FOLDER, folder)
+        ),
+        reverse=True,
+    )
+    kept = {fingerprint, *folders[: max(settings.DATASET_CACHE_KEEP - 1, 0)]}
+    for cache_folder in (ALL_PATH.DATASET_CACHE_FOLDER, ALL_PATH.FEATURE_CACHE_FOLDER):
+        if not os.path.isdir(cache_folder):
+            continue
+        for folder in os.listdir(cache_folder):
+            if folder not in kept:
+                shutil.rmtree(os.path.join(cache_folder, folder), ignore_errors=True)
+
+
+@lru_cache(maxsize=4)
+def _load_dataset(path: str, fingerprint: str) -> Dataset:
+    folder = os.path.join(ALL_PATH.DATASET_CACHE_FOLDER, fingerprint)
+    emails_path = os.path.join(folder, "emails.npy")
+    labels_path = os.path.join(folder, "labels.npy")
+    if not (os.path.exists(emails_path) and os.path.exists(labels_path)):
+        os.makedirs(folder, exist_ok=True)
+        df = pd.read_csv(path)
+        _save_array(
+            emails_path, df[INTERESTING_COLUMN.EMAIL_COLUMN].to_numpy(dtype=str)
+        )
+        _save_array(labels_path, df[INTERESTING_COLUMN.TARGET].to_numpy(dtype=np.int64))
+        # each ingestion changes the content, the copies would pile up
+        evict_stale_datasets(fingerprint)
+    else:
+        # the last use of the content, the most recent ones are not evicted
+        os.utime(folder)
+    return Dataset(
+        fingerprint,
+        np.load(emails_path, mmap_mode="r"),
+        np.load(labels_path, mmap_mode="r"),
+    )
+
+
+def load_dataset(path: str = None) -> Dataset:
+    """
+    Load the labeled emails. The CSV file is only parsed the first time a
+    given content is seen, then the memory-mapped arrays are reused,
+    across the tasks of a worker process and across processes.
+
+    Args:
+        path (str, optional): The CSV file of the dataset. Defaults to ALL_PATH.DATA_POINTS_FILES.
+
+    Returns:
+        Dataset: the dataset
+    """
+    path = path or ALL_PATH.DATA_POINTS_FILES
+    return _load_dataset(path, file_fingerprint(path))
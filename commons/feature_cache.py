@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import shutil
+from functools import lru_cache
+from typing import Tuple
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction.text import (
+    HashingVectorizer,
+    TfidfTransformer,
+    TfidfVectorizer,
+)
+from sklearn.pipeline import Pipeline
+
+from commons.constants import ALL_PATH, INTERESTING_COLUMN
+from commons.dataset import Dataset
+from commons.model_data_class import VectorizerTypes
+from settings import settings
+
+# the parameters of the tf-idf reweighting, the others go to the hashing vectorizer
+TF_IDF_TRANSFORMER_PARAMS = ("norm", "use_idf", "smooth_idf", "sublinear_tf")
+# the parameters pruning the vocabulary, meaningless without a vocabulary
+VOCABULARY_PARAMS = ("max_df", "min_df", "max_features", "vocabulary")
+
+
+def normalize_tf_idf_params(tf_idf_params: dict) -> dict:
+    """
+    Put the tf-idf parameters in the form expected by the vectorizer
+    (JSON gives the ngram range as a list)
+
+    Args:
+        tf_idf_params (dict): The parameters of the tf-idf vectorizer
+
+    Returns:
+        dict: a copy of the parameters, with the ngram range as a tuple
+    """
+    tf_idf_params = dict(tf_idf_params)
+    if "ngram_range" in tf_idf_params:
+        tf_idf_params["ngram_range"] = tuple(tf_idf_params["ngram_range"])
+    return tf_idf_params
+
+
+def resolve_tf_idf_params(
+    tf_idf_params: dict, vectorizer: str = VectorizerTypes.TfIdf
+) -> dict:
+    """
+    Put the tf-idf parameters in the form expected by the vectorizer, with the
+    defaults read from the settings made explicit (the hashed `n_features`),
+    so that they identify the features whatever the settings
+
+    Args:
+        tf_idf_params (dict): The parameters of the tf-idf vectorizer
+        vectorizer (str, optional): One of VectorizerTypes. Defaults to the tf-idf vectorizer.
+
+    Returns:
+        dict: a copy of the parameters, normalized and resolved
+    """
+    tf_idf_params = normalize_tf_idf_params(tf_idf_params)
+    if VectorizerTypes(vectorizer) == VectorizerTypes.Hashing:
+        tf_idf_params.setdefault("n_features", settings.HASHING_N_FEATURES)
+    return tf_idf_params
+
+
+def _hashing_steps(tf_idf_params: dict) -> list:
+    # the counts are hashed into `n_features` columns and reweighted by the
+    # idf fitted on them
+    hashing_params = {
+        key: value
+        for key, value in resolve_tf_idf_params(
+            tf_idf_params, VectorizerTypes.Hashing
+        ).items()
+        if key not in TF_IDF_TRANSFORMER_PARAMS + VOCABULARY_PARAMS
+    }
+    transformer_params = {
+        key: value
+        for key, value in tf_idf_params.items()
+        if key in TF_IDF_TRANSFORMER_PARAMS
+    }
+    return [
+        (
+            "hashing_vectorizer",
+            HashingVectorizer(alternate_sign=False, norm=None, **hashing_params),
+        ),
+        ("tf_idf_transformer", TfidfTransformer(**transformer_params)),
+    ]
+
+
+def build_preprocessing(
+    tf_idf_params: dict, vectorizer: str = VectorizerTypes.TfIdf
+) -> ColumnTransformer:
+    """
+    Build the (unfitted) preprocessing step of the pipeline
+
+    Args:
+        tf_idf_params (dict): The parameters of the tf-idf vectorizer
+        vectorizer (str, optional): One of VectorizerTypes. Defaults to the tf-idf vectorizer.
+
+    Returns:
+        ColumnTransformer: the transformer of the email column
+    """
+    tf_idf_params = normalize_tf_idf_params(tf_idf_params)
+    if VectorizerTypes(vectorizer) == VectorizerTypes.Hashing:
+        tf_idf_transformer = Pipeline(_hashing_steps(tf_idf_params))
+    else:
+        tf_idf_transformer = Pipeline(
+            [("tf_idf_vectorizer", TfidfVectorizer(**tf_idf_params))]
+        )
+    return ColumnTransformer(
+        [("email_transformer", tf_idf_transformer, INTERESTING_COLUMN.EMAIL_COLUMN)]
+    )
+
+
+def features_key(
+    dataset: Dataset,
+    tf_idf_params: dict,
+    train_indices: np.ndarray,
+    vectorizer: str = VectorizerTypes.TfIdf,
+) -> str:
+    """
+    Key of the features computed with some vectorizer parameters on a split of a dataset
+
+    Args:
+        dataset (Dataset): The dataset
+        tf_idf_params (dict): The parameters of the tf-idf vectorizer
+        train_indices (np.ndarray): The rows the vectorizer is fitted on
+        vectorizer (str, optional): One of VectorizerTypes. Defaults to the tf-idf vectorizer.
+
+    Returns:
+        str: the key of the features in the cache
+    """
+    sha1 = hashlib.sha1(dataset.fingerprint.encode())
+    sha1.update(
+        json.dumps(
+            resolve_tf_idf_params(tf_idf_params, vectorizer),
+            sort_keys=True,
+            default=list,
+        ).encode()
+    )
+    sha1.update(np.ascontiguousarray(train_indices, dtype=np.int64).tobytes())
+    if VectorizerTypes(vectorizer) != VectorizerTypes.TfIdf:
+        # the keys of the tf-idf features are those cached before the hashing was added
+        sha1.update(VectorizerTypes(vectorizer).value.encode())
+    return sha1.hexdigest()
+
+
+@lru_cache(maxsize=8)
+def _load_features(
+    folder: str,
+) -> Tuple[ColumnTransformer, sparse.csr_matrix, sparse.csr_matrix]:
+    return (
+        joblib.load(os.path.join(folder, "preprocessing.joblib")),
+        sparse.load_npz(os.path.join(folder, "X_train.npz")),
+        sparse.load_npz(os.path.join(folder, "X_test.npz")),
+    )
+
+
+def get_features(
+    dataset: Dataset,
+    tf_idf_params: dict,
+    train_indices: np.ndarray,
+    test_indices: np.ndarray,
+    vectorizer: str = VectorizerTypes.TfIdf,
+) -> Tuple[ColumnTransformer, sparse.csr_matrix, sparse.csr_matrix]:
+    """
+    Get the fitted preprocessing step and the tf-idf matrices of the train and
+    test rows. They are computed once per (dataset, vectorizer parameters, split)
+    and then read from the cache on disk.
+
+    Args:
+        dataset (Dataset): The dataset
+        tf_idf_params (dict): The parameters of the tf-idf vectorizer
+        train_indices (np.ndarray): The rows the vectorizer is fitted on
+        test_indices (np.ndarray): The rows only transformed
+        vectorizer (str, optional): One of VectorizerTypes. Defaults to the tf-idf vectorizer.
+
+    Returns:
+        Tuple[ColumnTransformer, sparse.csr_matrix, sparse.csr_matrix]: the fitted preprocessing, the train and test matrices
+    """
+    # grouped by dataset, to be evicted with it (see `evict_stale_datasets`)
+    folder = os.path.join(
+        ALL_PATH.FEATURE_CACHE_FOLDER,
+        dataset.fingerprint,
+        features_key(dataset, tf_idf_params, train_indices, vectorizer),
+    )
+    if settings.FEATURE_CACHE and os.path.exists(os.path.join(folder, "X_test.npz")):
+        return _load_features(folder)
+
+    preprocessing = build_preprocessing(tf_idf_params, vectorizer)
+    X_train = preprocessing.fit_transform(dataset.frame(train_indices)).tocsr()
+    X_test = preprocessing.transform(dataset.frame(test_indices)).tocsr()
+    if not settings.FEATURE_CACHE:
+        return preprocessing, X_train, X_test
+
+    # written in a temporary folder then renamed, so that a reader never sees a partial entry
+    tmp_folder = f"{folder}.{os.getpid()}.tmp"
+    os.makedirs(tmp_folder, exist_ok=True)
+    joblib.dump(preprocessing, os.path.join(tmp_folder, "preprocessing.joblib"))
+    sparse.save_npz(os.path.join(tmp_folder, "X_train.npz"), X_train, compressed=False)
+    sparse.save_npz(os.path.join(tmp_folder, "X_test.npz"), X_test, compressed=False)
+    try:
+        os.rename(tmp_folder, folder)
+    except OSError:
+        # another process cached the same features in the meantime
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+    return preprocessing, X_train, X_test
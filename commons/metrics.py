@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# the scoring stages of a chunk of emails take from microseconds to a second
+FAST_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# a training takes from seconds to an hour
+SLOW_BUCKETS = (
+    0.1,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+    1800.0,
+    3600.0,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "email_fraud_http_request_seconds",
+    "Latency of the API requests",
+    ["method", "route", "status"],
+    buckets=FAST_BUCKETS,
+)
+TASK_STAGE_SECONDS = Histogram(
+    "email_fraud_task_stage_seconds",
+    "Seconds spent by the Celery tasks in the broker enqueue, the queue, "
+    "the run and the result backend write",
+    ["task", "stage"],
+    buckets=FAST_BUCKETS + SLOW_BUCKETS[-7:],
+)
+SCORING_STAGE_SECONDS = Histogram(
+    "email_fraud_scoring_stage_seconds",
+    "Seconds spent in each stage of the scoring of the emails",
+    ["stage"],
+    buckets=FAST_BUCKETS,
+)
+TRAINING_STAGE_SECONDS = Histogram(
+    "email_fraud_training_stage_seconds",
+    "Seconds spent in each stage of the training of a model",
+    ["stage"],
+    buckets=SLOW_BUCKETS,
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "email_fraud_model_load_seconds",
+    "Seconds to load a model, per artifact format",
+    ["format"],
+    buckets=FAST_BUCKETS,
+)
+
+# end of the body of the task run by the current thread, to time the result write
+_task_timing = threading.local()
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """
+    Observe the duration of the block in a histogram
+
+    Args:
+        histogram (Histogram): The histogram
+        **labels: The label values of the observation
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def instrumented_task(function: Callable) -> Callable:
+    """
+    Decorate the function of a Celery task, to observe its run time and to
+    time the write of its result (see `observe_result_write`)
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with timed(TASK_STAGE_SECONDS, task=function.__name__, stage="run"):
+            result = function(*args, **kwargs)
+        _task_timing.body_end = time.perf_counter()
+        return result
+
+    return wrapper
+
+
+def observe_queue_wait(task_name: str, sent_at: float) -> None:
+    """
+    Observe the time a task waited in the broker, from the publish timestamp
+    of its message (clocks of the hosts are assumed in sync)
+    """
+    TASK_STAGE_SECONDS.labels(task=task_name, stage="queue_wait").observe(
+        max(time.time() - sent_at, 0.0)
+    )
+
+
+def observe_result_write(task_name: str) -> None:
+    """
+    Observe the time between the end of the body of the task and the
+    success signal, sent once the result is stored by the backend
+    """
+    body_end = getattr(_task_timing, "body_end", None)
+    if body_end is None:
+        return
+    _task_timing.body_end = None
+    TASK_STAGE_SECONDS.labels(task=task_name, stage="result_write").observe(
+        time.perf_counter() - body_end
+    )
+
+
+class GaugeCollector:
+    """
+    Collect a gauge computed at scrape time, one sample per key of the dict
+    returned by `function`
+    """
+
+    def __init__(
+        self, name: str, documentation: str, label: str, function: Callable
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.function = function
+
+    def collect(self):
+        gauge = GaugeMetricFamily(self.name, self.documentation, labels=[self.label])
+        values: Dict[str, float] = self.function()
+        for key, value in values.items():
+            gauge.add_metric([key], value)
+        yield gauge
+
+
+def get_metrics_registry() -> CollectorRegistry:
+    """
+    Get the registry to expose: the metrics of all the processes writing to
+    PROMETHEUS_MULTIPROC_DIR if it is set (prefork workers, gunicorn), those
+    of the current process otherwise
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def generate_metrics(*collectors) -> bytes:
+    """
+    Render the metrics in the Prometheus text format, followed by those of
+    the collectors computed at scrape time
+
+    Returns:
+        bytes: the metrics, of content type CONTENT_TYPE_LATEST
+    """
+    output = generate_latest(get_metrics_registry())
+    if collectors:
+        registry = CollectorRegistry()
+        for collector in collectors:
+            registry.register(collector)
+        output += generate_latest(registry)
+    return output
+
+
+def start_metrics_server(port: int) -> bool:
+    """
+    Export the metrics of the workers of the host on a HTTP port. With
+    PROMETHEUS_MULTIPROC_DIR, the first worker of the host exports the
+    metrics of all of them, the port is already bound for the others.
+
+    Args:
+        port (int): The port
+
+    Returns:
+        bool: True if the exporter was started
+    """
+    try:
+        start_http_server(port, registry=get_metrics_registry())
+    except OSError as e:
+        print(f"Metrics exporter not started on port {port}: {e}")
+        return False
+    return True
@@ -0,0 +1,146 @@
+import time
+from bisect import bisect_left
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Lock, Thread
+from typing import Callable, List, Tuple
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+QUEUE_DELAY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250]
+
+
+class Histogram:
+    """
+    Histogram with fixed bucket upper bounds. Each observation is counted
+    once, in the first bucket whose upper bound is greater or equal to it.
+    """
+
+    def __init__(self, buckets: List[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def dict(self) -> dict:
+        labels = [str(bucket) for bucket in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesce single email predictions submitted concurrently into one call of
+    `predict_batch`. A batch is dispatched as soon as it holds `max_batch_size`
+    emails or when its oldest email has waited `max_wait_ms`.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[str]], Tuple[str, List[float]]],
+        max_batch_size: int,
+        max_wait_ms: float,
+    ) -> None:
+        """
+        Args:
+            predict_batch (Callable): scores a list of emails, returns the model id and the probabilities
+            max_batch_size (int): the maximum number of emails per batch
+            max_wait_ms (float): the maximum time an email waits for its batch to be dispatched
+        """
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = Queue()
+        self._stats_lock = Lock()
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delays_ms = Histogram(QUEUE_DELAY_BUCKETS_MS)
+        self.errors = 0
+        self._thread = Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, email: str) -> Future:
+        """
+        Queue an email to be scored in the next batch
+
+        Args:
+            email (str): The email to score
+
+        Returns:
+            Future: resolved with the prediction of the email
+        """
+        future = Future()
+        self._queue.put((email, future, time.perf_counter()))
+        return future
+
+    def predict(self, email: str, timeout: float = None) -> dict:
+        """
+        Score an email through the micro-batching queue and wait for its prediction
+        """
+        return self.submit(email).result(timeout=timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # the window is over, only take what is already queued
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            dispatch_time = time.perf_counter()
+            with self._stats_lock:
+                self.batch_sizes.observe(len(batch))
+                for _, _, enqueue_time in batch:
+                    self.queue_delays_ms.observe((dispatch_time - enqueue_time) * 1000)
+
+            emails = [email for email, _, _ in batch]
+            try:
+                model_id, probas = self.predict_batch(emails)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (email, future, _), proba in zip(batch, probas):
+                future.set_result(
+                    {"proba": proba, "email": email, "model_id": model_id}
+                )
+
+    def stats(self) -> dict:
+        """
+        Get the metrics of the micro-batching layer
+
+        Returns:
+            dict: the batch size distribution, the queueing delay distribution (in ms) and the settings
+        """
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "pending": self._queue.qsize(),
+                "errors": self.errors,
+                "batch_size": self.batch_sizes.dict(),
+                "queue_delay_ms": self.queue_delays_ms.dict(),
+            }
@@ -1,6 +1,10 @@
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, confloat, conint, constr, validator
 from enum import Enum
 
+from settings import settings
+
 
 class ModelMetaData(BaseModel):
     id: str
@@ -9,6 +13,13 @@ class ModelMetaData(BaseModel):
     train_date: str
     serving: bool
     params: dict
+    # the model updated into this one, and the rows of the dataset it has seen
+    parent_id: Optional[str] = None
+    dataset_rows: Optional[int] = None
+    # the iterations of the fit, its validation scores and why it stopped early
+    training: Optional[dict] = None
+    # the cross-validated metrics and the scoring latency, see EvaluationInput
+    evaluation: Optional[dict] = None
 
 
 class ModelTypes(str, Enum):
@@ -17,15 +28,172 @@ class ModelTypes(str, Enum):
     """
 
     GradientBoosting = "GradientBoosting"
+    HistGradientBoosting = "HistGradientBoosting"
+    SGD = "SGD"
+    LogisticRegression = "LogisticRegression"
+
+
+class VectorizerTypes(str, Enum):
+    """
+    Enum for the ways of turning the emails into char n-gram features.
+    """
+
+    TfIdf = "tfidf"
+    Hashing = "hashing"
+
+
+def check_model_features(model_type: str, vectorizer: str, tf_idf_params: dict) -> None:
+    """
+    Check that the training matrix of a model fits in memory: the histogram-based
+    boosting densifies it, so its columns are capped by HIST_GRADIENT_BOOSTING_MAX_FEATURES
+
+    Args:
+        model_type (str): The type of the model, one of ModelTypes
+        vectorizer (str): One of VectorizerTypes
+        tf_idf_params (dict): The parameters of the vectorizer
+
+    Raises:
+        ValueError: if the model would densify too many columns
+    """
+    if ModelTypes(model_type) != ModelTypes.HistGradientBoosting:
+        return
+    if VectorizerTypes(vectorizer) == VectorizerTypes.Hashing:
+        key = "n_features"
+        n_features = tf_idf_params.get(key, settings.HASHING_N_FEATURES)
+    elif tf_idf_params.get("vocabulary") is not None:
+        key, n_features = "vocabulary", len(tf_idf_params["vocabulary"])
+    else:
+        key, n_features = "max_features", tf_idf_params.get("max_features")
+    if n_features is None or n_features > settings.HIST_GRADIENT_BOOSTING_MAX_FEATURES:
+        raise ValueError(
+            f"A {ModelTypes.HistGradientBoosting.value} model densifies its features, "
+            f"'{key}' must be at most {settings.HIST_GRADIENT_BOOSTING_MAX_FEATURES} "
+            f"(got {n_features})"
+        )
+
+
+def check_training_options(model_type: str, training_options: dict) -> None:
+    """
+    Check that a model supports its training options: only the boosting models
+    are fitted under a time budget, and the logistic regression can not stop early
+
+    Args:
+        model_type (str): The type of the model, one of ModelTypes
+        training_options (dict): The options of the fit, see TrainingOptions
+
+    Raises:
+        ValueError: if the model does not support one of the options
+    """
+    model_type = ModelTypes(model_type)
+    if training_options.get("early_stopping") and model_type not in (
+        ModelTypes.GradientBoosting,
+        ModelTypes.HistGradientBoosting,
+        ModelTypes.SGD,
+    ):
+        raise ValueError(f"A {model_type.value} model can not stop early")
+    if training_options.get("max_seconds") and model_type not in (
+        ModelTypes.GradientBoosting,
+        ModelTypes.HistGradientBoosting,
+    ):
+        raise ValueError(f"A time budget can not be set on a {model_type.value} model")
 
 
 class ModelParams(BaseModel):
 
     model_params: dict
     tf_idf_params: dict
+    vectorizer: VectorizerTypes = VectorizerTypes.TfIdf
+
+
+class TrainingOptions(BaseModel):
+    early_stopping: bool = False
+    validation_fraction: confloat(gt=0, lt=1) = 0.1
+    n_iter_no_change: conint(gt=0) = 10
+    max_iterations: Optional[conint(gt=0)] = None
+    max_seconds: Optional[confloat(gt=0)] = None
 
 
 class ModelInput(BaseModel):
     name: str
     model_type: ModelTypes
     model_params: ModelParams
+    training_options: TrainingOptions = TrainingOptions()
+
+    @validator("model_params")
+    def check_features(cls, model_params: ModelParams, values: dict) -> ModelParams:
+        if "model_type" in values:
+            check_model_features(
+                values["model_type"],
+                model_params.vectorizer,
+                model_params.tf_idf_params,
+            )
+        return model_params
+
+    @validator("training_options")
+    def check_options(
+        cls, training_options: TrainingOptions, values: dict
+    ) -> TrainingOptions:
+        if "model_type" in values:
+            check_training_options(values["model_type"], training_options.dict())
+        return training_options
+
+
+class LabeledEmail(BaseModel):
+    email: constr(min_length=1)
+    label: conint(ge=0, le=1)
+
+
+class LabeledEmailsInput(BaseModel):
+    examples: List[LabeledEmail]
+
+
+class ModelUpdateInput(BaseModel):
+    name: str
+    n_epochs: conint(gt=0) = 1
+
+
+class EvaluationInput(BaseModel):
+    n_folds: conint(ge=2, le=20) = 5
+    n_jobs: Optional[int] = None
+
+
+class EmailBatchInput(BaseModel):
+    emails: List[str]
+    chunk_size: Optional[conint(gt=0)] = None
+
+
+class SearchTypes(str, Enum):
+    """
+    Enum for the ways of exploring the parameters of a sweep.
+    """
+
+    Grid = "grid"
+    Random = "random"
+
+
+class SweepInput(BaseModel):
+    name: str
+    model_type: ModelTypes
+    search: SearchTypes = SearchTypes.Grid
+    n_iter: conint(gt=0) = 10
+    model_params: Dict[str, list]
+    tf_idf_params: Dict[str, list]
+    vectorizer: VectorizerTypes = VectorizerTypes.TfIdf
+    n_jobs: Optional[int] = None
+
+    @validator("vectorizer", always=True)
+    def check_features(
+        cls, vectorizer: VectorizerTypes, values: dict
+    ) -> VectorizerTypes:
+        if "model_type" in values and "tf_idf_params" in values:
+            key = (
+                "n_features"
+                if vectorizer == VectorizerTypes.Hashing
+                else "max_features"
+            )
+            # the values of the parameter bounding the columns, or its default
+            for tf_idf_params in [
+                {key: value} for value in values["tf_idf_params"].get(key, [])
+            ] or [{}]:
+                check_model_features(values["model_type"], vectorizer, tf_idf_params)
+        return vectorizer
@@ -0,0 +1,176 @@
+import os
+import socket
+import time
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+from commons.model_registry import get_model_registry
+from commons.model_training import load_model
+from commons.prediction_cache import invalidate_prediction_cache
+from memory import Memory
+from settings import settings
+
+memory = Memory.getInstance()
+
+_deployer_lock = Lock()
+
+
+class ModelDeployer:
+    """
+    Keep the model deployed in the current process in sync with the serving
+    model of the registry. A background thread polls the registry version
+    (or is woken up by a deployment broadcast), loads the new model while the
+    old one keeps serving, then swaps the reference atomically.
+    """
+
+    def __init__(self, role: str, poll_interval: float, heartbeat_interval: float):
+        self.role = role
+        self.hostname = socket.gethostname()
+        self.pid = os.getpid()
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.status = "starting"
+        self.error = None
+        self._seen_version = None
+        self._last_report = 0.0
+        self._sync_lock = Lock()
+        self._wake = Event()
+        self._ready = Event()
+        self._thread = None
+
+    @property
+    def process_id(self) -> str:
+        return f"{self.hostname}:{self.pid}"
+
+    def start(self) -> "ModelDeployer":
+        """
+        Start the background thread of the deployer, if not already running
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = Thread(target=self._run, name="model-deployer", daemon=True)
+            self._thread.start()
+        return self
+
+    def refresh(self) -> None:
+        """
+        Wake the background thread up to check the registry right away
+        """
+        self._wake.set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """
+        Wait for a first model to be deployed in the process
+
+        Returns:
+            bool: True if a model is deployed
+        """
+        return self._ready.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                self._report("failed", error=str(e))
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def sync(self) -> None:
+        """
+        Deploy the serving model of the registry in the process if it changed
+        """
+        with self._sync_lock:
+            registry = get_model_registry()
+            version = registry.version()
+            if version != self._seen_version:
+                serving_id = registry.serving_id()
+                if serving_id is not None and serving_id != memory.deployment[0]:
+                    self._report("loading", model_id=serving_id)
+                    # the previous model keeps serving while the new one loads
+                    model = load_model(serving_id)
+                    memory.swap_model(serving_id, model)
+                    invalidate_prediction_cache(keep_model_id=serving_id)
+                self._seen_version = version
+
+            if memory.deployment[1] is not None:
+                self._ready.set()
+                if self.status != "ready" or self._heartbeat_due():
+                    self._report("ready")
+            elif self.status != "no_model" or self._heartbeat_due():
+                self._report("no_model")
+
+    def _heartbeat_due(self) -> bool:
+        return time.monotonic() - self._last_report > self.heartbeat_interval
+
+    def _report(self, status: str, model_id: str = None, error: str = None) -> None:
+        self.status = status
+        self.error = error
+        self._last_report = time.monotonic()
+        get_model_registry().report_deployment(
+            {
+                "process_id": self.process_id,
+                "role": self.role,
+                "hostname": self.hostname,
+                "pid": self.pid,
+                "status": status,
+                "model_id": model_id or memory.deployment[0],
+                "error": error,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            }
+        )
+
+
+def get_model_deployer() -> ModelDeployer:
+    """
+    Get the model deployer of the current process, created and started on first use
+
+    Returns:
+        ModelDeployer: the deployer of the process
+    """
+    deployer = memory.model_deployer
+    # a forked process does not inherit the thread of its parent
+    if deployer is None or deployer.pid != os.getpid():
+        with _deployer_lock:
+            deployer = memory.model_deployer
+            if deployer is None or deployer.pid != os.getpid():
+                deployer = ModelDeployer(
+                    role=memory.process_role,
+                    poll_interval=settings.DEPLOY_POLL_INTERVAL,
+                    heartbeat_interval=settings.DEPLOY_HEARTBEAT_INTERVAL,
+                ).start()
+                memory.model_deployer = deployer
+    return deployer
+
+
+def deploy_model(model_id: str) -> None:
+    """
+    Make a model the serving model. Every process loads it in the background
+    and swaps it in on its next registry check, without interrupting predictions.
+
+    Args:
+        model_id (str): The id of the model to deploy
+    """
+    get_model_registry().set_serving(model_id)
+    if memory.model_deployer is not None and memory.model_deployer.pid == os.getpid():
+        memory.model_deployer.refresh()
+
+
+def get_deployment_status() -> dict:
+    """
+    Get the deployment status of every process reporting to the registry
+
+    Returns:
+        dict: the serving model of the registry and the model deployed by each process
+    """
+    registry = get_model_registry()
+    serving_id = registry.serving_id()
+    now = datetime.now()
+    processes = []
+    for deployment in registry.deployments():
+        age = (now - datetime.fromisoformat(deployment["updated_at"])).total_seconds()
+        deployment["up_to_date"] = (
+            deployment["status"] == "ready" and deployment["model_id"] == serving_id
+        )
+        deployment["stale"] = age > 3 * settings.DEPLOY_HEARTBEAT_INTERVAL
+        processes.append(deployment)
+    return {"serving_model_id": serving_id, "processes": processes}
@@ -0,0 +1,222 @@
+import os
+import statistics
+import time
+from typing import List
+
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import brier_score_loss, log_loss, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+from commons.constants import ALL_PATH, SEED
+from commons.dataset import load_dataset
+from commons.feature_cache import get_features
+from commons.model_data_class import VectorizerTypes
+from commons.model_registry import get_model_registry
+from commons.model_serving import predict_emails_proba
+from commons.model_training import (
+    fit_model,
+    get_model_meta_data,
+    load_model,
+    training_threads,
+)
+from settings import settings
+
+# the thresholds of the precision and recall, on the probability of the label 1
+THRESHOLDS = (0.1, 0.25, 0.5, 0.75, 0.9)
+CALIBRATION_BINS = 10
+# the single emails scored to measure the latency, and the size of a batch
+LATENCY_RUNS = 200
+LATENCY_BATCH_SIZE = 1000
+
+
+def _unfitted_copy(model):
+    # a copy to refit on each fold, with the iterations of the fitted boosting
+    # (cut short by an early stopping or a budget)
+    copy = clone(model)
+    classifier = copy.steps[-1][1] if hasattr(copy, "steps") else copy
+    fitted = model.steps[-1][1] if hasattr(model, "steps") else model
+    if hasattr(fitted, "n_estimators_"):
+        classifier.set_params(n_estimators=fitted.n_estimators_)
+    elif hasattr(fitted, "_predictors"):
+        classifier.set_params(max_iter=fitted.n_iter_, early_stopping=False)
+    return copy
+
+
+def _evaluate_fold(
+    classifier,
+    tf_idf_params: dict,
+    vectorizer: str,
+    train_indices: np.ndarray,
+    test_indices: np.ndarray,
+    n_threads: int,
+):
+    # the features of the fold are read from the cache when they were computed before
+    dataset = load_dataset()
+    _, X_train, X_test = get_features(
+        dataset, tf_idf_params, train_indices, test_indices, vectorizer
+    )
+    start = time.perf_counter()
+    fit_model(classifier, X_train, dataset.labels[train_indices], n_threads)
+    fit_time = time.perf_counter() - start
+    return classifier.predict_proba(X_test)[:, 1], fit_time
+
+
+def classification_report(y: np.ndarray, y_score: np.ndarray) -> dict:
+    """
+    Compute the quality metrics of the predicted probabilities of the label 1
+
+    Args:
+        y (np.ndarray): The labels
+        y_score (np.ndarray): The predicted probabilities of the label 1
+
+    Returns:
+        dict: the ROC-AUC, the accuracy, log loss and Brier score, the precision
+        and recall at THRESHOLDS, and the calibration by bins of probability
+    """
+    report = {
+        "roc_auc": float(roc_auc_score(y, y_score)),
+        "accuracy": float(np.mean((y_score > 0.5) == y)),
+        "log_loss": float(log_loss(y, y_score, labels=[0, 1])),
+        "brier_score": float(brier_score_loss(y, y_score)),
+        "thresholds": [],
+    }
+    for threshold in THRESHOLDS:
+        predicted = y_score >= threshold
+        true_positives = int(np.sum(predicted & (y == 1)))
+        report["thresholds"].append(
+            {
+                "threshold": threshold,
+                "precision": true_positives / max(int(predicted.sum()), 1),
+                "recall": true_positives / max(int(np.sum(y == 1)), 1),
+            }
+        )
+
+    # the mean probability and the fraction of labels 1 of each non-empty bin
+    bins = np.minimum((y_score * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    counts = np.bincount(bins, minlength=CALIBRATION_BINS)
+    mean_predicted = np.bincount(bins, y_score, CALIBRATION_BINS) / np.maximum(
+        counts, 1
+    )
+    fraction_positive = np.bincount(bins, y, CALIBRATION_BINS) / np.maximum(counts, 1)
+    filled = counts > 0
+    report["calibration"] = {
+        "count": counts[filled].tolist(),
+        "mean_predicted": mean_predicted[filled].tolist(),
+        "fraction_positive": fraction_positive[filled].tolist(),
+        "expected_calibration_error": float(
+            np.sum(counts * np.abs(fraction_positive - mean_predicted)) / len(y)
+        ),
+    }
+    return report
+
+
+def scoring_latency(model_id: str, emails: List[str]) -> dict:
+    """
+    Measure the scoring latency of a model loaded as it is served (its
+    compiled engine if settings.COMPILED_SCORING)
+
+    Args:
+        model_id (str): The id of the model
+        emails (List[str]): The emails to score
+
+    Returns:
+        dict: the engine, the percentiles of the latency of a single email,
+        and the time per email of a batch
+    """
+    model = load_model(model_id)
+    predict_emails_proba(model, emails[:1], 1)
+
+    single = []
+    for email in emails[:LATENCY_RUNS]:
+        start = time.perf_counter()
+        predict_emails_proba(model, [email], 1)
+        single.append(time.perf_counter() - start)
+    single.sort()
+
+    batch = (emails * (LATENCY_BATCH_SIZE // len(emails) + 1))[:LATENCY_BATCH_SIZE]
+    durations = []
+    for _ in range(3):
+        start = time.perf_counter()
+        predict_emails_proba(model, batch, LATENCY_BATCH_SIZE)
+        durations.append(time.perf_counter() - start)
+
+    return {
+        "engine": type(model).__name__,
+        "single_p50_ms": statistics.median(single) * 1000,
+        "single_p99_ms": single[max(int(len(single) * 0.99) - 1, 0)] * 1000,
+        "batch_per_email_us": statistics.median(durations) / LATENCY_BATCH_SIZE * 1e6,
+    }
+
+
+def evaluate_model(model_id: str, evaluation_input: dict) -> dict:
+    """
+    Evaluate a registered model by a stratified k-fold cross-validation on
+    the dataset, and store the report in its meta data (`evaluation`). The
+    folds are featurized and fitted in parallel on a process pool, and their
+    features are cached like those of a training.
+
+    Args:
+        model_id (str): The id of the model
+        evaluation_input (dict): The evaluation, as an EvaluationInput dict
+
+    Returns:
+        dict: the report, the metrics of the out-of-fold predictions with the
+        ROC-AUC and fit time of each fold, and the scoring latency
+    """
+    model_meta_data = get_model_meta_data(model_id)
+    if model_meta_data is None:
+        raise Exception(f"Model '{model_id}' not found")
+    params = model_meta_data["params"]
+    vectorizer = params.get("vectorizer", VectorizerTypes.TfIdf)
+    classifier = _unfitted_copy(
+        joblib.load(ALL_PATH.MODELS_FOLDER + model_id + ".joblib").named_steps["model"]
+    )
+
+    dataset = load_dataset()
+    n_folds = evaluation_input["n_folds"]
+    folds = list(
+        StratifiedKFold(n_folds, shuffle=True, random_state=SEED).split(
+            np.zeros(len(dataset)), dataset.labels
+        )
+    )
+    n_jobs = evaluation_input.get("n_jobs") or settings.EVALUATION_N_JOBS
+    # the cores of the training worker are shared between the parallel fits
+    n_threads = training_threads(
+        min(n_folds, os.cpu_count() or 1) if n_jobs < 0 else min(n_folds, n_jobs)
+    )
+    results = Parallel(n_jobs=n_jobs, backend="loky")(
+        delayed(_evaluate_fold)(
+            clone(classifier),
+            params["tf_idf_params"],
+            vectorizer,
+            train_indices,
+            test_indices,
+            n_threads,
+        )
+        for train_indices, test_indices in folds
+    )
+
+    y_score = np.zeros(len(dataset))
+    for (_, test_indices), (fold_score, _) in zip(folds, results):
+        y_score[test_indices] = fold_score
+    labels = np.asarray(dataset.labels)
+    fold_auc = [
+        float(roc_auc_score(labels[test_indices], fold_score))
+        for (_, test_indices), (fold_score, _) in zip(folds, results)
+    ]
+    evaluation = {
+        "n_folds": n_folds,
+        "dataset_rows": len(dataset),
+        **classification_report(labels, y_score),
+        "roc_auc_folds": fold_auc,
+        "roc_auc_std": float(np.std(fold_auc)),
+        "fit_seconds_folds": [fit_time for _, fit_time in results],
+        "latency": scoring_latency(
+            model_id, dataset.emails[:LATENCY_RUNS].astype(object).tolist()
+        ),
+    }
+    get_model_registry().update(model_id, {"evaluation": evaluation})
+    return evaluation
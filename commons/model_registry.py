@@ -0,0 +1,331 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, List, Union
+
+from commons.constants import ALL_PATH
+from commons.mongo_utils import get_mongo_database
+from memory import Memory
+from settings import settings
+
+memory = Memory.getInstance()
+
+_registry_lock = threading.Lock()
+
+
+class SQLiteModelRegistry:
+    """
+    Model registry stored in a local SQLite database. Each model is one row
+    keyed on its id, with indexes on `serving` and `train_date`. Writes are
+    transactions, so that concurrent worker processes never lose an update.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS models (
+                    id TEXT PRIMARY KEY,
+                    serving INTEGER NOT NULL DEFAULT 0,
+                    train_date TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS models_serving ON models (serving);
+                CREATE INDEX IF NOT EXISTS models_train_date ON models (train_date);
+                CREATE TABLE IF NOT EXISTS registry_version (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    version INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO registry_version (id, version) VALUES (0, 0);
+                CREATE TABLE IF NOT EXISTS deployments (
+                    process_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread, re-opened in forked processes
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    @staticmethod
+    def _document(row: tuple) -> dict:
+        document = json.loads(row[1])
+        document["serving"] = bool(row[0])
+        return document
+
+    def _write(self, statements: list, bump_version: bool = True) -> None:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for statement, parameters in statements:
+                connection.execute(statement, parameters)
+            if bump_version:
+                connection.execute(
+                    "UPDATE registry_version SET version = version + 1 WHERE id = 0"
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def all(self) -> Dict[str, dict]:
+        rows = self._connection().execute(
+            "SELECT id, serving, data FROM models ORDER BY rowid"
+        )
+        return {row[0]: self._document(row[1:]) for row in rows}
+
+    def get(self, id: str) -> Union[dict, None]:
+        row = (
+            self._connection()
+            .execute("SELECT serving, data FROM models WHERE id = ?", (id,))
+            .fetchone()
+        )
+        return None if row is None else self._document(row)
+
+    def upsert(self, document: dict) -> None:
+        data = {key: value for key, value in document.items() if key != "serving"}
+        self._write(
+            [
+                (
+                    "INSERT INTO models (id, serving, train_date, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET serving = excluded.serving, "
+                    "train_date = excluded.train_date, data = excluded.data",
+                    (
+                        document["id"],
+                        int(document["serving"]),
+                        document["train_date"],
+                        json.dumps(data),
+                    ),
+                )
+            ]
+        )
+
+    def update(self, id: str, fields: dict) -> None:
+        # set some fields of the meta data in place, never the serving flag,
+        # and without bumping the version (the serving model does not change)
+        if self.get(id) is None:
+            raise Exception(f"Model '{id}' not found")
+        paths = ", ".join("?, json(?)" for _ in fields)
+        parameters = []
+        for key, value in fields.items():
+            parameters.extend([f"$.{key}", json.dumps(value)])
+        self._write(
+            [
+                (
+                    f"UPDATE models SET data = json_set(data, {paths}) WHERE id = ?",
+                    (*parameters, id),
+                )
+            ],
+            bump_version=False,
+        )
+
+    def set_serving(self, id: str) -> None:
+        if self.get(id) is None:
+            raise Exception(f"Model '{id}' not found")
+        self._write(
+            [
+                ("UPDATE models SET serving = 0 WHERE serving = 1 AND id != ?", (id,)),
+                ("UPDATE models SET serving = 1 WHERE id = ?", (id,)),
+            ]
+        )
+
+    def serving_id(self) -> Union[str, None]:
+        row = (
+            self._connection()
+            .execute("SELECT id FROM models WHERE serving = 1 LIMIT 1")
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def version(self) -> int:
+        return (
+            self._connection()
+            .execute("SELECT version FROM registry_version WHERE id = 0")
+            .fetchone()[0]
+        )
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM models").fetchone()[0]
+
+    def report_deployment(self, deployment: dict) -> None:
+        self._write(
+            [
+                (
+                    "INSERT OR REPLACE INTO deployments (process_id, data) VALUES (?, ?)",
+                    (deployment["process_id"], json.dumps(deployment)),
+                )
+            ],
+            bump_version=False,
+        )
+
+    def deployments(self) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT data FROM deployments ORDER BY process_id"
+        )
+        return [json.loads(row[0]) for row in rows]
+
+
+class MongoModelRegistry:
+    """
+    Model registry stored in a MongoDB collection, one document per model
+    keyed on its id, with an index on `train_date`. The serving model is not
+    a flag of the models but a pointer in the version document, so that
+    switching it and bumping the version is a single atomic write.
+    """
+
+    def __init__(self, database, collection_name: str) -> None:
+        self.collection = database[collection_name]
+        self.versions = database[f"{collection_name}_version"]
+        self.deployment_collection = database[f"{collection_name}_deployments"]
+        self.collection.create_index("train_date")
+        # registries written before the pointer flagged the serving model itself
+        flagged = self.collection.find_one({"serving": True}, {"_id": 1})
+        if flagged is not None:
+            self.versions.update_one(
+                {"_id": 0, "serving_id": {"$exists": False}},
+                {"$set": {"serving_id": flagged["_id"]}},
+            )
+
+    @staticmethod
+    def _document(document: dict, serving_id: Union[str, None]) -> dict:
+        document.pop("_id", None)
+        document["serving"] = document["id"] == serving_id
+        return document
+
+    def _bump_version(self, fields: dict = None) -> None:
+        update = {"$inc": {"version": 1}}
+        if fields:
+            update["$set"] = fields
+        self.versions.update_one({"_id": 0}, update, upsert=True)
+
+    def all(self) -> Dict[str, dict]:
+        serving_id = self.serving_id()
+        return {
+            document["id"]: self._document(document, serving_id)
+            for document in self.collection.find().sort("_id", 1)
+        }
+
+    def get(self, id: str) -> Union[dict, None]:
+        document = self.collection.find_one({"_id": id})
+        if document is None:
+            return None
+        return self._document(document, self.serving_id())
+
+    def upsert(self, document: dict) -> None:
+        data = {key: value for key, value in document.items() if key != "serving"}
+        self.collection.replace_one(
+            {"_id": document["id"]}, dict(data, _id=document["id"]), upsert=True
+        )
+        self._bump_version(
+            {"serving_id": document["id"]} if document["serving"] else None
+        )
+
+    def update(self, id: str, fields: dict) -> None:
+        if self.collection.update_one({"_id": id}, {"$set": fields}).matched_count == 0:
+            raise Exception(f"Model '{id}' not found")
+
+    def set_serving(self, id: str) -> None:
+        if self.collection.count_documents({"_id": id}, limit=1) == 0:
+            raise Exception(f"Model '{id}' not found")
+        # moves the pointer and bumps the version in one write
+        self._bump_version({"serving_id": id})
+
+    def serving_id(self) -> Union[str, None]:
+        document = self.versions.find_one({"_id": 0}, {"serving_id": 1})
+        return None if document is None else document.get("serving_id")
+
+    def version(self) -> int:
+        document = self.versions.find_one({"_id": 0})
+        return 0 if document is None else document["version"]
+
+    def count(self) -> int:
+        return self.collection.count_documents({})
+
+    def report_deployment(self, deployment: dict) -> None:
+        self.deployment_collection.replace_one(
+            {"_id": deployment["process_id"]},
+            dict(deployment, _id=deployment["process_id"]),
+            upsert=True,
+        )
+
+    def deployments(self) -> List[dict]:
+        return [
+            self._document(deployment)
+            for deployment in self.deployment_collection.find().sort("_id", 1)
+        ]
+
+
+def migrate_json_registry(registry, json_path: str = None) -> int:
+    """
+    Copy the models of the former JSON registry file into a registry.
+    The models already in the registry are kept as they are.
+
+    Args:
+        registry: The registry to fill
+        json_path (str, optional): The JSON file. Defaults to ALL_PATH.MODEL_META_DATA_FILE.
+
+    Returns:
+        int: the number of models copied
+    """
+    json_path = json_path or ALL_PATH.MODEL_META_DATA_FILE
+    if not os.path.exists(json_path):
+        return 0
+    with open(json_path, "r") as file:
+        all_models = json.load(file)
+
+    migrated = 0
+    for model_id, model_meta_data in all_models.items():
+        if registry.get(model_id) is None:
+            registry.upsert(model_meta_data)
+            migrated += 1
+    return migrated
+
+
+def get_model_registry() -> Union[SQLiteModelRegistry, MongoModelRegistry]:
+    """
+    Get the model registry of the current process, opened on first use according
+    to settings.MODEL_REGISTRY_BACKEND. An empty registry is filled with the
+    models of the former JSON registry file.
+
+    Returns:
+        Union[SQLiteModelRegistry, MongoModelRegistry]: the model registry
+    """
+    if memory.model_registry is None:
+        with _registry_lock:
+            if memory.model_registry is None:
+                if settings.MODEL_REGISTRY_BACKEND == "mongo":
+                    registry = MongoModelRegistry(
+                        get_mongo_database(), settings.MODEL_REGISTRY_COL
+                    )
+                elif settings.MODEL_REGISTRY_BACKEND == "sqlite":
+                    registry = SQLiteModelRegistry(ALL_PATH.MODEL_REGISTRY_FILE)
+                else:
+                    raise Exception(
+                        f"Unknown model registry backend '{settings.MODEL_REGISTRY_BACKEND}'"
+                    )
+                if registry.count() == 0:
+                    migrate_json_registry(registry)
+                memory.model_registry = registry
+    return memory.model_registry
+
+
+if __name__ == "__main__":
+    registry = get_model_registry()
+    migrated = migrate_json_registry(
+        registry, sys.argv[1] if len(sys.argv) > 1 else None
+    )
+    print(
+        f"{migrated} new models migrated, {registry.count()} models in the "
+        f"{settings.MODEL_REGISTRY_BACKEND} registry"
+    )
@@ -0,0 +1,266 @@
+from threading import Lock
+from typing import TYPE_CHECKING, List, Tuple, Union
+
+from commons.compiled_model import CompiledModel
+from commons.constants import INTERESTING_COLUMN
+from commons.metrics import SCORING_STAGE_SECONDS, timed
+from commons.micro_batching import MicroBatcher
+from commons.model_deployment import get_model_deployer
+from commons.model_registry import get_model_registry
+from commons.prediction_cache import get_prediction_cache, normalize_email
+from memory import Memory
+from settings import settings
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+memory = Memory.getInstance()
+
+_micro_batcher_lock = Lock()
+
+
+def get_serving_pipeline() -> Tuple[str, Union["Pipeline", CompiledModel]]:
+    """
+    Get the pipeline of the serving model, loaded in the current process.
+    A background deployer keeps it in sync with the registry: a new serving
+    model is loaded while the previous one keeps serving, then swapped in.
+    Only the very first call of a process waits for a model to be loaded.
+
+    Returns:
+        Tuple[str, Union[Pipeline, CompiledModel]]: the id of the serving model and its fitted pipeline
+    """
+    deployer = get_model_deployer()
+    model_id, pipeline = memory.deployment
+    if pipeline is None:
+        # cold start, no model to serve in the meantime
+        deployer.sync()
+        model_id, pipeline = memory.deployment
+        if pipeline is None:
+            raise Exception("No model is serving")
+    return model_id, pipeline
+
+
+def _model_input(pipeline: Union["Pipeline", CompiledModel], emails: List[str]):
+    # the compiled engine scores the raw strings, the sklearn pipeline needs a DataFrame
+    if isinstance(pipeline, CompiledModel):
+        return emails
+    import pandas as pd
+
+    return pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: emails})
+
+
+def _predict_proba(pipeline: Union["Pipeline", CompiledModel], emails: List[str]):
+    # same as `pipeline.predict_proba`, with the time of each stage observed
+    with timed(SCORING_STAGE_SECONDS, stage="dataframe"):
+        X = _model_input(pipeline, emails)
+    if isinstance(pipeline, CompiledModel):
+        with timed(SCORING_STAGE_SECONDS, stage="transform"):
+            X = pipeline.transform(X)
+        with timed(SCORING_STAGE_SECONDS, stage="predict"):
+            return pipeline.predict_proba_features(X)
+    with timed(SCORING_STAGE_SECONDS, stage="transform"):
+        for _, step in pipeline.steps[:-1]:
+            X = step.transform(X)
+    with timed(SCORING_STAGE_SECONDS, stage="predict"):
+        return pipeline.steps[-1][1].predict_proba(X)
+
+
+def predict_email_proba(
+    pipeline: Union["Pipeline", CompiledModel], email: str
+) -> float:
+    """
+    Score a single email with a fitted pipeline
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        email (str): The email to score
+
+    Returns:
+        float: the probability returned by the pipeline for the email
+    """
+    return _predict_proba(pipeline, [email])[0][0]
+
+
+def predict_emails_proba(
+    pipeline: Union["Pipeline", CompiledModel],
+    emails: List[str],
+    chunk_size: int = None,
+) -> List[float]:
+    """
+    Score a list of emails with a fitted pipeline, with one vectorized
+    `predict_proba` call per chunk
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        emails (List[str]): The emails to score
+        chunk_size (int, optional): The number of emails scored per call. Defaults to settings.BATCH_CHUNK_SIZE.
+
+    Returns:
+        List[float]: the probability returned by the pipeline for each email, in the input order
+    """
+    chunk_size = chunk_size or settings.BATCH_CHUNK_SIZE
+    probas = []
+    for start in range(0, len(emails), chunk_size):
+        chunk = emails[start : start + chunk_size]
+        probas.extend(_predict_proba(pipeline, chunk)[:, 0].tolist())
+    return probas
+
+
+def score_emails(
+    model_id: str,
+    pipeline: Union["Pipeline", CompiledModel],
+    emails: List[str],
+    chunk_size: int = None,
+) -> List[float]:
+    """
+    Score a list of emails, reusing the cached predictions of the model and
+    scoring only the emails missing from the cache
+
+    Args:
+        model_id (str): The id of the model, part of the cache key
+        pipeline (Pipeline): The fitted pipeline of the model
+        emails (List[str]): The emails to score
+        chunk_size (int, optional): The number of emails scored per call. Defaults to settings.BATCH_CHUNK_SIZE.
+
+    Returns:
+        List[float]: the probability of each email, in the input order
+    """
+    cache = get_prediction_cache()
+    if cache is None:
+        return predict_emails_proba(pipeline, emails, chunk_size)
+
+    # the normalized email is only the cache key, the model scores the email as received
+    keys = [normalize_email(email) for email in emails]
+    unique_emails = {}
+    for key, email in zip(keys, emails):
+        unique_emails.setdefault(key, email)
+    with timed(SCORING_STAGE_SECONDS, stage="cache"):
+        probas = cache.get_many(model_id, list(unique_emails))
+    missing = [key for key in unique_emails if key not in probas]
+    if missing:
+        missing_probas = predict_emails_proba(
+            pipeline, [unique_emails[key] for key in missing], chunk_size
+        )
+        scored = dict(zip(missing, missing_probas))
+        with timed(SCORING_STAGE_SECONDS, stage="cache"):
+            cache.set_many(model_id, scored)
+        probas.update(scored)
+    return [probas[key] for key in keys]
+
+
+def format_batch_result(emails: List[str], probas: List[float], model_id: str) -> dict:
+    """
+    Build the single result document of a batch prediction
+
+    Args:
+        emails (List[str]): The scored emails
+        probas (List[float]): The probability of each email
+        model_id (str): The id of the model used
+
+    Returns:
+        dict: the result document of the batch
+    """
+    return {
+        "model_id": model_id,
+        "count": len(emails),
+        "results": [
+            {"proba": proba, "email": email} for email, proba in zip(emails, probas)
+        ],
+    }
+
+
+def _predict_serving_batch(emails: List[str]) -> Tuple[str, List[float]]:
+    model_id, pipeline = get_serving_pipeline()
+    return model_id, predict_emails_proba(pipeline, emails)
+
+
+def get_micro_batcher() -> MicroBatcher:
+    """
+    Get the micro-batching dispatcher of the current process, started on first use
+
+    Returns:
+        MicroBatcher: the dispatcher coalescing the single predictions of the process
+    """
+    if memory.micro_batcher is None:
+        with _micro_batcher_lock:
+            if memory.micro_batcher is None:
+                memory.micro_batcher = MicroBatcher(
+                    _predict_serving_batch,
+                    max_batch_size=settings.MICRO_BATCH_MAX_SIZE,
+                    max_wait_ms=settings.MICRO_BATCH_WAIT_MS,
+                )
+    return memory.micro_batcher
+
+
+def get_cached_prediction(email: str) -> Union[dict, None]:
+    """
+    Look up the prediction of the serving model for an email in the prediction
+    cache, without loading the model. Used to answer before sending a task.
+
+    Args:
+        email (str): The email
+
+    Returns:
+        Union[dict, None]: the probability, the email and the id of the model, None if not cached
+    """
+    cache = get_prediction_cache()
+    if cache is None:
+        return None
+    model_id = get_model_registry().serving_id()
+    if model_id is None:
+        return None
+    email_key = normalize_email(email)
+    cached = cache.get_many(model_id, [email_key])
+    if not cached:
+        return None
+    return {"proba": cached[email_key], "email": email, "model_id": model_id}
+
+
+def predict_sync(email: str) -> dict:
+    """
+    Score a single email in the current process with the serving model.
+    If micro-batching is enabled, the email is scored together with the
+    other emails received in the same window.
+
+    Args:
+        email (str): The email to score
+
+    Returns:
+        dict: the probability, the email and the id of the model used
+    """
+    model_id, pipeline = get_serving_pipeline()
+    email_key = normalize_email(email)
+    cache = get_prediction_cache()
+    if cache is not None:
+        with timed(SCORING_STAGE_SECONDS, stage="cache"):
+            cached = cache.get_many(model_id, [email_key])
+        if cached:
+            return {"proba": cached[email_key], "email": email, "model_id": model_id}
+
+    # the normalized email is only the cache key, the model scores the email as received
+    if settings.MICRO_BATCHING:
+        result = get_micro_batcher().predict(email)
+        model_id, proba = result["model_id"], result["proba"]
+    else:
+        proba = predict_email_proba(pipeline, email)
+
+    if cache is not None:
+        with timed(SCORING_STAGE_SECONDS, stage="cache"):
+            cache.set_many(model_id, {email_key: proba})
+    return {"proba": proba, "email": email, "model_id": model_id}
+
+
+def predict_batch_sync(emails: List[str], chunk_size: int = None) -> dict:
+    """
+    Score a list of emails in the current process with the serving model
+
+    Args:
+        emails (List[str]): The emails to score
+        chunk_size (int, optional): The number of emails scored per call. Defaults to settings.BATCH_CHUNK_SIZE.
+
+    Returns:
+        dict: the result document of the batch
+    """
+    model_id, pipeline = get_serving_pipeline()
+    probas = score_emails(model_id, pipeline, emails, chunk_size)
+    return format_batch_result(emails, probas, model_id)
@@ -0,0 +1,169 @@
+import json
+import os
+import time
+from typing import List
+
+from joblib import Parallel, delayed
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+from sklearn.pipeline import Pipeline
+
+from commons.constants import SEED
+from commons.dataset import load_dataset
+from commons.feature_cache import (
+    get_features,
+    normalize_tf_idf_params,
+    resolve_tf_idf_params,
+)
+from commons.model_data_class import (
+    SearchTypes,
+    VectorizerTypes,
+    check_model_features,
+)
+from commons.model_training import (
+    build_model,
+    fit_model,
+    register_model,
+    training_threads,
+)
+from settings import settings
+
+
+def expand_sweep(sweep_input: dict) -> List[dict]:
+    """
+    List the candidates of a sweep
+
+    Args:
+        sweep_input (dict): The sweep, with the values to explore for each model and tf-idf parameter
+
+    Returns:
+        List[dict]: the parameters of each candidate, with a `model_params` and a `tf_idf_params` dict
+    """
+    space = {
+        f"model_params__{key}": values
+        for key, values in sweep_input["model_params"].items()
+    }
+    space.update(
+        {
+            f"tf_idf_params__{key}": values
+            for key, values in sweep_input["tf_idf_params"].items()
+        }
+    )
+    if SearchTypes(sweep_input["search"]) == SearchTypes.Random:
+        combinations = ParameterSampler(
+            space, n_iter=sweep_input["n_iter"], random_state=SEED
+        )
+    else:
+        combinations = ParameterGrid(space)
+
+    candidates = []
+    for combination in combinations:
+        candidate = {"model_params": {}, "tf_idf_params": {}}
+        for key, value in combination.items():
+            group, name = key.split("__", 1)
+            candidate[group][name] = value
+        candidate["tf_idf_params"] = normalize_tf_idf_params(candidate["tf_idf_params"])
+        candidates.append(candidate)
+    return candidates
+
+
+def _fit_candidate(
+    model_type: str,
+    model_params: dict,
+    X_train,
+    y_train,
+    X_test,
+    y_test,
+    n_threads: int,
+):
+    start = time.perf_counter()
+    model = build_model(model_type, model_params)
+    fit_model(model, X_train, y_train, n_threads)
+    fit_time = time.perf_counter() - start
+    return model, model.score(X_test, y_test), fit_time
+
+
+def run_sweep(sweep_input: dict) -> dict:
+    """
+    Train every candidate of a sweep and register them in the model registry.
+    The data is loaded and featurized once per distinct set of tf-idf
+    parameters, and the classifiers are fitted in parallel on a process pool.
+
+    Args:
+        sweep_input (dict): The sweep, as a SweepInput dict
+
+    Returns:
+        dict: the leaderboard of the candidates, ranked by accuracy
+    """
+    vectorizer = sweep_input.get("vectorizer", VectorizerTypes.TfIdf)
+    candidates = expand_sweep(sweep_input)
+    # the candidates are checked before the data is loaded
+    for candidate in candidates:
+        check_model_features(
+            sweep_input["model_type"], vectorizer, candidate["tf_idf_params"]
+        )
+    dataset = load_dataset()
+    train_indices, test_indices = dataset.split(seed=SEED)
+    y_train, y_test = dataset.labels[train_indices], dataset.labels[test_indices]
+    n_jobs = sweep_input.get("n_jobs") or settings.SWEEP_N_JOBS
+
+    groups = {}
+    for candidate in candidates:
+        # registered with the candidate, to retrain it with `train_model`
+        candidate["vectorizer"] = VectorizerTypes(vectorizer).value
+        candidate["tf_idf_params"] = resolve_tf_idf_params(
+            candidate["tf_idf_params"], vectorizer
+        )
+        key = json.dumps(candidate["tf_idf_params"], sort_keys=True, default=list)
+        groups.setdefault(key, []).append(candidate)
+
+    features = {
+        key: get_features(
+            dataset, group[0]["tf_idf_params"], train_indices, test_indices, vectorizer
+        )
+        for key, group in groups.items()
+    }
+    jobs = [(key, candidate) for key, group in groups.items() for candidate in group]
+    # the cores of the training worker are shared between the parallel fits
+    n_threads = training_threads(
+        min(len(jobs), os.cpu_count() or 1) if n_jobs < 0 else min(len(jobs), n_jobs)
+    )
+    results = Parallel(n_jobs=n_jobs, backend="loky")(
+        delayed(_fit_candidate)(
+            sweep_input["model_type"],
+            candidate["model_params"],
+            features[key][1],
+            y_train,
+            features[key][2],
+            y_test,
+            n_threads,
+        )
+        for key, candidate in jobs
+    )
+
+    leaderboard = []
+    for (key, candidate), (model, accuracy, fit_time) in zip(jobs, results):
+        model_meta_data = register_model(
+            Pipeline([("preprocessing", features[key][0]), ("model", model)]),
+            name=f"{sweep_input['name']}-{len(leaderboard)}",
+            accuracy=accuracy,
+            params=candidate,
+            dataset_rows=len(dataset),
+        )
+        leaderboard.append(
+            {
+                "id": model_meta_data["id"],
+                "name": model_meta_data["name"],
+                "accuracy": accuracy,
+                "fit_time": fit_time,
+                "params": candidate,
+            }
+        )
+
+    leaderboard.sort(key=lambda candidate: candidate["accuracy"], reverse=True)
+    for rank, candidate in enumerate(leaderboard, start=1):
+        candidate["rank"] = rank
+    return {
+        "name": sweep_input["name"],
+        "n_candidates": len(leaderboard),
+        "leaderboard": leaderboard,
+    }
@@ -1,28 +1,140 @@
-from typing import Union
+from typing import TYPE_CHECKING, Callable, Union
 from datetime import datetime
-import json
+import importlib
 import os
-import joblib
+import shutil
 import uuid
 
-import pandas as pd
-
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.ensemble import GradientBoostingClassifier
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.model_selection import train_test_split
-
-from commons.constants import INTERESTING_COLUMN, ALL_PATH, SEED
-from commons.model_data_class import ModelMetaData
+from commons.compiled_model import (
+    CompiledModel,
+    check_parity,
+    compile_pipeline,
+    save_compiled_model,
+)
+from commons.constants import ALL_PATH, DEFAULT_PARAMS, SEED
+from commons.metrics import MODEL_LOAD_SECONDS, TRAINING_STAGE_SECONDS, timed
+from commons.model_data_class import (
+    ModelInput,
+    ModelMetaData,
+    ModelTypes,
+    VectorizerTypes,
+    check_model_features,
+)
+from commons.model_registry import get_model_registry
+from commons.prediction_cache import invalidate_prediction_cache
+from commons.training_control import TrainingMonitor
 
 
 from memory import Memory
+from settings import settings
+
+# sklearn, pandas and joblib are imported on first use, so that the API process
+# and the model loading of the workers never import them
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
 
 memory = Memory.getInstance()
 
 
-def saveFittedPipeline(pipeline: Pipeline, uuid: str) -> None:
+MODEL_CLASSES = {
+    ModelTypes.GradientBoosting: "sklearn.ensemble.GradientBoostingClassifier",
+    ModelTypes.HistGradientBoosting: "sklearn.ensemble.HistGradientBoostingClassifier",
+    ModelTypes.SGD: "sklearn.linear_model.SGDClassifier",
+    ModelTypes.LogisticRegression: "sklearn.linear_model.LogisticRegression",
+}
+# parameters of a model type that differ from the sklearn defaults
+MODEL_DEFAULT_PARAMS = {
+    # the losses predicting probabilities, the only ones the pipeline can serve
+    ModelTypes.SGD: {"loss": "log_loss"},
+    # never the "auto" early stopping of sklearn, turned on above 10000 rows
+    ModelTypes.HistGradientBoosting: {"early_stopping": False},
+}
+SGD_PROBABILISTIC_LOSSES = ("log_loss", "modified_huber")
+# the emails of the dataset a compiled model must score as its pipeline
+PARITY_EMAILS = 2000
+
+
+def to_dense(X):
+    # the histogram-based boosting only fits dense matrices
+    return X.toarray() if hasattr(X, "toarray") else X
+
+
+def training_threads(n_jobs: int = 1) -> int:
+    """
+    Get the number of threads a fit may use, so that the processes of the
+    training worker (and the jobs of a sweep) do not oversubscribe the cores
+
+    Args:
+        n_jobs (int, optional): The number of fits run in parallel by the process. Defaults to 1.
+
+    Returns:
+        int: the number of threads of a fit, at least 1
+    """
+    threads = settings.TRAINING_THREADS or (
+        (os.cpu_count() or 1) // max(settings.TRAINING_WORKER_CONCURRENCY, 1)
+    )
+    return max(threads // max(n_jobs, 1), 1)
+
+
+def fit_model(model, X, y, n_threads: int = None, monitor: TrainingMonitor = None):
+    """
+    Fit a classifier with its OpenMP and BLAS thread pools limited
+
+    Args:
+        model: The classifier built by `build_model`
+        X: The training features
+        y: The training labels
+        n_threads (int, optional): The number of threads. Defaults to `training_threads()`.
+        monitor (TrainingMonitor, optional): The early stopping, budget and progress of the fit. Defaults to None.
+
+    Returns:
+        the fitted classifier
+    """
+    from threadpoolctl import threadpool_limits
+
+    with threadpool_limits(limits=n_threads or training_threads()):
+        if monitor is not None:
+            return monitor.fit(model, X, y)
+        return model.fit(X, y)
+
+
+def build_model(model_type: str, model_params: dict):
+    """
+    Build the (unfitted) classifier of a model type
+
+    Args:
+        model_type (str): The type of the model, one of ModelTypes
+        model_params (dict): The parameters of the classifier
+
+    Returns:
+        the classifier
+    """
+    model_type = ModelTypes(model_type)
+    model_params = {**MODEL_DEFAULT_PARAMS.get(model_type, {}), **model_params}
+    if (
+        model_type == ModelTypes.SGD
+        and model_params["loss"] not in SGD_PROBABILISTIC_LOSSES
+    ):
+        raise ValueError(
+            f"The loss of a SGD model must be one of {SGD_PROBABILISTIC_LOSSES}"
+        )
+    module_name, class_name = MODEL_CLASSES[model_type].rsplit(".", 1)
+    model_class = getattr(importlib.import_module(module_name), class_name)
+    model = model_class(**model_params)
+    if model_type == ModelTypes.HistGradientBoosting:
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import FunctionTransformer
+
+        model = Pipeline(
+            [
+                ("densify", FunctionTransformer(to_dense, accept_sparse=True)),
+                ("classifier", model),
+            ]
+        )
+    return model
+
+
+def saveFittedPipeline(pipeline: "Pipeline", uuid: str) -> None:
     """
     Save a fitted pipeline to the models folder
 
@@ -30,10 +142,49 @@ def saveFittedPipeline(pipeline: Pipeline, uuid: str) -> None:
         pipeline (Pipeline): The fitted pipeline to be saved
         uuid (str): the uuid of the model
     """
+    import joblib
+
     joblib.dump(pipeline, ALL_PATH.MODELS_FOLDER + uuid + ".joblib")
+    saveCompiledModel(pipeline, uuid)
 
 
-def train_model(model_input: dict, default_model: bool = False) -> dict:
+def saveCompiledModel(pipeline: "Pipeline", uuid: str) -> bool:
+    """
+    Compile a fitted pipeline into its NumPy scoring engine and save it to the
+    models folder, if it scores the first PARITY_EMAILS emails of the dataset
+    as the pipeline. Otherwise no compiled engine is left for the model, and
+    it is served by the pipeline.
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline to be compiled
+        uuid (str): the uuid of the model
+
+    Returns:
+        bool: True if the pipeline could be compiled
+    """
+    from commons.dataset import load_dataset
+
+    try:
+        arrays = compile_pipeline(pipeline)
+        check_parity(
+            pipeline,
+            CompiledModel(arrays),
+            load_dataset().emails[:PARITY_EMAILS].astype(object).tolist(),
+        )
+    except ValueError as e:
+        print(f"Model '{uuid}' can not be compiled: {e}")
+        # the engine compiled from a previous version of the model (a retrained default model)
+        shutil.rmtree(ALL_PATH.MODELS_FOLDER + uuid + ".compiled", ignore_errors=True)
+        return False
+    save_compiled_model(arrays, ALL_PATH.MODELS_FOLDER + uuid + ".compiled")
+    return True
+
+
+def train_model(
+    model_input: dict,
+    default_model: bool = False,
+    progress: Callable[[dict], None] = None,
+) -> dict:
     """
     Train a model and save it to the models folder
     Add the model meta data to the model meta data file
@@ -42,50 +193,114 @@ def train_model(model_input: dict, default_model: bool = False) -> dict:
         model_input (dict): The input data for the model. It contains:
             - the model name,
             - the model type
-            - the model parameters (actualy the parameters of the model and the tf-idf transformer)
+            - the model parameters (actualy the parameters of the model and the tf-idf transformer,
+              and the vectorizer, tf-idf or hashing)
         default_model (bool, optional): If True, the model will be saved as the default model. Defaults to False.
+        progress (Callable[[dict], None], optional): Called with the stage of the training and the
+            progress of the fit (see `TrainingMonitor`). Defaults to None.
 
     Returns:
         dict: The model meta data
     """
-    df = pd.read_csv(ALL_PATH.DATA_POINTS_FILES)
-    train_df, test_df = train_test_split(df, test_size=0.2, random_state=SEED)
-    model_params = model_input["model_params"]
-    model = GradientBoostingClassifier(**model_params["model_params"])
-    if "ngram_range" in model_params["tf_idf_params"]:
-        model_params["tf_idf_params"]["ngram_range"] = tuple(
-            model_params["tf_idf_params"]["ngram_range"]
-        )
-    tf_idf_transformer = Pipeline(
-        [
-            ("tf_idf_vectorizer", TfidfVectorizer(**model_params["tf_idf_params"])),
-        ]
+    from sklearn.pipeline import Pipeline
+
+    from commons.dataset import load_dataset
+    from commons.feature_cache import get_features, resolve_tf_idf_params
+
+    def report(stage: str) -> None:
+        if progress is not None:
+            progress({"stage": stage})
+
+    # the options are checked before the data is loaded
+    monitor = TrainingMonitor(
+        model_input["model_type"], model_input.get("training_options"), progress
     )
-    preprocess_pipeline = ColumnTransformer(
-        [("email_transformer", tf_idf_transformer, INTERESTING_COLUMN.EMAIL_COLUMN)]
+    check_model_features(
+        model_input["model_type"],
+        model_input["model_params"].get("vectorizer", VectorizerTypes.TfIdf),
+        model_input["model_params"]["tf_idf_params"],
     )
-    pipeline = Pipeline([("preprocessing", preprocess_pipeline), ("model", model)])
-    pipeline.fit(
-        train_df[[INTERESTING_COLUMN.EMAIL_COLUMN]], train_df[INTERESTING_COLUMN.TARGET]
+    report("dataset")
+    with timed(TRAINING_STAGE_SECONDS, stage="dataset"):
+        dataset = load_dataset()
+        train_indices, test_indices = dataset.split(seed=SEED)
+    model_params = model_input["model_params"]
+    model = build_model(model_input["model_type"], model_params["model_params"])
+    # registered with the defaults of the settings, to retrain the same features
+    model_params["tf_idf_params"] = resolve_tf_idf_params(
+        model_params["tf_idf_params"],
+        model_params.get("vectorizer", VectorizerTypes.TfIdf),
     )
+    # the vectorizer is only fitted if these parameters were never used on this split
+    report("features")
+    with timed(TRAINING_STAGE_SECONDS, stage="features"):
+        preprocess_pipeline, X_train, X_test = get_features(
+            dataset,
+            model_params["tf_idf_params"],
+            train_indices,
+            test_indices,
+            model_params.get("vectorizer", VectorizerTypes.TfIdf),
+        )
+    with timed(TRAINING_STAGE_SECONDS, stage="fit"):
+        fit_model(model, X_train, dataset.labels[train_indices], monitor=monitor)
+    pipeline = Pipeline([("preprocessing", preprocess_pipeline), ("model", model)])
+    report("score")
+    with timed(TRAINING_STAGE_SECONDS, stage="score"):
+        accuracy = model.score(X_test, dataset.labels[test_indices])
+
+    report("register")
+    with timed(TRAINING_STAGE_SECONDS, stage="register"):
+        return register_model(
+            pipeline,
+            name=model_input["name"],
+            accuracy=accuracy,
+            params=model_params,
+            model_id="default" if default_model else None,
+            dataset_rows=len(dataset),
+            training=monitor.summary(),
+        )
+
 
-    if default_model:
-        model_id = "default"
-    else:
-        model_id = uuid.uuid4().hex
+def register_model(
+    pipeline: "Pipeline",
+    name: str,
+    accuracy: float,
+    params: dict,
+    model_id: str = None,
+    parent_id: str = None,
+    dataset_rows: int = None,
+    training: dict = None,
+) -> dict:
+    """
+    Save a fitted pipeline to the models folder and add its meta data to the registry
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        name (str): The name of the model
+        accuracy (float): The accuracy of the model on the test set
+        params (dict): The parameters of the model and of the tf-idf transformer
+        model_id (str, optional): The id of the model. Defaults to None, generating a new uuid.
+        parent_id (str, optional): The id of the model it was updated from. Defaults to None.
+        dataset_rows (int, optional): The number of rows of the dataset when it was trained. Defaults to None.
+        training (dict, optional): The summary of the fit, by `TrainingMonitor`. Defaults to None.
+
+    Returns:
+        dict: The model meta data
+    """
+    model_id = model_id or uuid.uuid4().hex
 
     saveFittedPipeline(pipeline, model_id)
 
     model_meta_data = ModelMetaData(
         id=model_id,
-        name=model_input["name"],
-        accuracy=pipeline.score(
-            test_df[[INTERESTING_COLUMN.EMAIL_COLUMN]],
-            test_df[INTERESTING_COLUMN.TARGET],
-        ),
+        name=name,
+        accuracy=accuracy,
         train_date=datetime.now().strftime("%Y-%m-%d %H:%M"),
         serving=False,
-        params=model_params,
+        params=params,
+        parent_id=parent_id,
+        dataset_rows=dataset_rows,
+        training=training,
     )
 
     save_model_meta_data(model_meta_data)
@@ -99,35 +314,26 @@ def get_all_models() -> Union[dict, None]:
     Returns:
         Union[dict, None]: list of the meta data of all the models registered
     """
-    # check if meta data file exists
-    if not os.path.exists(ALL_PATH.MODEL_META_DATA_FILE):
-        return None
-    else:
-        with open(ALL_PATH.MODEL_META_DATA_FILE, "r") as file:
-            meta_data = json.load(file)
-            return meta_data
+    all_models = get_model_registry().all()
+    return all_models or None
 
 
-def get_model_meta_data(id: str) -> dict:
+def get_model_meta_data(id: str) -> Union[dict, None]:
     """
     Get the model meta data for a given id
 
     Args:
-        id (str): _description_
+        id (str): The id of the model
 
     Returns:
-        dict: _description_
+        Union[dict, None]: The model meta data, None if the model is not registered
     """
-    all_models = get_all_models()
-    if all_models is None or id not in all_models:
-        return None
-    else:
-        return all_models[id]
+    return get_model_registry().get(id)
 
 
 def save_model_meta_data(model_meta_data: ModelMetaData) -> bool:
     """
-    Add a model meta data to the model meta data file
+    Add or update a model meta data in the model registry
 
     Args:
         model_meta_data (ModelMetaData): The model meta data to be saved
@@ -135,15 +341,46 @@ def save_model_meta_data(model_meta_data: ModelMetaData) -> bool:
     Returns:
         bool: return True if the model meta data was saved successfully
     """
-    all_models = get_all_models()
-    if all_models is None:
-        all_models = {}
-    all_models[model_meta_data.id] = model_meta_data.dict()
-    with open(ALL_PATH.MODEL_META_DATA_FILE, "w") as file:
-        json.dump(all_models, file, indent=4)
+    get_model_registry().upsert(model_meta_data.dict())
     return True
 
 
+def get_serving_model_id() -> Union[str, None]:
+    """
+    Get the id of the model flagged as serving in the registry
+
+    Returns:
+        Union[str, None]: the id of the serving model, None if no model is serving
+    """
+    return get_model_registry().serving_id()
+
+
+def load_model(id: str) -> Union["Pipeline", CompiledModel]:
+    """
+    Load a fitted pipeline from the models folder.
+    If settings.COMPILED_SCORING is set, its compiled scoring engine is loaded
+    instead, memory-mapped (and compiled first if it was never done).
+
+    Args:
+        id (str): The id of the model to load
+
+    Returns:
+        Union[Pipeline, CompiledModel]: the fitted pipeline or its compiled engine
+    """
+    compiled_path = ALL_PATH.MODELS_FOLDER + id + ".compiled"
+    if settings.COMPILED_SCORING and os.path.exists(compiled_path):
+        with timed(MODEL_LOAD_SECONDS, format="compiled"):
+            return CompiledModel.load(compiled_path)
+
+    import joblib
+
+    with timed(MODEL_LOAD_SECONDS, format="joblib"):
+        pipeline = joblib.load(ALL_PATH.MODELS_FOLDER + id + ".joblib")
+    if settings.COMPILED_SCORING and saveCompiledModel(pipeline, id):
+        return CompiledModel.load(compiled_path)
+    return pipeline
+
+
 def setup_main_model(id: str) -> None:
     """
     Set the main model to be used for inference
@@ -152,21 +389,34 @@ def setup_main_model(id: str) -> None:
     id (str): The id of the model to be used for inference
 
     """
-    all_models = get_all_models()
-    if all_models is None or id not in all_models:
+    registry = get_model_registry()
+    if registry.get(id) is None:
         raise Exception(f"Model '{id}' not found")
 
-    old_main_model_id = memory.model_deployed_id
-    if old_main_model_id is not None:
-        old_main_model = ModelMetaData(**get_model_meta_data(old_main_model_id))
-        old_main_model.serving = False
-        print(old_main_model)
-        save_model_meta_data(old_main_model)
+    pipeline = load_model(id)
+    # flags this model as serving and the previous one as not serving, in one transaction
+    registry.set_serving(id)
+    memory.swap_model(id, pipeline)
+    invalidate_prediction_cache(keep_model_id=id)
 
-    model_meta_data = ModelMetaData(**all_models[id])
-    pipeline = joblib.load(ALL_PATH.MODELS_FOLDER + id + ".joblib")
-    model_meta_data.serving = True
-    save_model_meta_data(model_meta_data)
-    get_model_meta_data
-    memory.model_deployed = pipeline
-    memory.model_deployed_id = id
+
+def bootstrap_default_model() -> dict:
+    """
+    Train the default model if it is not registered yet, and make it the
+    serving model if no model is serving
+
+    Returns:
+        dict: The meta data of the default model
+    """
+    model_meta_data = get_model_meta_data("default")
+    if model_meta_data is None:
+        model_input = ModelInput(
+            name="default",
+            model_type=ModelTypes.GradientBoosting,
+            model_params=DEFAULT_PARAMS,
+        ).dict()
+        model_meta_data = train_model(model_input=model_input, default_model=True)
+
+    if get_serving_model_id() is None:
+        get_model_registry().set_serving("default")
+    return model_meta_data
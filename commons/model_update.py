@@ -0,0 +1,93 @@
+from typing import List
+
+import joblib
+import numpy as np
+
+from commons.constants import ALL_PATH, SEED
+from commons.dataset import load_dataset, split_rows
+from commons.model_data_class import VectorizerTypes
+from commons.model_training import get_model_meta_data, register_model
+
+
+def lineage_rows(model_id: str) -> List[int]:
+    """
+    Get the rows of the dataset seen by a model and by the models it was
+    updated from, oldest first
+
+    Args:
+        model_id (str): The id of the model
+
+    Returns:
+        List[int]: the number of rows of the dataset at each training, from 0
+    """
+    rows = []
+    while model_id is not None:
+        model_meta_data = get_model_meta_data(model_id)
+        if model_meta_data is None:
+            raise Exception(f"Model '{model_id}' not found")
+        if model_meta_data.get("dataset_rows") is None:
+            raise ValueError(
+                f"Model '{model_id}' was registered without the rows of its dataset, "
+                "it can not be updated"
+            )
+        rows.append(model_meta_data["dataset_rows"])
+        model_id = model_meta_data.get("parent_id")
+    return [0] + rows[::-1]
+
+
+def update_model(model_id: str, update_input: dict) -> dict:
+    """
+    Update a model with the labeled emails appended to the dataset since it
+    was trained, and register the result as a new model with its parent.
+    Only the classifier is updated (`partial_fit`), the hashed features and
+    their idf stay those of the parent. The accuracy is measured on the rows
+    held out by all the models of the lineage.
+
+    Args:
+        model_id (str): The id of the model to update, a SGD model with hashed features
+        update_input (dict): The update, as a ModelUpdateInput dict
+
+    Returns:
+        dict: the meta data of the new model
+    """
+    parent = get_model_meta_data(model_id)
+    if parent is None:
+        raise Exception(f"Model '{model_id}' not found")
+    if parent["params"].get("vectorizer") != VectorizerTypes.Hashing:
+        raise ValueError(
+            "Only the models with hashed features can be updated, the vocabulary "
+            "of the tf-idf vectorizer can not grow"
+        )
+    pipeline = joblib.load(ALL_PATH.MODELS_FOLDER + model_id + ".joblib")
+    preprocessing = pipeline.named_steps["preprocessing"]
+    model = pipeline.named_steps["model"]
+    if not hasattr(model, "partial_fit"):
+        raise ValueError(f"A {type(model).__name__} model can not be updated")
+
+    dataset = load_dataset()
+    rows = lineage_rows(model_id) + [len(dataset)]
+    if rows[-1] <= rows[-2]:
+        raise ValueError(f"No labeled email was added since model '{model_id}'")
+    splits = [split_rows(start, stop) for start, stop in zip(rows, rows[1:])]
+    train_indices = splits[-1][0]
+    test_indices = np.concatenate([test for _, test in splits])
+
+    X_train = preprocessing.transform(dataset.frame(train_indices))
+    y_train = dataset.labels[train_indices]
+    random_state = np.random.RandomState(SEED)
+    for _ in range(update_input["n_epochs"]):
+        order = random_state.permutation(len(train_indices))
+        model.partial_fit(X_train[order], y_train[order])
+    accuracy = model.score(
+        preprocessing.transform(dataset.frame(test_indices)),
+        dataset.labels[test_indices],
+    )
+
+    return register_model(
+        pipeline,
+        name=update_input["name"],
+        accuracy=accuracy,
+        params=parent["params"],
+        parent_id=model_id,
+        dataset_rows=len(dataset),
+    )
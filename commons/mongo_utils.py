@@ -0,0 +1,150 @@
+from threading import Condition, Lock, Thread
+
+from settings import settings
+
+_client = None
+_client_lock = Lock()
+_pool_listener = None
+
+
+def mongo_client_options() -> dict:
+    """
+    Get the connection pool options of the MongoDB clients, from the settings
+
+    Returns:
+        dict: the keyword arguments of MongoClient
+    """
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        # 0 for no limit, the default of the client
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS or None,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def get_pool_listener():
+    """
+    Get the listener counting the connection pool events of the MongoDB clients
+    of the current process. It is registered on first use, for all the clients
+    created afterwards (the client of the application and the one of the Celery
+    result backend).
+
+    Returns:
+        MongoPoolListener: the listener
+    """
+    global _pool_listener
+    if _pool_listener is None:
+        with _client_lock:
+            if _pool_listener is None:
+                from pymongo import monitoring
+
+                from commons.mongo_pool_listener import MongoPoolListener
+
+                _pool_listener = MongoPoolListener()
+                monitoring.register(_pool_listener)
+    return _pool_listener
+
+
+def get_mongo_client():
+    """
+    Get the MongoDB client of the current process, created on first use.
+    It is shared by all the threads of the process, and so is its connection pool.
+
+    Returns:
+        MongoClient: the client connected to the MongoDB configured in the settings
+    """
+    global _client
+    if _client is None:
+        get_pool_listener()
+        with _client_lock:
+            if _client is None:
+                from pymongo import MongoClient
+
+                _client = MongoClient(
+                    host=settings.MONGO_HOST,
+                    port=settings.MONGO_PORT,
+                    username=settings.MONGO_USERNAME,
+                    password=settings.MONGO_PASSWORD,
+                    **mongo_client_options(),
+                )
+    return _client
+
+
+def get_mongo_database():
+    """
+    Get the MongoDB database of the application
+
+    Returns:
+        Database: the database configured in the settings
+    """
+    return get_mongo_client()[settings.MONGO_DATABASE]
+
+
+def mongo_pool_stats() -> dict:
+    """
+    Get the connection pool metrics of the MongoDB clients of the current process
+
+    Returns:
+        dict: the pool options and the connection counters, None if no client was created
+    """
+    if _pool_listener is None:
+        return None
+    return dict(_pool_listener.stats(), **mongo_client_options())
+
+
+class MongoBulkWriter:
+    """
+    Buffer write operations on a collection and send them in `bulk_write`
+    calls from a background thread, when `batch_size` operations are pending
+    or `flush_interval` seconds after the first one
+    """
+
+    def __init__(self, get_collection, batch_size: int, flush_interval: float):
+        self.get_collection = get_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._operations = []
+        self._condition = Condition()
+        self._thread = None
+        self.writes = 0
+        self.bulk_writes = 0
+
+    def add(self, operation) -> None:
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(
+                    target=self._run, name="mongo-bulk-writer", daemon=True
+                )
+                self._thread.start()
+            self._operations.append(operation)
+            if len(self._operations) >= self.batch_size:
+                self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._operations:
+                    self._condition.wait()
+                self._condition.wait_for(
+                    lambda: len(self._operations) >= self.batch_size,
+                    timeout=self.flush_interval,
+                )
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the pending operations now
+        """
+        with self._condition:
+            operations, self._operations = self._operations, []
+        if not operations:
+            return
+        try:
+            self.get_collection().bulk_write(operations, ordered=False)
+            self.writes += len(operations)
+            self.bulk_writes += 1
+        except Exception as e:
+            print(f"Bulk write of {len(operations)} operations failed: {e}")
@@ -0,0 +1,207 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, List, Union
+
+from commons.mongo_utils import get_mongo_database
+from memory import Memory
+from settings import settings
+
+memory = Memory.getInstance()
+
+_cache_lock = Lock()
+
+
+def normalize_email(email: str) -> str:
+    """
+    Normalize an email before scoring it, so that the same address always
+    hits the same cache entry
+
+    Args:
+        email (str): The email as received
+
+    Returns:
+        str: the email without surrounding spaces and in lower case
+    """
+    return email.strip().lower()
+
+
+class InMemoryPredictionCache:
+    """
+    Size-bounded LRU cache of the predictions, with a TTL on each entry.
+    It lives in the memory of the current process.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model_id: str, emails: List[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for email in emails:
+                entry = self._entries.get((model_id, email))
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end((model_id, email))
+                    found[email] = entry[0]
+                    self.hits += 1
+                else:
+                    if entry is not None:
+                        del self._entries[(model_id, email)]
+                    self.misses += 1
+        return found
+
+    def set_many(self, model_id: str, probas: Dict[str, float]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for email, proba in probas.items():
+                self._entries[(model_id, email)] = (proba, expires_at)
+                self._entries.move_to_end((model_id, email))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keep_model_id: str = None) -> None:
+        with self._lock:
+            if keep_model_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] != keep_model_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class MongoPredictionCache:
+    """
+    Prediction cache shared by all the processes, stored in a MongoDB collection.
+    The entries expire through a TTL index, and the most recent ones are also
+    kept in an in-process LRU cache to avoid a round-trip for hot emails.
+    """
+
+    def __init__(self, collection, max_size: int, ttl: float) -> None:
+        self.collection = collection
+        self.ttl = ttl
+        self.local = InMemoryPredictionCache(max_size, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self.collection.create_index("model_id")
+
+    def get_many(self, model_id: str, emails: List[str]) -> Dict[str, float]:
+        found = self.local.get_many(model_id, emails)
+        missing = [email for email in emails if email not in found]
+        if not missing:
+            return found
+        shared = {
+            document["email"]: document["proba"]
+            for document in self.collection.find(
+                {
+                    "_id": {"$in": [f"{model_id}:{email}" for email in missing]},
+                    # the TTL monitor only runs every minute
+                    "expires_at": {"$gt": datetime.utcnow()},
+                }
+            )
+        }
+        self.hits += len(shared)
+        self.misses += len(missing) - len(shared)
+        self.local.set_many(model_id, shared)
+        found.update(shared)
+        return found
+
+    def set_many(self, model_id: str, probas: Dict[str, float]) -> None:
+        from pymongo import ReplaceOne
+
+        if not probas:
+            return
+        self.local.set_many(model_id, probas)
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        self.collection.bulk_write(
+            [
+                ReplaceOne(
+                    {"_id": f"{model_id}:{email}"},
+                    {
+                        "model_id": model_id,
+                        "email": email,
+                        "proba": proba,
+                        "expires_at": expires_at,
+                    },
+                    upsert=True,
+                )
+                for email, proba in probas.items()
+            ],
+            ordered=False,
+        )
+
+    def invalidate(self, keep_model_id: str = None) -> None:
+        self.local.invalidate(keep_model_id)
+        if keep_model_id is None:
+            self.collection.delete_many({})
+        else:
+            self.collection.delete_many({"model_id": {"$ne": keep_model_id}})
+
+    def stats(self) -> dict:
+        return {
+            "backend": "mongo",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "local": self.local.stats(),
+        }
+
+
+def get_prediction_cache() -> (
+    Union[InMemoryPredictionCache, MongoPredictionCache, None]
+):
+    """
+    Get the prediction cache of the current process, created on first use
+    according to settings.PREDICTION_CACHE_BACKEND
+
+    Returns:
+        Union[InMemoryPredictionCache, MongoPredictionCache, None]: the cache, None if caching is disabled
+    """
+    if memory.prediction_cache is None and settings.PREDICTION_CACHE_BACKEND != "none":
+        with _cache_lock:
+            if memory.prediction_cache is None:
+                if settings.PREDICTION_CACHE_BACKEND == "mongo":
+                    memory.prediction_cache = MongoPredictionCache(
+                        get_mongo_database()[settings.PREDICTION_CACHE_COL],
+                        max_size=settings.PREDICTION_CACHE_SIZE,
+                        ttl=settings.PREDICTION_CACHE_TTL,
+                    )
+                elif settings.PREDICTION_CACHE_BACKEND == "memory":
+                    memory.prediction_cache = InMemoryPredictionCache(
+                        max_size=settings.PREDICTION_CACHE_SIZE,
+                        ttl=settings.PREDICTION_CACHE_TTL,
+                    )
+                else:
+                    raise Exception(
+                        f"Unknown prediction cache backend '{settings.PREDICTION_CACHE_BACKEND}'"
+                    )
+    return memory.prediction_cache
+
+
+def invalidate_prediction_cache(keep_model_id: str = None) -> None:
+    """
+    Drop the cached predictions of every model but `keep_model_id`
+
+    Args:
+        keep_model_id (str, optional): The id of the model now serving. Defaults to None, dropping everything.
+    """
+    cache = get_prediction_cache()
+    if cache is not None:
+        cache.invalidate(keep_model_id)
@@ -0,0 +1,212 @@
+import math
+import time
+from typing import Callable
+
+import numpy as np
+
+from commons.constants import SEED
+from commons.model_data_class import ModelTypes, check_training_options
+from settings import settings
+
+# the iterations added to a histogram-based boosting between two progress checks
+HIST_GRADIENT_BOOSTING_CHUNK = 10
+# the minimal decrease of the validation loss counted as an improvement
+EARLY_STOPPING_TOL = 1e-4
+
+
+def _log_loss(y: np.ndarray, raw_predictions: np.ndarray) -> float:
+    # the binomial deviance of the raw predictions of a binary classifier, halved
+    return float(np.mean(np.logaddexp(0, raw_predictions) - y * raw_predictions))
+
+
+class TrainingMonitor:
+    """
+    Control the fit of a model: stop it when its loss on a validation split
+    stops improving, or at an iteration or a wall-clock budget, and report its
+    progress (iteration, validation loss and accuracy) every
+    TRAINING_PROGRESS_INTERVAL seconds.
+
+    The boosting models are followed iteration by iteration, the linear models
+    only get the early stopping and the iteration budget of their own solver.
+    """
+
+    def __init__(
+        self,
+        model_type: str,
+        options: dict = None,
+        progress: Callable[[dict], None] = None,
+    ) -> None:
+        self.model_type = ModelTypes(model_type)
+        options = options or {}
+        check_training_options(model_type, options)
+        self.early_stopping = options.get("early_stopping", False)
+        self.validation_fraction = options.get("validation_fraction", 0.1)
+        self.n_iter_no_change = options.get("n_iter_no_change", 10)
+        self.max_iterations = options.get("max_iterations")
+        self.max_seconds = options.get("max_seconds")
+        if self.max_seconds is None and settings.TRAINING_MAX_SECONDS:
+            self.max_seconds = settings.TRAINING_MAX_SECONDS
+        self.progress = progress
+
+        self.start = None
+        self.last_report = -math.inf
+        self.iteration = 0
+        self.n_iterations = None
+        self.stop_reason = None
+        self.validation_loss = None
+        self.validation_accuracy = None
+        self._best_loss = math.inf
+        self._best_iteration = 0
+        self._capped = False
+
+    def report(self, force: bool = False) -> None:
+        """
+        Send the progress of the fit, at most every TRAINING_PROGRESS_INTERVAL seconds
+        """
+        now = time.monotonic()
+        if self.progress is None or (
+            not force and now - self.last_report < settings.TRAINING_PROGRESS_INTERVAL
+        ):
+            return
+        self.last_report = now
+        self.progress({"stage": "fit", **self.summary()})
+
+    def summary(self) -> dict:
+        """
+        The state of the fit: the iterations done, the validation scores and
+        why it stopped before its last iteration, if it did
+        """
+        return {
+            "iteration": self.iteration,
+            "n_iterations": self.n_iterations,
+            "validation_loss": self.validation_loss,
+            "validation_accuracy": self.validation_accuracy,
+            "stop_reason": self.stop_reason,
+            "seconds": time.monotonic() - self.start if self.start else 0.0,
+        }
+
+    def _out_of_time(self) -> bool:
+        if self.max_seconds and time.monotonic() - self.start >= self.max_seconds:
+            self.stop_reason = self.stop_reason or "max_seconds"
+        return self.stop_reason is not None
+
+    def _cap_iterations(self, n_iterations: int) -> int:
+        if self.max_iterations and self.max_iterations < n_iterations:
+            self._capped = True
+            return self.max_iterations
+        return n_iterations
+
+    def fit(self, model, X, y):
+        """
+        Fit a model built by `build_model` under the control of the monitor
+
+        Args:
+            model: The classifier
+            X: The training features
+            y: The training labels
+
+        Returns:
+            the fitted classifier
+        """
+        self.start = time.monotonic()
+        if self.model_type == ModelTypes.GradientBoosting:
+            self._fit_gradient_boosting(model, X, y)
+        elif self.model_type == ModelTypes.HistGradientBoosting:
+            self._fit_hist_gradient_boosting(model, X, y)
+        else:
+            self._fit_linear(model, X, y)
+        if self.stop_reason is None and self._capped:
+            self.stop_reason = "max_iterations"
+        self.report(force=True)
+        return model
+
+    def _fit_gradient_boosting(self, model, X, y) -> None:
+        from sklearn.model_selection import train_test_split
+
+        model.set_params(n_estimators=self._cap_iterations(model.n_estimators))
+        self.n_iterations = model.n_estimators
+        X_val = y_val = raw_val = None
+        if self.early_stopping:
+            X, X_val, y, y_val = train_test_split(
+                X,
+                y,
+                test_size=self.validation_fraction,
+                stratify=y,
+                random_state=SEED,
+            )
+            X_val = X_val.astype(np.float32)
+
+        def monitor(iteration: int, estimator, _) -> bool:
+            nonlocal raw_val
+            self.iteration = iteration + 1
+            if X_val is not None:
+                # the raw predictions of the validation rows, one tree at a time
+                if raw_val is None:
+                    raw_val = estimator._raw_predict_init(X_val)[:, 0].astype(
+                        np.float64
+                    )
+                raw_val += estimator.learning_rate * estimator.estimators_[
+                    iteration, 0
+                ].predict(X_val)
+                self.validation_loss = _log_loss(y_val, raw_val)
+                self.validation_accuracy = float(np.mean((raw_val > 0) == y_val))
+                if self.validation_loss < self._best_loss - EARLY_STOPPING_TOL:
+                    self._best_loss, self._best_iteration = (
+                        self.validation_loss,
+                        self.iteration,
+                    )
+                elif self.iteration - self._best_iteration >= self.n_iter_no_change:
+                    self.stop_reason = "early_stopping"
+            stop = self._out_of_time()
+            self.report()
+            return stop
+
+        model.fit(X, y, monitor=monitor)
+
+    def _fit_hist_gradient_boosting(self, model, X, y) -> None:
+        # the densifying step, then the boosting grown by chunks of iterations
+        densify, classifier = model.steps[0][1], model.steps[-1][1]
+        X = densify.fit_transform(X)
+        self.n_iterations = self._cap_iterations(classifier.max_iter)
+        # explicit, the "auto" default of sklearn stops early above 10000 rows
+        classifier.set_params(early_stopping=self.early_stopping)
+        if self.early_stopping:
+            classifier.set_params(
+                validation_fraction=self.validation_fraction,
+                n_iter_no_change=self.n_iter_no_change,
+            )
+        # the validation split is drawn once, at the first chunk
+        classifier.set_params(warm_start=True)
+        while self.iteration < self.n_iterations:
+            classifier.set_params(
+                max_iter=min(
+                    self.iteration + HIST_GRADIENT_BOOSTING_CHUNK, self.n_iterations
+                )
+            )
+            classifier.fit(X, y)
+            self.iteration = classifier.n_iter_
+            validation_score = getattr(classifier, "validation_score_", None)
+            if validation_score is not None and len(validation_score):
+                # the default scores are the opposite of the loss
+                self.validation_loss = -float(validation_score[-1])
+            if self.iteration < classifier.max_iter:
+                self.stop_reason = "early_stopping"
+            if self._out_of_time():
+                break
+            self.report()
+        classifier.set_params(warm_start=False, max_iter=self.n_iterations)
+
+    def _fit_linear(self, model, X, y) -> None:
+        params = {"max_iter": self._cap_iterations(model.max_iter)}
+        if self.early_stopping:
+            params.update(
+                early_stopping=True,
+                validation_fraction=self.validation_fraction,
+                n_iter_no_change=self.n_iter_no_change,
+            )
+        model.set_params(**params)
+        self.n_iterations = model.max_iter
+        model.fit(X, y)
+        self.iteration = int(np.max(model.n_iter_))
+        if self.early_stopping and self.iteration < self.n_iterations:
+            self.stop_reason = "early_stopping"
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+SCENARIOS = {
+    "publish": ("POST", "/prediction/single/john.doe{i}@gmail.com"),
+    "registry": ("GET", "/model/registry/all"),
+    "task": ("GET", "/prediction/tasks/unknown-task-{i}"),
+}
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, method: str, path: str, requests: int, concurrency: int
+) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def user():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.request(
+                method, path.format(i=i), headers={"Authorization": "token"}
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user() for _ in range(concurrency)])
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def main(args) -> None:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        # in-process: in-memory broker and result backend, no RabbitMQ or MongoDB needed
+        os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+        os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+        from app import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://api", timeout=60
+        )
+
+    async with client:
+        for name in args.scenarios:
+            method, path = SCENARIOS[name]
+            # warm up the connections and the lazy initializations
+            await run_scenario(client, method, path, args.concurrency, args.concurrency)
+            result = await run_scenario(
+                client, method, path, args.requests, args.concurrency
+            )
+            print(
+                f"{name:>9}: {result['rps']:8.1f} req/s, p50 {result['p50_ms']:7.1f} ms, "
+                f"p99 {result['p99_ms']:7.1f} ms, {result['errors']} errors "
+                f"({args.requests} requests, {args.concurrency} concurrent)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Requests/s and latency of the API at high concurrency"
+    )
+    parser.add_argument(
+        "--url", help="URL of a running API, the app is served in-process if not set"
+    )
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    asyncio.run(main(parser.parse_args()))
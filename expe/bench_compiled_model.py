@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from commons.compiled_model import (  # noqa: E402
+    CompiledModel,
+    check_parity,
+    compile_pipeline,
+)
+from commons.constants import ALL_PATH, INTERESTING_COLUMN  # noqa: E402
+
+
+def timeit(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parity and speed of the compiled NumPy engine against the sklearn pipeline"
+    )
+    parser.add_argument("--model-id", default="default")
+    parser.add_argument("--atol", type=float, default=1e-9)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    pipeline = joblib.load(ALL_PATH.MODELS_FOLDER + args.model_id + ".joblib")
+    compiled = CompiledModel(compile_pipeline(pipeline))
+    emails = pd.read_csv(ALL_PATH.DATA_POINTS_FILES)[
+        INTERESTING_COLUMN.EMAIL_COLUMN
+    ].tolist()
+
+    # raises a ValueError if a probability differs by more than the tolerance
+    error = check_parity(pipeline, compiled, emails, args.atol)
+    print(
+        f"parity on {len(emails)} emails and the edge cases: max abs error {error:.3e}"
+    )
+
+    for size in [1, 100, len(emails)]:
+        batch = emails[:size]
+        repeat = max(1, args.repeat // size)
+        sklearn_time = timeit(
+            lambda: pipeline.predict_proba(
+                pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: batch})
+            ),
+            repeat,
+        )
+        compiled_time = timeit(lambda: compiled.predict_proba(batch), repeat)
+        print(
+            f"{size:>6} emails: sklearn {sklearn_time * 1000:9.3f} ms, "
+            f"compiled {compiled_time * 1000:9.3f} ms, "
+            f"speedup x{sklearn_time / compiled_time:.1f}"
+        )
@@ -0,0 +1,47 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+from commons.constants import ALL_PATH, INTERESTING_COLUMN  # noqa: E402
+from commons.model_serving import (  # noqa: E402
+    get_micro_batcher,
+    get_serving_pipeline,
+    predict_email_proba,
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput of concurrent single predictions with and without micro-batching"
+    )
+    parser.add_argument("-n", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    emails = (
+        pd.read_csv(ALL_PATH.DATA_POINTS_FILES)[INTERESTING_COLUMN.EMAIL_COLUMN]
+        .head(args.n)
+        .tolist()
+    )
+    _, pipeline = get_serving_pipeline()
+
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda email: predict_email_proba(pipeline, email), emails))
+        unbatched = len(emails) / (time.perf_counter() - start)
+
+        batcher = get_micro_batcher()
+        start = time.perf_counter()
+        list(executor.map(batcher.predict, emails))
+        batched = len(emails) / (time.perf_counter() - start)
+
+    print(f"without micro-batching: {unbatched:10.1f} predictions/s")
+    print(f"with micro-batching:    {batched:10.1f} predictions/s")
+    print(json.dumps(batcher.stats(), indent=2))
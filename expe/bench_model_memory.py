@@ -0,0 +1,101 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commons.constants import ALL_PATH  # noqa: E402
+
+EMAILS = ["john.doe@gmail.com", "fraude@free.fr", "élève.ça@école.fr"] * 10
+
+
+def memory_usage() -> dict:
+    """
+    RSS and PSS of the current process in MB. The PSS splits the shared
+    pages between the processes mapping them, so it shows the sharing.
+    """
+    usage = {}
+    with open("/proc/self/smaps_rollup") as file:
+        for line in file:
+            key, value = line.split(":", 1)
+            if key in ("Rss", "Pss"):
+                usage[key.lower()] = int(value.split()[0]) / 1024
+    return usage
+
+
+def worker(mode: str, model_id: str, results, done) -> None:
+    import joblib
+    import pandas as pd
+
+    from commons.compiled_model import CompiledModel
+    from commons.constants import INTERESTING_COLUMN
+
+    if mode == "joblib":
+        # the sklearn modules are not part of the model memory
+        import sklearn.compose  # noqa: F401
+        import sklearn.ensemble  # noqa: F401
+        import sklearn.feature_extraction.text  # noqa: F401
+
+    before = memory_usage()
+    start = time.perf_counter()
+    if mode == "joblib":
+        model = joblib.load(ALL_PATH.MODELS_FOLDER + model_id + ".joblib")
+        emails = pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: EMAILS})
+    else:
+        model = CompiledModel.load(
+            ALL_PATH.MODELS_FOLDER + model_id + ".compiled",
+            mmap_mode="r" if mode == "mmap" else None,
+        )
+        emails = EMAILS
+    load_time = time.perf_counter() - start
+    # score once, so that the pages used for scoring are touched
+    model.predict_proba(emails)
+    after = memory_usage()
+    results.put({"before": before, "after": after, "load_time": load_time})
+    # stay alive until every worker is measured, so that the pages are shared
+    done.wait()
+
+
+def run(mode: str, model_id: str, n_workers: int) -> list:
+    # spawned processes load the model on their own, like gunicorn or celery workers
+    context = multiprocessing.get_context("spawn")
+    results, done = context.Queue(), context.Event()
+    processes = [
+        context.Process(target=worker, args=(mode, model_id, results, done))
+        for _ in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    measures = [results.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+    return measures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memory of the worker processes serving a model, per artifact format"
+    )
+    parser.add_argument("--model-id", default="default")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if not os.path.isdir(ALL_PATH.MODELS_FOLDER + args.model_id + ".compiled"):
+        from commons.model_training import load_model
+
+        load_model(args.model_id)
+
+    for mode in ["joblib", "compiled", "mmap"]:
+        measures = run(mode, args.model_id, args.workers)
+        rss = sum(m["after"]["rss"] - m["before"]["rss"] for m in measures)
+        pss = sum(m["after"]["pss"] - m["before"]["pss"] for m in measures)
+        load_time = sum(m["load_time"] for m in measures) / len(measures)
+        print(
+            f"{mode:>8}: model RSS {rss / len(measures):7.2f} MB/worker, "
+            f"model PSS {pss:7.2f} MB for {len(measures)} workers, "
+            f"worker total RSS {sum(m['after']['rss'] for m in measures) / len(measures):7.1f} MB, "
+            f"load {load_time * 1000:7.2f} ms"
+        )
@@ -0,0 +1,170 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# starts a worker, with a filesystem broker shared between the processes when
+# no broker is given
+WORKER = """
+import sys
+from worker import celery
+from workers.__main__ import worker_argv
+if %(folder)r:
+    celery.conf.update(broker_transport_options=%(transport_options)r)
+argv = worker_argv(%(queue)r, "warning")
+if %(shared)r:
+    # all the queues in one solo worker
+    argv[1:4] = ["--queues=%(all_queues)s", "--pool=solo", "--concurrency=1"]
+celery.worker_main(argv)
+"""
+
+
+def transport_options(folder: str) -> dict:
+    return {
+        "data_folder_in": folder,
+        "data_folder_out": folder,
+        "polling_interval": 0.01,
+    }
+
+
+def start_workers(shared: bool, folder: str, env: dict) -> list:
+    from settings import settings
+
+    queues = [settings.INFERENCE_QUEUE, settings.TRAINING_QUEUE, settings.CONTROL_QUEUE]
+    if shared:
+        queues = queues[:1]
+    processes = []
+    for queue in queues:
+        code = WORKER % {
+            "folder": folder,
+            "transport_options": transport_options(folder) if folder else None,
+            "queue": queue,
+            "shared": shared,
+            "all_queues": ",".join(
+                [
+                    settings.INFERENCE_QUEUE,
+                    settings.TRAINING_QUEUE,
+                    settings.CONTROL_QUEUE,
+                ]
+            ),
+        }
+        processes.append(
+            subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env)
+        )
+    return processes
+
+
+def latencies(results: list, sent: list) -> list:
+    # the completion date is written by the worker, on the same clock
+    return [
+        (result.date_done - start).total_seconds()
+        for result, start in zip(results, sent)
+    ]
+
+
+def run(args, shared: bool, folder: str) -> dict:
+    from celery import states
+
+    from commons.constants import DEFAULT_PARAMS
+    from worker import celery
+
+    processes = start_workers(shared, folder, os.environ.copy())
+    try:
+        # wait for the serving model to be loaded
+        celery.send_task(
+            "workers.tasks.check_one_email_task", args=["warm.up@gmail.com"]
+        ).get(timeout=300)
+
+        params = {
+            "model_params": dict(
+                DEFAULT_PARAMS["model_params"], n_estimators=args.n_estimators
+            ),
+            "tf_idf_params": dict(DEFAULT_PARAMS["tf_idf_params"]),
+        }
+        training = celery.send_task(
+            "workers.tasks.train_model_task",
+            args=[
+                {
+                    "name": "bench-queue-isolation",
+                    "model_type": "GradientBoosting",
+                    "model_params": params,
+                }
+            ],
+        )
+        time.sleep(args.interval)
+
+        results, sent = [], []
+        for i in range(args.predictions):
+            sent.append(datetime.utcnow())
+            results.append(
+                celery.send_task(
+                    "workers.tasks.check_one_email_task",
+                    args=[f"john.doe{i}@gmail.com"],
+                )
+            )
+            time.sleep(args.interval)
+        training.get(timeout=3600)
+        for result in results:
+            result.get(timeout=3600)
+        assert all(result.state == states.SUCCESS for result in results)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    values = sorted(latencies(results, sent))
+    return {
+        "p50_ms": statistics.median(values) * 1000,
+        "p99_ms": values[max(int(len(values) * 0.99) - 1, 0)] * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency of the predictions sent while a model is training, "
+        "with one worker for all the queues and with one worker per queue"
+    )
+    parser.add_argument(
+        "--broker",
+        help="URL of a running broker, a filesystem broker in a temporary folder if not set",
+    )
+    parser.add_argument("--predictions", type=int, default=200)
+    parser.add_argument(
+        "--interval", type=float, default=0.05, help="seconds between two predictions"
+    )
+    parser.add_argument("--n-estimators", type=int, default=200)
+    args = parser.parse_args()
+
+    folder = None
+    if args.broker:
+        os.environ["CELERY_BROKER_URL"] = args.broker
+    else:
+        folder = tempfile.mkdtemp()
+        os.environ["CELERY_BROKER_URL"] = "filesystem://"
+        os.environ.setdefault("CELERY_RESULT_BACKEND", f"file://{folder}/results")
+        os.makedirs(f"{folder}/results")
+    os.environ.setdefault("PREDICTION_RESULT_BACKEND", "default")
+    # the inference worker only loads the serving model
+    os.environ.setdefault("WORKER_PRELOAD_TRAINING", "false")
+
+    from worker import celery
+
+    if folder:
+        celery.conf.update(broker_transport_options=transport_options(folder))
+
+    for name, shared in [("one worker", True), ("per queue", False)]:
+        result = run(args, shared, folder)
+        print(
+            f"{name:>10}: p50 {result['p50_ms']:8.1f} ms, p99 {result['p99_ms']:8.1f} ms, "
+            f"max {result['max_ms']:8.1f} ms ({args.predictions} predictions "
+            f"during a training)"
+        )
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["sklearn", "pandas", "scipy", "joblib"]
+
+# imports the FastAPI app, as uvicorn does
+API_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+import app
+print(json.dumps({
+    "import": time.perf_counter() - start,
+    "modules": [m for m in %(heavy)r if m in sys.modules],
+}))
+"""
+
+# imports the tasks module, as `celery -A worker worker` does, then starts a pool
+# process: the process accepts tasks after the import, and is ready to score
+# once the serving model is loaded in the background
+WORKER_STARTUP = """
+import json, sys, time
+sys.argv.append("worker")
+start = time.perf_counter()
+import workers.tasks
+imported = time.perf_counter() - start
+modules = [m for m in %(heavy)r if m in sys.modules]
+workers.tasks.start_model_deployer()
+from commons.model_deployment import get_model_deployer
+ready = get_model_deployer().wait_ready(timeout=600)
+print(json.dumps({
+    "import": imported,
+    "ready": time.perf_counter() - start if ready else None,
+    "modules": modules,
+}))
+"""
+
+
+def measure(code: str, repeat: int, env: dict) -> dict:
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code % {"heavy": HEAVY_MODULES}],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    result = {"modules": runs[-1]["modules"]}
+    for key in runs[-1]:
+        if key != "modules" and runs[-1][key] is not None:
+            result[key] = statistics.median(run[key] for run in runs)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Startup time of the API and of a worker process"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # no preload of the training modules, to time the path to the first prediction
+    env = dict(os.environ, WORKER_PRELOAD_TRAINING="false")
+    for name, code in [("api", API_STARTUP), ("worker", WORKER_STARTUP)]:
+        result = measure(code, args.repeat, env)
+        times = ", ".join(
+            f"{key} {value * 1000:.0f} ms"
+            for key, value in result.items()
+            if key != "modules"
+        )
+        print(f"{name:>6}: {times}, ML modules imported: {result['modules'] or 'none'}")
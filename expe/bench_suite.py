@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+GROUPS = ["scoring", "training", "registry", "e2e"]
+
+# variants of DEFAULT_PARAMS trained on the whole dataset
+TRAINING_VARIANTS = {
+    "default": ({}, {}),
+    "n_estimators=100": ({"n_estimators": 100}, {}),
+    "max_features=2000": ({}, {"max_features": 2000}),
+    "ngram_range=2-4": ({}, {"ngram_range": (2, 4)}),
+}
+
+
+def summary(durations: list, rows: int = None) -> dict:
+    """
+    Summarize the durations (seconds) of the runs of a benchmark
+    """
+    durations = sorted(durations)
+    result = {
+        "runs": len(durations),
+        "median_s": statistics.median(durations),
+        "min_s": durations[0],
+        "p90_s": durations[max(int(len(durations) * 0.9) - 1, 0)],
+    }
+    if rows:
+        result["rows"] = rows
+        result["rows_per_s"] = rows / result["median_s"]
+    return result
+
+
+def repeat(function, runs: int) -> list:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def load_emails(count: int) -> list:
+    from commons.dataset import load_dataset
+
+    emails = load_dataset().emails.astype(object).tolist()
+    return (emails * (count // len(emails) + 1))[:count]
+
+
+def bench_scoring(args) -> list:
+    import joblib
+    import pandas as pd
+
+    from commons.compiled_model import CompiledModel
+    from commons.constants import ALL_PATH, INTERESTING_COLUMN
+
+    path = ALL_PATH.MODELS_FOLDER + args.model_id
+    models = {
+        "pipeline": joblib.load(path + ".joblib"),
+        "compiled": CompiledModel.load(path + ".compiled"),
+    }
+    results = []
+    for size in [1, 100, 10000]:
+        emails = load_emails(size)
+        frame = pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: emails})
+        for name, model in models.items():
+            X = emails if name == "compiled" else frame
+            model.predict_proba(X)
+            # as many runs as it takes for about a second, at least 5
+            start = time.perf_counter()
+            model.predict_proba(X)
+            runs = max(5, min(1000, int(1 / max(time.perf_counter() - start, 1e-6))))
+            durations = repeat(lambda: model.predict_proba(X), runs * args.repeat)
+            results.append(
+                dict(
+                    group="scoring",
+                    name=f"predict_proba/{name}/{size}",
+                    **summary(durations, size),
+                )
+            )
+    return results
+
+
+def bench_training(args) -> list:
+    from commons.constants import DEFAULT_PARAMS, SEED
+    from commons.dataset import load_dataset
+    from commons.feature_cache import get_features
+    from commons.model_training import build_model
+
+    dataset = load_dataset()
+    train_indices, test_indices = dataset.split(seed=SEED)
+
+    def train(model_params: dict, tf_idf_params: dict, fraction: float) -> dict:
+        indices = train_indices[: int(len(train_indices) * fraction)]
+        start = time.perf_counter()
+        _, X_train, _ = get_features(dataset, tf_idf_params, indices, test_indices)
+        features = time.perf_counter() - start
+        build_model("GradientBoosting", model_params).fit(
+            X_train, dataset.labels[indices]
+        )
+        return {"features": features, "total": time.perf_counter() - start}
+
+    runs = []
+    for name, (model_params, tf_idf_params) in TRAINING_VARIANTS.items():
+        runs.append(
+            (
+                f"train/{name}",
+                dict(DEFAULT_PARAMS["model_params"], **model_params),
+                dict(DEFAULT_PARAMS["tf_idf_params"], **tf_idf_params),
+                1.0,
+            )
+        )
+    for fraction in [0.25, 0.5]:
+        runs.append(
+            (
+                f"train/default/rows={fraction}",
+                dict(DEFAULT_PARAMS["model_params"]),
+                dict(DEFAULT_PARAMS["tf_idf_params"]),
+                fraction,
+            )
+        )
+
+    results = []
+    for name, model_params, tf_idf_params, fraction in runs:
+        timings = [
+            train(model_params, tf_idf_params, fraction) for _ in range(args.repeat)
+        ]
+        result = summary(
+            [timing["total"] for timing in timings],
+            int(len(train_indices) * fraction),
+        )
+        result["features_median_s"] = statistics.median(
+            timing["features"] for timing in timings
+        )
+        results.append(dict(group="training", name=name, **result))
+    return results
+
+
+def bench_registry(args) -> list:
+    from commons.model_registry import SQLiteModelRegistry
+
+    results = []
+    for count in [10, 100, 1000]:
+        with tempfile.TemporaryDirectory() as folder:
+            registry = SQLiteModelRegistry(os.path.join(folder, "registry.sqlite3"))
+            documents = [
+                {
+                    "id": f"model-{i}",
+                    "name": f"model {i}",
+                    "accuracy": 0.9,
+                    "train_date": f"2024-01-01 00:{i % 60:02d}",
+                    "serving": False,
+                    "params": {"model_params": {"n_estimators": i}},
+                }
+                for i in range(count)
+            ]
+            start = time.perf_counter()
+            for document in documents:
+                registry.upsert(document)
+            upsert = (time.perf_counter() - start) / count
+            operations = {
+                "upsert": [upsert],
+                "all": repeat(registry.all, 10 * args.repeat),
+                "get": repeat(
+                    lambda: registry.get(f"model-{count // 2}"), 100 * args.repeat
+                ),
+                "set_serving": repeat(
+                    lambda: registry.set_serving(f"model-{count - 1}"), 10 * args.repeat
+                ),
+                "serving_id": repeat(registry.serving_id, 100 * args.repeat),
+                "version": repeat(registry.version, 100 * args.repeat),
+            }
+        for operation, durations in operations.items():
+            results.append(
+                dict(
+                    group="registry",
+                    name=f"{operation}/{count}_models",
+                    **summary(durations),
+                )
+            )
+    return results
+
+
+async def load(request, requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def user():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            if not await request(i):
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user() for _ in range(concurrency)])
+    duration = time.perf_counter() - start
+    result = summary(latencies)
+    result["p99_s"] = sorted(latencies)[max(int(len(latencies) * 0.99) - 1, 0)]
+    result["requests_per_s"] = len(latencies) / duration
+    result["errors"] = errors
+    return result
+
+
+async def bench_e2e_scenarios(client, args) -> list:
+    headers = {"Authorization": "token"}
+    emails = load_emails(100)
+
+    async def sync_single(i):
+        response = await client.post(
+            f"/prediction/single/john.doe{i}@gmail.com?sync=true", headers=headers
+        )
+        return response.status_code == 201
+
+    async def sync_batch(i):
+        response = await client.post(
+            "/prediction/batch?sync=true", json={"emails": emails}, headers=headers
+        )
+        return response.status_code == 201
+
+    async def registry(i):
+        response = await client.get("/model/registry/all", headers=headers)
+        return response.status_code == 200
+
+    async def round_trip(i):
+        # published to the broker, scored by a worker, read back by long-poll
+        response = await client.post(
+            f"/prediction/single/jane.doe{i}@gmail.com?sync=false", headers=headers
+        )
+        task_id = response.json()["task_id"]
+        response = await client.get(
+            f"/prediction/tasks/{task_id}", params={"wait": 30}, headers=headers
+        )
+        return response.status_code == 200
+
+    scenarios = {
+        "sync_single": (sync_single, args.requests),
+        "sync_batch_100": (sync_batch, args.requests // 10),
+        "registry": (registry, args.requests),
+        "round_trip": (round_trip, args.requests // 4),
+    }
+    results = []
+    for name, (request, requests) in scenarios.items():
+        # warm up the connections, the model and the lazy initializations
+        await load(request, args.concurrency, args.concurrency)
+        result = await load(request, requests, args.concurrency)
+        results.append(dict(group="e2e", name=f"{name}/c={args.concurrency}", **result))
+    return results
+
+
+def bench_e2e(args) -> list:
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        return asyncio.run(_run_client(client, args))
+
+    from bench_queue_isolation import WORKER, transport_options
+    from settings import settings
+
+    folder = args.broker_folder
+    code = WORKER % {
+        "folder": folder,
+        "transport_options": transport_options(folder),
+        "queue": settings.INFERENCE_QUEUE,
+        "shared": False,
+        "all_queues": settings.INFERENCE_QUEUE,
+    }
+    worker = subprocess.Popen(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        env=os.environ.copy(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        from app import app
+        from worker import celery
+
+        celery.conf.update(broker_transport_options=transport_options(folder))
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://api", timeout=60
+        )
+        return asyncio.run(_run_client(client, args))
+    finally:
+        worker.terminate()
+        worker.wait()
+
+
+def use_local_stand_ins() -> str:
+    """
+    Configure a filesystem broker and result backend, shared by the API served
+    in-process and an inference worker process. To call before the settings
+    are imported.
+
+    Returns:
+        str: the folder of the broker
+    """
+    folder = tempfile.mkdtemp()
+    os.makedirs(os.path.join(folder, "results"))
+    os.environ["CELERY_BROKER_URL"] = "filesystem://"
+    os.environ["CELERY_RESULT_BACKEND"] = f"file://{folder}/results"
+    os.environ["PREDICTION_RESULT_BACKEND"] = "default"
+    os.environ["WORKER_PRELOAD_TRAINING"] = "false"
+    os.environ["WORKER_METRICS_PORT"] = "0"
+    return folder
+
+
+async def _run_client(client, args) -> list:
+    async with client:
+        return await bench_e2e_scenarios(client, args)
+
+
+def environment() -> dict:
+    import numpy
+    import sklearn
+
+    def git(*command):
+        try:
+            return subprocess.run(
+                ["git", *command], cwd=ROOT, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def compare(results: list, baseline_path: str, threshold: float) -> bool:
+    """
+    Print the change of the median duration of each benchmark against a
+    previous run, and return False if one of them is slower by more than `threshold`
+    """
+    with open(baseline_path) as file:
+        baseline = {
+            (result["group"], result["name"]): result
+            for result in json.load(file)["results"]
+        }
+    regression = False
+    for result in results:
+        previous = baseline.get((result["group"], result["name"]))
+        if previous is None:
+            continue
+        ratio = result["median_s"] / previous["median_s"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag, regression = "  REGRESSION", True
+        print(
+            f"{result['group']:>9} {result['name']:<40} "
+            f"{previous['median_s'] * 1000:10.3f} ms -> {result['median_s'] * 1000:10.3f} ms "
+            f"({ratio:5.2f}x){flag}",
+            file=sys.stderr,
+        )
+    return not regression
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the scoring, training, registry and end-to-end "
+        "paths, written as JSON to compare runs between commits"
+    )
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=GROUPS)
+    parser.add_argument("--output", help="JSON file of the results, stdout if not set")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown of a median reported as a regression",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs multiplier")
+    parser.add_argument(
+        "--model-id", default="default", help="model of the scoring group"
+    )
+    parser.add_argument("--url", help="URL of a running API for the e2e group")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    # the settings are read from the environment once, at their first import
+    if "training" in args.groups:
+        # the features are computed on each run, not read from the cache
+        os.environ["FEATURE_CACHE"] = "false"
+    args.broker_folder = None
+    if "e2e" in args.groups and not args.url:
+        args.broker_folder = use_local_stand_ins()
+
+    benches = {
+        "scoring": bench_scoring,
+        "training": bench_training,
+        "registry": bench_registry,
+        "e2e": bench_e2e,
+    }
+    results = []
+    for group in args.groups:
+        print(f"running the {group} benchmarks", file=sys.stderr)
+        results.extend(benches[group](args))
+
+    report = {"environment": environment(), "args": vars(args), "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
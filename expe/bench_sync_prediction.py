@@ -0,0 +1,65 @@
+import argparse
+import statistics
+import time
+
+import requests
+
+from expe_simon import SERVICE_POINT, request_api
+
+
+def summarize(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<20} n={len(latencies):<5} "
+        f"mean={statistics.mean(latencies) * 1000:9.2f} ms  "
+        f"p50={statistics.median(latencies) * 1000:9.2f} ms  "
+        f"p99={p99 * 1000:9.2f} ms"
+    )
+
+
+def bench_queue(email: str, n: int, poll_interval: float, wait: bool = False) -> list:
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        task = request_api(email, poll_interval=poll_interval, wait=wait)
+        task.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_sync(email: str, n: int) -> list:
+    latencies = []
+    with requests.Session() as session:
+        for _ in range(n):
+            start = time.perf_counter()
+            res = session.post(
+                f"{SERVICE_POINT}/prediction/single/{email}",
+                params={"sync": True},
+                headers={"Authorization": "token"},
+                timeout=3600,
+            )
+            res.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency of the queue-and-poll prediction path against the synchronous one"
+    )
+    parser.add_argument("--email", default="fraude@gmail.com")
+    parser.add_argument("-n", type=int, default=20)
+    parser.add_argument("--poll-intervals", type=float, nargs="+", default=[1.0, 0.05])
+    args = parser.parse_args()
+
+    # warm up the in-process pipeline of the API
+    bench_sync(args.email, 1)
+
+    summarize("sync", bench_sync(args.email, args.n))
+    for poll_interval in args.poll_intervals:
+        summarize(
+            f"queue (poll {poll_interval}s)",
+            bench_queue(args.email, args.n, poll_interval),
+        )
+    summarize("queue (long-poll)", bench_queue(args.email, args.n, 1.0, wait=True))
@@ -0,0 +1,100 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# the classifier parameters of each model type, on the default tf-idf features
+MODEL_TYPES = {
+    "GradientBoosting": {"n_estimators": 50, "learning_rate": 0.1},
+    "HistGradientBoosting": {"max_iter": 100, "learning_rate": 0.1},
+    "SGD": {"loss": "log_loss", "alpha": 1e-5, "max_iter": 50, "random_state": 0},
+    "LogisticRegression": {"C": 10.0, "max_iter": 1000},
+}
+
+
+def compare(args) -> list:
+    import numpy as np
+    from sklearn.pipeline import Pipeline
+
+    from commons.compiled_model import CompiledModel, compile_pipeline
+    from commons.constants import DEFAULT_PARAMS, SEED
+    from commons.dataset import load_dataset
+    from commons.feature_cache import get_features
+    from commons.model_training import build_model, fit_model
+
+    dataset = load_dataset()
+    train_indices, test_indices = dataset.split(seed=SEED)
+    y_train, y_test = dataset.labels[train_indices], dataset.labels[test_indices]
+    preprocessing, X_train, X_test = get_features(
+        dataset, dict(DEFAULT_PARAMS["tf_idf_params"]), train_indices, test_indices
+    )
+    test_frame = dataset.frame(test_indices)
+    test_emails = dataset.emails[test_indices].astype(object).tolist()
+
+    results = []
+    for model_type, model_params in MODEL_TYPES.items():
+        if args.model_types and model_type not in args.model_types:
+            continue
+        for n_threads in args.threads:
+            durations = []
+            for _ in range(args.repeat):
+                model = build_model(model_type, dict(model_params))
+                start = time.perf_counter()
+                fit_model(model, X_train, y_train, n_threads)
+                durations.append(time.perf_counter() - start)
+
+            # the compiled engine scores the raw emails as the pipeline (the
+            # histogram-based trees split on values of the features, a rounding
+            # difference of the tf-idf would send an email down another branch)
+            pipeline = Pipeline([("preprocessing", preprocessing), ("model", model)])
+            compiled = CompiledModel(compile_pipeline(pipeline))
+            expected = pipeline.predict_proba(test_frame)[:, 1]
+            actual = compiled.predict_proba(test_emails)[:, 1]
+            results.append(
+                {
+                    "model_type": model_type,
+                    "threads": n_threads,
+                    "fit_s": statistics.median(durations),
+                    "accuracy": model.score(X_test, y_test),
+                    "compiled_max_diff": float(np.abs(actual - expected).max()),
+                }
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Training time and accuracy of each model type on the default "
+        "tf-idf features, and the parity of their compiled scoring engine"
+    )
+    parser.add_argument("--model-types", nargs="*", choices=list(MODEL_TYPES))
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="*",
+        default=[1, os.cpu_count()],
+        help="threads of the fit, one run per value",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # the tf-idf matrices are computed once, never read from the cache
+    os.environ["FEATURE_CACHE"] = "false"
+
+    results = compare(args)
+    baseline = {
+        result["threads"]: result
+        for result in results
+        if result["model_type"] == "GradientBoosting"
+    }
+    for result in results:
+        reference = baseline.get(result["threads"])
+        speedup = f"x{reference['fit_s'] / result['fit_s']:5.1f}" if reference else ""
+        print(
+            f"{result['model_type']:>20} {result['threads']:>2} threads: fit "
+            f"{result['fit_s']:7.2f} s {speedup:>6}, accuracy {result['accuracy']:.4f}, "
+            f"compiled max diff {result['compiled_max_diff']:.1e}"
+        )
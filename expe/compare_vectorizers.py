@@ -0,0 +1,119 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from compare_model_types import MODEL_TYPES  # noqa: E402
+
+# the vectorizer and the parameters added to the default tf-idf parameters
+VECTORIZERS = {
+    "tfidf": ("tfidf", {}),
+    "hashing/2^14": ("hashing", {"n_features": 2**14}),
+    "hashing/2^16": ("hashing", {"n_features": 2**16}),
+    "hashing/2^18": ("hashing", {"n_features": 2**18}),
+}
+
+
+def artifact_size(pipeline) -> int:
+    # the size of the saved pipeline, and of its compiled engine if it compiles
+    import joblib
+
+    from commons.compiled_model import compile_pipeline, save_compiled_model
+
+    folder = tempfile.mkdtemp()
+    joblib.dump(pipeline, os.path.join(folder, "model.joblib"))
+    try:
+        save_compiled_model(
+            compile_pipeline(pipeline), os.path.join(folder, "model.compiled")
+        )
+    except ValueError:
+        pass
+    return sum(
+        os.path.getsize(os.path.join(path, file_name))
+        for path, _, file_names in os.walk(folder)
+        for file_name in file_names
+    )
+
+
+def compare(args) -> list:
+    import pandas as pd
+    from sklearn.pipeline import Pipeline
+
+    from commons.constants import DEFAULT_PARAMS, INTERESTING_COLUMN, SEED
+    from commons.dataset import load_dataset
+    from commons.feature_cache import get_features
+    from commons.model_training import build_model, fit_model
+
+    dataset = load_dataset()
+    train_indices, test_indices = dataset.split(seed=SEED)
+    y_train, y_test = dataset.labels[train_indices], dataset.labels[test_indices]
+    emails = dataset.emails[test_indices].astype(object).tolist()[:1000]
+    frame = pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: emails})
+
+    results = []
+    for name, (vectorizer, tf_idf_params) in VECTORIZERS.items():
+        tf_idf_params = dict(DEFAULT_PARAMS["tf_idf_params"], **tf_idf_params)
+        start = time.perf_counter()
+        preprocessing, X_train, X_test = get_features(
+            dataset, tf_idf_params, train_indices, test_indices, vectorizer
+        )
+        featurize_s = time.perf_counter() - start
+        # the peak memory in a second run, the tracing slows the allocations down
+        tracemalloc.start()
+        get_features(dataset, tf_idf_params, train_indices, test_indices, vectorizer)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        model = build_model(args.model_type, dict(MODEL_TYPES[args.model_type]))
+        start = time.perf_counter()
+        fit_model(model, X_train, y_train)
+        fit_s = time.perf_counter() - start
+        pipeline = Pipeline([("preprocessing", preprocessing), ("model", model)])
+
+        durations = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            preprocessing.transform(frame)
+            durations.append(time.perf_counter() - start)
+        results.append(
+            {
+                "vectorizer": name,
+                "featurize_s": featurize_s,
+                "featurize_peak_mb": peak / 2**20,
+                "fit_s": fit_s,
+                "transform_1000_ms": statistics.median(durations) * 1000,
+                "artifact_mb": artifact_size(pipeline) / 2**20,
+                "accuracy": model.score(X_test, y_test),
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Featurization time and memory, fit time, artifact size and "
+        "accuracy of the tf-idf vectorizer and of the hashing vectorizer"
+    )
+    parser.add_argument(
+        "--model-type",
+        default="GradientBoosting",
+        choices=list(MODEL_TYPES),
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    # the features are computed, never read from the cache
+    os.environ["FEATURE_CACHE"] = "false"
+
+    for result in compare(args):
+        print(
+            f"{result['vectorizer']:>13}: featurize {result['featurize_s']:5.2f} s "
+            f"(peak {result['featurize_peak_mb']:6.1f} MB), fit {result['fit_s']:6.2f} s, "
+            f"transform 1000 {result['transform_1000_ms']:6.1f} ms, artifact "
+            f"{result['artifact_mb']:6.2f} MB, accuracy {result['accuracy']:.4f}"
+        )
@@ -5,23 +5,30 @@ import json
 SERVICE_POINT = "http://localhost:8005"
 
 
-def request_api(email: str, timeout=30):
-    batch_emb_url = f"{SERVICE_POINT}/prediction/single/fraude@gmail.com"
+def request_api(email: str, timeout=30, poll_interval=1, wait=False):
+    batch_emb_url = f"{SERVICE_POINT}/prediction/single/{email}"
 
     res = requests.post(batch_emb_url, headers={"Authorization": "token"}, timeout=3600)
     res_json = json.loads(res.text)
+    if "task_id" not in res_json:
+        # answered from the prediction cache, no task was sent
+        return res
 
     batch_emb_url_task = f'{SERVICE_POINT}/prediction/tasks/{res_json["task_id"]}'
 
+    # with wait, long-poll: the API holds the request until the task is finished
     task = requests.get(
-        batch_emb_url_task, headers={"Authorization": "token"}, timeout=3600
+        batch_emb_url_task,
+        params={"wait": timeout} if wait else None,
+        headers={"Authorization": "token"},
+        timeout=3600,
     )
 
     start_time = time.time()
     while task.status_code == 425:
         if time.time() - start_time > timeout:  # Timeout after 30 seconds
             break
-        time.sleep(1)
+        time.sleep(poll_interval)
         task = requests.get(
             batch_emb_url_task, headers={"Authorization": "token"}, timeout=3600
         )
@@ -2,6 +2,14 @@ class Memory:
     __instance = None
     model_deployed = None
     model_deployed_id = None
+    deployment = (None, None)
+    model_deployer = None
+    # "worker" in the processes of a Celery worker, set when the worker starts
+    process_role = "api"
+    micro_batcher = None
+    prediction_cache = None
+    model_registry = None
+    task_watcher = None
 
     @staticmethod
     def getInstance():
@@ -13,6 +21,15 @@ class Memory:
             Memory()
         return Memory.__instance
 
+    def swap_model(self, model_id, model):
+        """
+        Replace the deployed model. The (id, model) pair is swapped in one
+        assignment, so that a reader never sees the id of one model with another.
+        """
+        Memory.deployment = (model_id, model)
+        Memory.model_deployed_id = model_id
+        Memory.model_deployed = model
+
     def __init__(self):
         """
         Virtual private Constructor
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import the packages of the repository, like the scripts of expe/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.pipeline import Pipeline
+
+from commons import model_training
+from commons.compiled_model import (
+    PARITY_ATOL,
+    PARITY_EDGE_CASES,
+    CompiledModel,
+    check_parity,
+    compile_pipeline,
+)
+from commons.constants import INTERESTING_COLUMN
+from commons.feature_cache import build_preprocessing
+from commons.model_training import build_model, fit_model
+
+MODEL_PARAMS = {
+    "GradientBoosting": {"n_estimators": 20},
+    "HistGradientBoosting": {"max_iter": 20, "min_samples_leaf": 5},
+    "SGD": {"random_state": 0},
+    "LogisticRegression": {"max_iter": 1000},
+}
+# n-grams never seen in the training emails, non-ASCII characters and accents
+EDGE_CASES = PARITY_EDGE_CASES + [
+    "qqqq@zzzz.xx",
+    "ÀÉÎÕÜ@ÉCOLE.FR",
+    "çàèùâêîôû@mél.fr",
+    "ğüşıöç@örnek.com.tr",
+    "  padded@gmail.com  ",
+    " nbsp@gmail.com",
+    "emoji😀@gmail.com",
+]
+
+
+def _emails(n_emails: int, seed: int = 0):
+    # legit addresses of common providers, frauds with digits and odd domains
+    random_state = np.random.RandomState(seed)
+    names = ["john", "marie", "élodie", "françois", "anna", "paul", "zoé", "li"]
+    emails, labels = [], []
+    for _ in range(n_emails):
+        name = random_state.choice(names)
+        if random_state.rand() < 0.5:
+            domain = random_state.choice(["gmail.com", "yahoo.fr", "orange.fr"])
+            emails.append(f"{name}.{random_state.choice(names)}@{domain}")
+            labels.append(0)
+        else:
+            digits = random_state.randint(10**3, 10**6)
+            domain = random_state.choice(["xyz.ru", "win-prize.biz", "ca$h.top"])
+            emails.append(f"{name}{digits}@{domain}")
+            labels.append(1)
+    return emails, np.array(labels)
+
+
+def _fit_pipeline(model_type: str, tf_idf_params: dict) -> Pipeline:
+    emails, labels = _emails(400)
+    preprocessing = build_preprocessing(tf_idf_params)
+    X = preprocessing.fit_transform(
+        pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: emails})
+    )
+    model = build_model(model_type, dict(MODEL_PARAMS[model_type]))
+    fit_model(model, X, labels)
+    return Pipeline([("preprocessing", preprocessing), ("model", model)])
+
+
+def _assert_parity(pipeline: Pipeline, emails: list) -> None:
+    compiled = CompiledModel(compile_pipeline(pipeline))
+    expected = pipeline.predict_proba(
+        pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: emails})
+    )
+    np.testing.assert_allclose(
+        compiled.predict_proba(emails), expected, rtol=0, atol=PARITY_ATOL
+    )
+    # one email at a time, as the single predictions
+    for email in emails:
+        expected = pipeline.predict_proba(
+            pd.DataFrame({INTERESTING_COLUMN.EMAIL_COLUMN: [email]})
+        )
+        np.testing.assert_allclose(
+            compiled.predict_proba([email]), expected, rtol=0, atol=PARITY_ATOL
+        )
+
+
+@pytest.mark.parametrize("analyzer", ["char", "char_wb"])
+@pytest.mark.parametrize("model_type", list(MODEL_PARAMS))
+def test_parity(model_type: str, analyzer: str):
+    pipeline = _fit_pipeline(
+        model_type,
+        {
+            "analyzer": analyzer,
+            "ngram_range": (1, 3),
+            "strip_accents": "unicode",
+            "max_features": 300,
+        },
+    )
+    _assert_parity(pipeline, _emails(100, seed=1)[0] + EDGE_CASES)
+
+
+@pytest.mark.parametrize(
+    "tf_idf_params",
+    [
+        {"strip_accents": None, "lowercase": False},
+        {"strip_accents": "ascii", "sublinear_tf": True, "norm": "l1"},
+        {"binary": True, "use_idf": False, "norm": None},
+    ],
+)
+def test_parity_tf_idf_params(tf_idf_params: dict):
+    pipeline = _fit_pipeline(
+        "LogisticRegression",
+        {"analyzer": "char", "ngram_range": (2, 4), **tf_idf_params},
+    )
+    _assert_parity(pipeline, _emails(100, seed=1)[0] + EDGE_CASES)
+
+
+def test_parity_unseen_ngrams_only():
+    pipeline = _fit_pipeline(
+        "GradientBoosting", {"analyzer": "char", "ngram_range": (3, 5)}
+    )
+    compiled = CompiledModel(compile_pipeline(pipeline))
+    X = compiled.transform(["§§§§§", ""])
+    assert len(X.values) == 0
+    _assert_parity(pipeline, ["§§§§§", "¤¤¤"])
+
+
+def test_check_parity_raises_on_divergence():
+    pipeline = _fit_pipeline(
+        "LogisticRegression", {"analyzer": "char", "ngram_range": (1, 3)}
+    )
+    arrays = compile_pipeline(pipeline)
+    arrays["intercept"] = arrays["intercept"] + 1.0
+    with pytest.raises(ValueError):
+        check_parity(pipeline, CompiledModel(arrays), _emails(50, seed=1)[0])
+
+
+def test_save_compiled_model_skipped_on_divergence(tmp_path, monkeypatch):
+    pipeline = _fit_pipeline(
+        "GradientBoosting", {"analyzer": "char", "ngram_range": (1, 3)}
+    )
+    monkeypatch.setattr(model_training.ALL_PATH, "MODELS_FOLDER", f"{tmp_path}/")
+    monkeypatch.setattr(
+        "commons.dataset.load_dataset",
+        lambda: type("Dataset", (), {"emails": np.array(_emails(50, seed=1)[0])}),
+    )
+    assert model_training.saveCompiledModel(pipeline, "model")
+    assert (tmp_path / "model.compiled").is_dir()
+
+    def diverge(*args, **kwargs):
+        raise ValueError("diverges")
+
+    # the engine of the previous version of the model is not left for serving
+    monkeypatch.setattr(model_training, "check_parity", diverge)
+    assert not model_training.saveCompiledModel(pipeline, "model")
+    assert not (tmp_path / "model.compiled").exists()
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from commons import data_ingest
+from commons.data_ingest import append_labeled_emails
+
+
+def test_append_counts_the_rows_read_by_pandas(tmp_path):
+    path = str(tmp_path / "data_points.csv")
+    assert append_labeled_emails([("a@b.c", 0), ("multi\nline@b.c", 1)], path) == 2
+    assert append_labeled_emails([("d@e.f", 1)], path) == 3
+    assert len(pd.read_csv(path)) == 3
+
+
+def test_append_recounts_only_a_changed_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "data_points.csv")
+    append_labeled_emails([("a@b.c", 0)], path)
+    counts = []
+    count_rows = data_ingest._count_rows
+    monkeypatch.setattr(
+        data_ingest,
+        "_count_rows",
+        lambda file: counts.append(1) or count_rows(file),
+    )
+
+    assert append_labeled_emails([("b@c.d", 1)], path) == 2
+    assert counts == []
+
+    # rows written by something else than an append
+    with open(path, "a") as file:
+        file.write("e@f.g,0\nh@i.j,1\n")
+    assert append_labeled_emails([("k@l.m", 0)], path) == 5
+    assert counts == [1]
+    assert len(pd.read_csv(path)) == 5
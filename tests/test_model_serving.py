@@ -0,0 +1,38 @@
+import pytest
+
+from commons import model_serving
+from commons.prediction_cache import InMemoryPredictionCache
+
+
+@pytest.fixture
+def scored(monkeypatch):
+    # records the emails given to the model, scored by their length
+    emails = []
+
+    def predict_emails_proba(pipeline, batch, chunk_size=None):
+        emails.extend(batch)
+        return [float(len(email)) for email in batch]
+
+    monkeypatch.setattr(model_serving, "predict_emails_proba", predict_emails_proba)
+    return emails
+
+
+def test_score_emails_scores_the_raw_emails(monkeypatch, scored):
+    cache = InMemoryPredictionCache(max_size=100, ttl=60)
+    monkeypatch.setattr(model_serving, "get_prediction_cache", lambda: cache)
+    emails = [" John@Gmail.com", "john@gmail.com", "Marie@Free.fr"]
+
+    probas = model_serving.score_emails("model", None, emails)
+
+    # one score per cache key, computed on the first email as received
+    assert scored == [" John@Gmail.com", "Marie@Free.fr"]
+    assert probas == [15.0, 15.0, 13.0]
+    assert cache.get_many("model", ["john@gmail.com"]) == {"john@gmail.com": 15.0}
+
+
+def test_score_emails_without_cache(monkeypatch, scored):
+    monkeypatch.setattr(model_serving, "get_prediction_cache", lambda: None)
+    emails = [" John@Gmail.com", "john@gmail.com"]
+
+    assert model_serving.score_emails("model", None, emails) == [15.0, 14.0]
+    assert scored == emails
@@ -7,11 +7,12 @@ from settings import settings
 api_key_header = APIKeyHeader(name="Authorization", auto_error=False)
 
 
-def check_auth_token(
+async def check_auth_token(
     api_key_header: str = Security(api_key_header),
 ):
     """
     A token middleware which helps to check is a Token is given in the query params.
+    It is a coroutine, so that it does not take a slot of the threadpool.
 
     :param api_key_header:
     :return:
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends
+from fastapi.openapi.models import APIKey
+from starlette import status
+
+from commons.data_ingest import append_labeled_emails
+from commons.model_data_class import LabeledEmailsInput
+from webapp.auth_controler import check_auth_token
+from webapp.utils.async_utils import run_io
+
+
+router = APIRouter(
+    prefix="/data",
+    tags=["To add labeled emails to the dataset"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+@router.post(
+    "/ingest",
+    summary="Append labeled emails to the dataset",
+    status_code=status.HTTP_201_CREATED,
+    response_description="The number of emails ingested and of rows of the dataset",
+)
+async def ingest_labeled_emails(
+    labeled_emails: LabeledEmailsInput,
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    """
+    The emails are used by the next trainings, and by the updates of the
+    models with hashed features (`POST /model/update/{model_id}`).
+    """
+    dataset_rows = await run_io(
+        append_labeled_emails,
+        [(example.email, example.label) for example in labeled_emails.examples],
+    )
+    return {
+        "ingested": len(labeled_emails.examples),
+        "dataset_rows": dataset_rows,
+    }
@@ -1,13 +1,24 @@
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.openapi.models import APIKey
+from pydantic import confloat
 from starlette import status
-from commons.model_data_class import ModelInput, ModelMetaData
+from starlette.responses import StreamingResponse
+from commons.model_data_class import (
+    EvaluationInput,
+    ModelInput,
+    ModelMetaData,
+    ModelUpdateInput,
+    SweepInput,
+)
 
 from memory import Memory
-from webapp.utils.celery_utils import get_task_info
+from settings import settings
+from webapp.utils.async_utils import run_io
+from webapp.utils.celery_utils import send_task_async
+from webapp.utils.task_watcher import read_task_info, task_event_stream
 from webapp.auth_controler import check_auth_token
-from workers.tasks import train_model_task, setup_main_model_task
+from commons.model_deployment import deploy_model, get_deployment_status
 from commons.model_training import get_all_models, get_model_meta_data
 
 memory = Memory.getInstance()
@@ -26,17 +37,81 @@ router = APIRouter(
     status_code=status.HTTP_201_CREATED,
     response_description="The metadata of the new model",
 )
-def model_training(
+async def model_training(
     model_input: ModelInput,
     api_key: APIKey = Depends(check_auth_token),
 ) -> dict:
-    result = train_model_task.delay(model_input.dict())
+    result = await send_task_async("train_model_task", model_input.dict())
     return {
         "task_id": result.task_id,
         "message": f"Model '{model_input.name}' of type '{model_input.model_type}' received and will be trained.",
     }
 
 
+@router.post(
+    "/sweep",
+    summary="train a grid or a random sample of models and rank them",
+    status_code=status.HTTP_201_CREATED,
+    response_description="The id of the task training the candidates",
+)
+async def model_sweep(
+    sweep_input: SweepInput,
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    result = await send_task_async("sweep_models_task", sweep_input.dict())
+    return {
+        "task_id": result.task_id,
+        "message": f"Sweep '{sweep_input.name}' of type '{sweep_input.model_type}' received and will be trained.",
+    }
+
+
+@router.post(
+    "/update/{model_id}",
+    summary="update a model with the labeled emails ingested since it was trained",
+    status_code=status.HTTP_201_CREATED,
+    response_description="The id of the task updating the model",
+)
+async def model_update(
+    model_id: str,
+    update_input: ModelUpdateInput,
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    if not await run_io(get_model_meta_data, model_id):
+        raise HTTPException(
+            detail="Model Not found", status_code=status.HTTP_404_NOT_FOUND
+        )
+    result = await send_task_async("update_model_task", model_id, update_input.dict())
+    return {
+        "task_id": result.task_id,
+        "message": f"Model '{model_id}' will be updated into '{update_input.name}'.",
+    }
+
+
+@router.post(
+    "/evaluate/{model_id}",
+    summary="cross-validate a model and store its metrics and scoring latency in the registry",
+    status_code=status.HTTP_201_CREATED,
+    response_description="The id of the task evaluating the model",
+)
+async def model_evaluation(
+    model_id: str,
+    evaluation_input: EvaluationInput,
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    if not await run_io(get_model_meta_data, model_id):
+        raise HTTPException(
+            detail="Model Not found", status_code=status.HTTP_404_NOT_FOUND
+        )
+    result = await send_task_async(
+        "evaluate_model_task", model_id, evaluation_input.dict()
+    )
+    return {
+        "task_id": result.task_id,
+        "message": f"Model '{model_id}' will be evaluated by a "
+        f"{evaluation_input.n_folds}-fold cross-validation.",
+    }
+
+
 @router.get(
     "/registry/all",
     summary="Get all the models",
@@ -44,10 +119,10 @@ def model_training(
     response_description="List of metadata of all the models",
     response_model=List[ModelMetaData],
 )
-def get_all_models_registered(
+async def get_all_models_registered(
     api_key: APIKey = Depends(check_auth_token),
 ) -> List[dict]:
-    all_model = get_all_models()
+    all_model = await run_io(get_all_models)
     if not all_model:
         return []
     return list(all_model.values())
@@ -60,11 +135,11 @@ def get_all_models_registered(
     response_description="The metadata of the model",
     response_model=ModelMetaData,
 )
-def get_model(
+async def get_model(
     model_id: str,
     api_key: APIKey = Depends(check_auth_token),
 ) -> dict:
-    model = get_model_meta_data(model_id)
+    model = await run_io(get_model_meta_data, model_id)
     if not model:
         raise HTTPException(
             detail="Model Not found", status_code=status.HTTP_404_NOT_FOUND
@@ -78,20 +153,21 @@ def get_model(
     status_code=status.HTTP_200_OK,
     response_description="If the model is successfully set as main",
 )
-def set_main_model(
+async def set_main_model(
     model_id: str,
     api_key: APIKey = Depends(check_auth_token),
 ) -> dict:
-    if model_id not in get_all_models():
+    if not await run_io(get_model_meta_data, model_id):
         raise HTTPException(
             detail="Model Not found", status_code=status.HTTP_404_NOT_FOUND
         )
     try:
-        task_result = setup_main_model_task.delay(model_id)
+        await run_io(deploy_model, model_id)
 
-        task_result.get()
-
-        return {"message": f"Model '{model_id}' is now the main model for prediction."}
+        return {
+            "message": f"Model '{model_id}' is now the main model for prediction, "
+            "it is being deployed on every worker and API process."
+        }
     except Exception as e:
         raise HTTPException(
             detail=f"Error setting the model as main: {e}",
@@ -99,15 +175,28 @@ def set_main_model(
         )
 
 
+@router.get(
+    "/deployments",
+    summary="Get the model deployed by each worker and API process",
+    status_code=status.HTTP_200_OK,
+    response_description="The serving model and the deployment status of each process",
+)
+async def get_deployments(
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    return await run_io(get_deployment_status)
+
+
 @router.get(
     "/tasks/{task_id}",
-    summary="Get the status of a task and if available the result",
+    summary="Get the status of a task and if available the result, waiting up to `wait` seconds for it to finish",
 )
-def get_task(
+async def get_task(
     task_id: str,
+    wait: confloat(ge=0) = 0,
     api_key: APIKey = Depends(check_auth_token),
 ):
-    task_info = get_task_info(task_id)
+    task_info = await read_task_info(task_id, wait)
     if not task_info or "task_status" not in task_info:
         raise HTTPException(
             detail="Task Not found", status_code=status.HTTP_404_NOT_FOUND
@@ -125,7 +214,32 @@ def get_task(
             status_code=status.HTTP_425_TOO_EARLY,
         )
 
+    if task_info["task_status"] == "PROGRESS":
+        # a training reporting its stage and the progress of its fit
+        raise HTTPException(
+            detail={
+                "message": "Task is PROGRESS",
+                "progress": task_info["task_result"],
+            },
+            status_code=status.HTTP_425_TOO_EARLY,
+        )
+
     raise HTTPException(
         detail="Task is Running, Pending or Cancelled",
         status_code=status.HTTP_400_BAD_REQUEST,
     )
+
+
+@router.get(
+    "/tasks/{task_id}/stream",
+    summary="Stream the states of a task as server-sent events until it is finished",
+)
+async def stream_task(
+    task_id: str,
+    timeout: confloat(gt=0) = settings.TASK_STREAM_MAX,
+    api_key: APIKey = Depends(check_auth_token),
+):
+    return StreamingResponse(
+        task_event_stream(task_id, min(timeout, settings.TASK_STREAM_MAX)),
+        media_type="text/event-stream",
+    )
@@ -1,11 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.openapi.models import APIKey
+from pydantic import confloat, conint
 from starlette import status
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
 
 from memory import Memory
-from webapp.utils.celery_utils import get_task_info
+from settings import settings
+from commons.model_data_class import EmailBatchInput
+from commons.model_serving import (
+    get_cached_prediction,
+    get_micro_batcher,
+    predict_batch_sync,
+    predict_sync,
+)
+from commons.prediction_cache import get_prediction_cache
+from webapp.utils.async_utils import run_io
+from webapp.utils.batch_utils import parse_emails_file
+from webapp.utils.celery_utils import send_task_async
+from webapp.utils.task_watcher import read_task_info, task_event_stream
 from webapp.auth_controler import check_auth_token
-from workers.tasks import check_one_email_task
 
 
 memory = Memory.getInstance()
@@ -21,25 +37,144 @@ router = APIRouter(
     "/single/{email}",
     summary="Make a prediction for a single email",
     status_code=status.HTTP_201_CREATED,
-    response_description="The probability of the email being a fraud",
+    response_description="The probability of the email being a fraud, or the id of the task computing it",
 )
-def single_email_prediction(
+async def single_email_prediction(
     email: str,
+    sync: bool = settings.SYNC_PREDICTION,
+    store_result: bool = True,
+    cached: bool = False,
     api_key: APIKey = Depends(check_auth_token),
 ) -> dict:
-    result = check_one_email_task.delay(email)
+    """
+    With `store_result=false`, the task is fire-and-forget: the worker scores
+    the email (and fills the prediction cache) but does not write its result.
+
+    With `cached=true`, an email whose prediction is in the prediction cache is
+    answered directly with `{"proba", "email", "model_id"}` instead of a
+    `task_id`; by default a task is always sent and its `task_id` returned.
+    """
+    if sync:
+        try:
+            return await run_in_threadpool(predict_sync, email)
+        except Exception as e:
+            raise HTTPException(
+                detail=f"Error scoring the email: {e}",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+    if cached and store_result:
+        # a cached prediction is answered directly, without a task nor a result to store
+        prediction = await run_io(get_cached_prediction, email)
+        if prediction is not None:
+            return prediction
+    result = await send_task_async(
+        "check_one_email_task", email, ignore_result=not store_result
+    )
     return {"task_id": result.task_id}
 
 
+async def batch_prediction(
+    emails: List[str], chunk_size: int, sync: bool, store_result: bool = True
+) -> dict:
+    if not emails:
+        raise HTTPException(
+            detail="No email to score", status_code=status.HTTP_400_BAD_REQUEST
+        )
+    if len(emails) > settings.BATCH_MAX_EMAILS:
+        raise HTTPException(
+            detail=f"Too many emails, the limit is {settings.BATCH_MAX_EMAILS} per batch",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    if sync:
+        try:
+            return await run_in_threadpool(predict_batch_sync, emails, chunk_size)
+        except Exception as e:
+            raise HTTPException(
+                detail=f"Error scoring the emails: {e}",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+    result = await send_task_async(
+        "check_batch_emails_task", emails, chunk_size, ignore_result=not store_result
+    )
+    return {"task_id": result.task_id, "count": len(emails)}
+
+
+@router.post(
+    "/batch",
+    summary="Make a prediction for a list of emails",
+    status_code=status.HTTP_201_CREATED,
+    response_description="The probabilities of the emails being a fraud, or the id of the task computing them",
+)
+async def batch_email_prediction(
+    batch_input: EmailBatchInput,
+    sync: bool = settings.SYNC_PREDICTION,
+    store_result: bool = True,
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    return await batch_prediction(
+        batch_input.emails, batch_input.chunk_size, sync, store_result
+    )
+
+
+@router.post(
+    "/batch/file",
+    summary="Make a prediction for the emails of an uploaded CSV or NDJSON file",
+    status_code=status.HTTP_201_CREATED,
+    response_description="The probabilities of the emails being a fraud, or the id of the task computing them",
+)
+async def batch_file_prediction(
+    request: Request,
+    chunk_size: Optional[conint(gt=0)] = None,
+    sync: bool = settings.SYNC_PREDICTION,
+    store_result: bool = True,
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    content = await request.body()
+    try:
+        emails = parse_emails_file(content, request.headers.get("content-type", ""))
+    except (ValueError, KeyError) as e:
+        raise HTTPException(
+            detail=f"Error reading the file: {e}",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    return await batch_prediction(emails, chunk_size, sync, store_result)
+
+
+@router.get(
+    "/micro_batching/metrics",
+    summary="Get the batch size and queueing delay distributions of the micro-batching layer",
+    status_code=status.HTTP_200_OK,
+)
+async def micro_batching_metrics(
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    return get_micro_batcher().stats()
+
+
+@router.get(
+    "/cache/stats",
+    summary="Get the size and the hit/miss counters of the prediction cache",
+    status_code=status.HTTP_200_OK,
+)
+async def prediction_cache_stats(
+    api_key: APIKey = Depends(check_auth_token),
+) -> dict:
+    cache = get_prediction_cache()
+    if cache is None:
+        return {"backend": "none"}
+    return cache.stats()
+
+
 @router.get(
     "/tasks/{task_id}",
-    summary="Get the status of a task and the result if available",
+    summary="Get the status of a task and the result if available, waiting up to `wait` seconds for it to finish",
 )
-def get_task(
+async def get_task(
     task_id: str,
+    wait: confloat(ge=0) = 0,
     api_key: APIKey = Depends(check_auth_token),
 ):
-    task_info = get_task_info(task_id)
+    task_info = await read_task_info(task_id, wait)
     if not task_info or "task_status" not in task_info:
         raise HTTPException(
             detail="Task Not found", status_code=status.HTTP_404_NOT_FOUND
@@ -61,3 +196,18 @@ def get_task(
         detail="Task is Running, Pending or Cancelled",
         status_code=status.HTTP_400_BAD_REQUEST,
     )
+
+
+@router.get(
+    "/tasks/{task_id}/stream",
+    summary="Stream the states of a task as server-sent events until it is finished",
+)
+async def stream_task(
+    task_id: str,
+    timeout: confloat(gt=0) = settings.TASK_STREAM_MAX,
+    api_key: APIKey = Depends(check_auth_token),
+):
+    return StreamingResponse(
+        task_event_stream(task_id, min(timeout, settings.TASK_STREAM_MAX)),
+        media_type="text/event-stream",
+    )
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from webapp.endpoints.data_controler import router as data_controle_rooter
 from webapp.endpoints.model_controler import router as model_controle_rooter
 from webapp.endpoints.prediction_controler import router as prediction_controle_rooter
 
@@ -7,3 +8,4 @@ from webapp.endpoints.prediction_controler import router as prediction_controle_
 router = APIRouter()
 router.include_router(model_controle_rooter)
 router.include_router(prediction_controle_rooter)
+router.include_router(data_controle_rooter)
@@ -0,0 +1,48 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from settings import settings
+
+# blocking I/O of the handlers (broker, result backend, registry) runs in its own
+# pool, so that it never competes with the threadpool of the sync handlers
+_io_executor = ThreadPoolExecutor(
+    max_workers=settings.API_IO_THREADS, thread_name_prefix="api-io"
+)
+_io_stats = {"calls": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+async def run_io(function: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking I/O call in the I/O thread pool without blocking the event loop
+
+    Args:
+        function (Callable): The blocking function
+        *args, **kwargs: Its arguments
+
+    Returns:
+        Any: the return value of the function
+    """
+    loop = asyncio.get_event_loop()
+    # only updated from the event loop, no lock needed
+    _io_stats["calls"] += 1
+    _io_stats["in_flight"] += 1
+    _io_stats["max_in_flight"] = max(_io_stats["max_in_flight"], _io_stats["in_flight"])
+    try:
+        return await loop.run_in_executor(
+            _io_executor, partial(function, *args, **kwargs)
+        )
+    finally:
+        _io_stats["in_flight"] -= 1
+
+
+def io_pool_stats() -> dict:
+    """
+    Get the utilization of the I/O thread pool. More calls in flight than
+    threads means that calls are queued.
+
+    Returns:
+        dict: the number of threads, the calls in flight and their maximum, the total calls
+    """
+    return dict(_io_stats, threads=settings.API_IO_THREADS)
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+from typing import List
+
+from commons.constants import INTERESTING_COLUMN
+
+
+def parse_emails_csv(content: str) -> List[str]:
+    """
+    Read the emails of a CSV file. The emails are read from the `email` column
+    if the file has a header, otherwise from the first column. A row without
+    the email column raises a ValueError.
+    """
+    rows = [row for row in csv.reader(io.StringIO(content)) if row]
+    if not rows:
+        return []
+    header = [column.strip() for column in rows[0]]
+    if INTERESTING_COLUMN.EMAIL_COLUMN in header:
+        index = header.index(INTERESTING_COLUMN.EMAIL_COLUMN)
+        rows = rows[1:]
+    else:
+        index = 0
+    emails = []
+    for row in rows:
+        if len(row) <= index:
+            raise ValueError(
+                f"the row {row} has no '{INTERESTING_COLUMN.EMAIL_COLUMN}' column"
+            )
+        emails.append(row[index].strip())
+    return emails
+
+
+def parse_emails_ndjson(content: str) -> List[str]:
+    """
+    Read the emails of a NDJSON file. Each line is either a JSON string
+    or a JSON object with an `email` field.
+    """
+    emails = []
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            record = record[INTERESTING_COLUMN.EMAIL_COLUMN]
+        emails.append(str(record).strip())
+    return emails
+
+
+def parse_emails_file(content: bytes, content_type: str) -> List[str]:
+    """
+    return the emails of an uploaded file, parsed according to its content type
+    """
+    text = content.decode("utf-8-sig")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return parse_emails_ndjson(text)
+    if "csv" in content_type or "text/plain" in content_type:
+        return parse_emails_csv(text)
+    raise ValueError(
+        f"Unsupported content type '{content_type}', use text/csv or application/x-ndjson"
+    )
@@ -1,16 +1,152 @@
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, List
+
+from celery import states
+from celery.result import AsyncResult
+
+from commons.metrics import TASK_STAGE_SECONDS, timed
+from commons.mongo_utils import get_mongo_database
+from settings import settings
+from webapp.utils.async_utils import run_io
 from worker import celery
 
 
-def get_task_info(task_id: str) -> Dict:
+def send_task(task_name: str, *args, ignore_result: bool = False) -> AsyncResult:
     """
-    return task info for the given task_id
+    Send a task of `workers.tasks` to the workers by its name, so that the API
+    does not import the tasks module and the ML modules behind it.
+    With `ignore_result`, the worker does not write the result of the task.
     """
-    task_result = celery.AsyncResult(task_id)
-    result = {
-        "task_id": task_id,
-        "task_status": task_result.status,
-        "task_result": task_result.result,
-    }
+    options = {"ignore_result": True} if ignore_result else {}
+    with timed(TASK_STAGE_SECONDS, task=task_name, stage="enqueue"):
+        return celery.send_task(f"workers.tasks.{task_name}", args=args, **options)
+
+
+async def send_task_async(
+    task_name: str, *args, ignore_result: bool = False
+) -> AsyncResult:
+    """
+    Send a task of `workers.tasks` without blocking the event loop. The message
+    is published in the I/O thread pool with a producer of the Celery
+    connection pool, so the broker connections are reused across requests.
+    """
+    return await run_io(send_task, task_name, *args, ignore_result=ignore_result)
+
 
+@lru_cache(maxsize=None)
+def get_prediction_result_backend():
+    """
+    The result backend of the prediction tasks, None when they share the
+    backend of the other tasks
+    """
+    from workers.result_backends import build_prediction_result_backend
+
+    return build_prediction_result_backend(celery)
+
+
+def _jsonable_result(result):
+    # the failures are stored as an exception, sent back as its type and message
+    if isinstance(result, BaseException):
+        return {"exc_type": type(result).__name__, "exc_message": str(result)}
     return result
+
+
+def _read_results(backend, task_ids: List[str], infos: Dict[str, Dict]) -> List[str]:
+    # one query when it is a MongoDB backend, through the MongoDB client of the
+    # process whose pool is shared by all the threads (the Celery backend opens
+    # one client per thread)
+    if getattr(backend, "taskmeta_collection", None):
+        collection = get_mongo_database()[backend.taskmeta_collection]
+        documents = collection.find(
+            {"_id": {"$in": task_ids}}, {"status": 1, "result": 1}
+        )
+        for document in documents:
+            infos[document["_id"]].update(
+                task_status=document["status"],
+                task_result=backend.decode(document["result"]),
+            )
+    else:
+        for task_id in task_ids:
+            meta = backend.get_task_meta(task_id)
+            infos[task_id].update(
+                task_status=meta["status"],
+                task_result=_jsonable_result(meta["result"]),
+            )
+    return [
+        task_id
+        for task_id in task_ids
+        if infos[task_id]["task_status"] == states.PENDING
+    ]
+
+
+def get_tasks_info(task_ids: List[str]) -> Dict[str, Dict]:
+    """
+    return task info for several task ids. The results of the predictions are
+    read first from their own backend, then the tasks still pending from the
+    result backend of the other tasks.
+    """
+    infos = {
+        task_id: {
+            "task_id": task_id,
+            "task_status": states.PENDING,
+            "task_result": None,
+        }
+        for task_id in task_ids
+    }
+    pending = list(task_ids)
+    prediction_backend = get_prediction_result_backend()
+    if prediction_backend is not None:
+        pending = _read_results(prediction_backend, pending, infos)
+    if pending:
+        _read_results(celery.backend, pending, infos)
+    return infos
+
+
+def _pool_stats(pool) -> dict:
+    # kombu pools keep the acquired resources in a set
+    return {"limit": pool.limit, "in_use": len(pool._dirty)}
+
+
+def broker_pool_stats() -> dict:
+    """
+    return the utilization of the broker connection and producer pools of the process
+    """
+    return {
+        "connections": _pool_stats(celery.pool),
+        "producers": _pool_stats(celery.producer_pool),
+        "heartbeat": celery.conf.broker_heartbeat,
+    }
+
+
+def queue_depths() -> Dict[str, int]:
+    """
+    Get the number of messages waiting in each queue of the broker
+
+    Returns:
+        Dict[str, int]: the number of ready messages per queue, empty if the
+        broker cannot be reached
+    """
+    depths = {}
+    try:
+        with celery.connection_for_read(
+            connect_timeout=settings.QUEUE_DEPTH_TIMEOUT
+        ) as connection:
+            # a single attempt, a scrape must not wait for the reconnection retries
+            connection.ensure_connection(max_retries=0)
+            for queue in [
+                settings.INFERENCE_QUEUE,
+                settings.TRAINING_QUEUE,
+                settings.CONTROL_QUEUE,
+            ]:
+                # one channel per queue, the broker closes it if the queue is not declared
+                with connection.channel() as channel:
+                    try:
+                        depths[queue] = channel.queue_declare(
+                            queue=queue, passive=True
+                        ).message_count
+                    except Exception:
+                        continue
+    except Exception:
+        # the broker is down: the queue depths are missing from the scrape
+        return {}
+    return depths
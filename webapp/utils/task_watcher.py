@@ -0,0 +1,161 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Set
+
+from celery import states
+
+from memory import Memory
+from settings import settings
+from webapp.utils.async_utils import run_io
+from webapp.utils.celery_utils import get_tasks_info
+
+memory = Memory.getInstance()
+
+
+class _Subscription:
+    def __init__(self, task_id: str) -> None:
+        self.task_id = task_id
+        self.queue = asyncio.Queue()
+        self.last_info = None
+
+
+class TaskWatcher:
+    """
+    Watch the result backend for the tasks awaited by the clients of the API
+    process. A single background coroutine reads the state of every watched
+    task in one backend query per interval, in a thread so that the event loop
+    never blocks, and pushes each change to the subscribers of the task.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._subscriptions: Dict[str, Set[_Subscription]] = {}
+        self._poller = None
+        self.reads = 0
+
+    def _subscribe(self, task_id: str) -> _Subscription:
+        subscription = _Subscription(task_id)
+        self._subscriptions.setdefault(task_id, set()).add(subscription)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+        return subscription
+
+    def _unsubscribe(self, subscription: _Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.task_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            self._subscriptions.pop(subscription.task_id, None)
+
+    async def _poll(self) -> None:
+        while self._subscriptions:
+            task_ids = list(self._subscriptions)
+            try:
+                infos = await run_io(get_tasks_info, task_ids)
+                self.reads += 1
+            except Exception as e:
+                print(f"Task watcher failed to read the result backend: {e}")
+                infos = {}
+            for task_id, info in infos.items():
+                for subscription in list(self._subscriptions.get(task_id, ())):
+                    if info != subscription.last_info:
+                        subscription.last_info = info
+                        subscription.queue.put_nowait(info)
+            await asyncio.sleep(self.interval)
+
+    async def updates(self, task_id: str, timeout: float) -> AsyncIterator[Dict]:
+        """
+        Iterate over the states of a task as they change, until the task is
+        finished or the timeout expires
+
+        Args:
+            task_id (str): The id of the task
+            timeout (float): The maximum time to wait for, in seconds
+
+        Yields:
+            Dict: the task info, each time its state or its result changes
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        subscription = self._subscribe(task_id)
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    info = await asyncio.wait_for(subscription.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    return
+                yield info
+                if info["task_status"] in states.READY_STATES:
+                    return
+        finally:
+            self._unsubscribe(subscription)
+
+    async def wait(self, task_id: str, timeout: float) -> Dict:
+        """
+        Wait for a task to finish
+
+        Args:
+            task_id (str): The id of the task
+            timeout (float): The maximum time to wait for, in seconds
+
+        Returns:
+            Dict: the task info, when the task finished or at the timeout
+        """
+        info = {"task_id": task_id, "task_status": states.PENDING, "task_result": None}
+        async for info in self.updates(task_id, timeout):
+            pass
+        return info
+
+    def stats(self) -> dict:
+        return {
+            "watched_tasks": len(self._subscriptions),
+            "waiting_clients": sum(map(len, self._subscriptions.values())),
+            "backend_reads": self.reads,
+        }
+
+
+def get_task_watcher() -> TaskWatcher:
+    """
+    Get the task watcher of the API process, created on first use
+
+    Returns:
+        TaskWatcher: the task watcher
+    """
+    if memory.task_watcher is None:
+        memory.task_watcher = TaskWatcher(settings.TASK_WATCH_INTERVAL)
+    return memory.task_watcher
+
+
+async def read_task_info(task_id: str, wait: float = 0) -> Dict:
+    """
+    Get the task info without blocking the event loop. With a wait, the request
+    is held until the task finishes (long-poll), at most settings.TASK_WAIT_MAX seconds.
+
+    Args:
+        task_id (str): The id of the task
+        wait (float, optional): The maximum time to wait for the task to finish, in seconds. Defaults to 0.
+
+    Returns:
+        Dict: the task info
+    """
+    if wait > 0:
+        return await get_task_watcher().wait(task_id, min(wait, settings.TASK_WAIT_MAX))
+    return (await run_io(get_tasks_info, [task_id]))[task_id]
+
+
+async def task_event_stream(task_id: str, timeout: float) -> AsyncIterator[str]:
+    """
+    Server-sent events of the states of a task, until it is finished or the timeout expires
+
+    Args:
+        task_id (str): The id of the task
+        timeout (float): The maximum duration of the stream, in seconds
+
+    Yields:
+        str: one `event: <status>` event per change, with the task info as data
+    """
+    async for info in get_task_watcher().updates(task_id, timeout):
+        yield f"event: {info['task_status']}\ndata: {json.dumps(info, default=str)}\n\n"
+    yield "event: end\ndata: {}\n\n"
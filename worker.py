@@ -1,6 +1,11 @@
+import time
+
 from fastapi import FastAPI
 from celery import Celery
+from celery.signals import before_task_publish
+from kombu import Exchange, Queue
 
+from commons.mongo_utils import mongo_client_options
 from settings import settings
 
 
@@ -23,7 +28,55 @@ celery.conf.update(
         "user": settings.MONGO_USERNAME,
         "password": settings.MONGO_PASSWORD,
         "taskmeta_collection": settings.CELERY_BACKEND_COL,
+        "options": mongo_client_options(),
     }
 )
 celery.conf.update(timezone="Europe/Paris")
-celery.conf.update(task_routes={"workers.tasks.*": {"queue": "queue"}})
+
+# the predictions never wait behind a training: each kind of task has its own
+# queue, consumed by its own workers, and the tasks of a queue are prioritized
+QUEUE_MAX_PRIORITY = 9
+celery.conf.update(
+    task_queues=[
+        Queue(
+            name,
+            Exchange(name),
+            routing_key=name,
+            queue_arguments={"x-max-priority": QUEUE_MAX_PRIORITY},
+        )
+        for name in [
+            settings.INFERENCE_QUEUE,
+            settings.TRAINING_QUEUE,
+            settings.CONTROL_QUEUE,
+        ]
+    ]
+)
+celery.conf.update(task_default_queue=settings.CONTROL_QUEUE)
+celery.conf.update(task_queue_max_priority=QUEUE_MAX_PRIORITY)
+celery.conf.update(
+    task_routes={
+        "workers.tasks.check_one_email_task": {
+            "queue": settings.INFERENCE_QUEUE,
+            "priority": settings.SINGLE_PREDICTION_PRIORITY,
+        },
+        "workers.tasks.check_batch_emails_task": {
+            "queue": settings.INFERENCE_QUEUE,
+            "priority": settings.BATCH_PREDICTION_PRIORITY,
+        },
+        "workers.tasks.bootstrap_default_model_task": {
+            "queue": settings.TRAINING_QUEUE,
+            "priority": settings.BOOTSTRAP_PRIORITY,
+        },
+        "workers.tasks.train_model_task": {"queue": settings.TRAINING_QUEUE},
+        "workers.tasks.sweep_models_task": {"queue": settings.TRAINING_QUEUE},
+        "workers.tasks.update_model_task": {"queue": settings.TRAINING_QUEUE},
+        "workers.tasks.evaluate_model_task": {"queue": settings.TRAINING_QUEUE},
+        "workers.tasks.setup_main_model_task": {"queue": settings.CONTROL_QUEUE},
+    }
+)
+
+
+@before_task_publish.connect
+def add_publish_timestamp(headers=None, **kwargs):
+    # read by the workers to measure the time spent in the queue
+    headers["sent_at"] = time.time()
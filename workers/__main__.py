@@ -0,0 +1,57 @@
+import argparse
+import socket
+
+from settings import settings
+from worker import celery
+
+# pool type, processes and prefetched tasks per process of the worker of each queue
+WORKER_OPTIONS = {
+    settings.INFERENCE_QUEUE: (
+        settings.INFERENCE_WORKER_POOL,
+        settings.INFERENCE_WORKER_CONCURRENCY,
+        settings.INFERENCE_WORKER_PREFETCH,
+    ),
+    settings.TRAINING_QUEUE: (
+        settings.TRAINING_WORKER_POOL,
+        settings.TRAINING_WORKER_CONCURRENCY,
+        settings.TRAINING_WORKER_PREFETCH,
+    ),
+    settings.CONTROL_QUEUE: (
+        settings.CONTROL_WORKER_POOL,
+        settings.CONTROL_WORKER_CONCURRENCY,
+        settings.CONTROL_WORKER_PREFETCH,
+    ),
+}
+
+
+def worker_argv(queue: str, loglevel: str = "info") -> list:
+    """
+    Build the Celery command line of the worker of a queue
+
+    Args:
+        queue (str): The queue consumed by the worker
+        loglevel (str, optional): The log level. Defaults to "info".
+
+    Returns:
+        list: the arguments of `celery.worker_main`
+    """
+    pool, concurrency, prefetch = WORKER_OPTIONS[queue]
+    return [
+        "worker",
+        f"--queues={queue}",
+        f"--pool={pool}",
+        f"--concurrency={concurrency}",
+        f"--prefetch-multiplier={prefetch}",
+        f"--hostname={queue}@{socket.gethostname()}",
+        f"--loglevel={loglevel}",
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Start the Celery worker of a queue with its pool settings"
+    )
+    parser.add_argument("queue", choices=list(WORKER_OPTIONS))
+    parser.add_argument("--loglevel", default="info")
+    args = parser.parse_args()
+    celery.worker_main(worker_argv(args.queue, args.loglevel))
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from typing import Union
+
+from celery.app.backends import by_url
+from celery.backends.base import BaseBackend
+from celery.backends.mongodb import MongoBackend
+from pymongo import ReplaceOne
+
+from commons.mongo_utils import MongoBulkWriter, get_mongo_database
+from settings import settings
+
+
+class PredictionResultBackend(MongoBackend):
+    """
+    Result backend of the prediction tasks. The results are stored in their
+    own collection, expire through a TTL index, and are written in bulk by a
+    background thread instead of one write per task.
+    """
+
+    def __init__(self, app, collection_name: str, ttl: float, **kwargs) -> None:
+        super().__init__(app=app, **kwargs)
+        self.taskmeta_collection = collection_name
+        self.ttl = ttl
+        self.writer = MongoBulkWriter(
+            lambda: self.collection,
+            batch_size=settings.PREDICTION_RESULT_BATCH_SIZE,
+            flush_interval=settings.PREDICTION_RESULT_FLUSH_MS / 1000,
+        )
+
+    def _get_database(self):
+        # the client of the process, whose pool is shared with the other collections
+        return get_mongo_database()
+
+    @property
+    def collection(self):
+        collection = self.database[self.taskmeta_collection]
+        if not getattr(self, "_indexed", False):
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    def _store_result(
+        self, task_id, result, state, traceback=None, request=None, **kwargs
+    ):
+        meta = self._get_result_meta(
+            result=self.encode(result),
+            state=state,
+            traceback=traceback,
+            request=request,
+            format_date=False,
+        )
+        meta["_id"] = task_id
+        meta["expires_at"] = datetime.utcnow() + timedelta(seconds=self.ttl)
+        self.writer.add(ReplaceOne({"_id": task_id}, meta, upsert=True))
+        return result
+
+
+def build_prediction_result_backend(app) -> Union[BaseBackend, None]:
+    """
+    Build the result backend of the prediction tasks according to
+    settings.PREDICTION_RESULT_BACKEND: "mongo" for a MongoDB collection with a
+    TTL index written in bulk, "default" for the result backend of the app
+    (the one of the training tasks), or the URL of another Celery result
+    backend (e.g. redis://...), whose results expire after settings.PREDICTION_RESULT_TTL.
+
+    Args:
+        app (Celery): The Celery app
+
+    Returns:
+        Union[BaseBackend, None]: the backend, None for the result backend of the app
+    """
+    if settings.PREDICTION_RESULT_BACKEND == "default":
+        return None
+    if settings.PREDICTION_RESULT_BACKEND == "mongo":
+        return PredictionResultBackend(
+            app,
+            collection_name=settings.PREDICTION_RESULT_COL,
+            ttl=settings.PREDICTION_RESULT_TTL,
+        )
+    backend_class, url = by_url(settings.PREDICTION_RESULT_BACKEND, app.loader)
+    return backend_class(app=app, url=url, expires=settings.PREDICTION_RESULT_TTL)
@@ -1,23 +1,194 @@
-import pandas as pd
+from threading import Thread
+from typing import Callable
+
+from celery.concurrency import prefork, solo
+from celery.signals import (
+    task_prerun,
+    task_success,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_ready,
+)
+
 from memory import Memory
 from worker import celery
 
-from commons.model_training import train_model, setup_main_model
+from commons.metrics import (
+    instrumented_task,
+    observe_queue_wait,
+    observe_result_write,
+    start_metrics_server,
+)
+from commons.model_deployment import get_model_deployer
+from commons.mongo_utils import get_pool_listener
+from commons.model_training import (
+    bootstrap_default_model,
+    get_model_meta_data,
+    get_serving_model_id,
+    setup_main_model,
+    train_model,
+)
+from commons.model_serving import (
+    format_batch_result,
+    get_serving_pipeline,
+    score_emails,
+)
+from settings import settings
+from workers.result_backends import (
+    PredictionResultBackend,
+    build_prediction_result_backend,
+)
 
 memory = Memory.getInstance()
 
+prediction_backend = build_prediction_result_backend(celery)
+# the prediction results are short-lived: no STARTED state, and their own backend
+PREDICTION_TASK_OPTIONS = {"track_started": False}
+if prediction_backend is not None:
+    PREDICTION_TASK_OPTIONS["backend"] = prediction_backend
+
+# queues consumed by this worker, set before the pool is created
+consumed_queues = set()
+
+
+def consumes_training_queue() -> bool:
+    # a worker started without the queues option consumes all of them
+    return not consumed_queues or settings.TRAINING_QUEUE in consumed_queues
+
+
+def _import_training_stack():
+    import commons.model_sweep  # noqa: F401
+    import sklearn.ensemble  # noqa: F401
+
+
+@worker_init.connect
+def record_consumed_queues(sender, **kwargs):
+    # before the solo pool is created, as it sends worker_process_init right away
+    consumed_queues.update(sender.app.amqp.queues.consume_from or {})
+    # whatever the command line that started the worker (`python3 -m workers`)
+    memory.process_role = "worker"
+
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    if settings.WORKER_METRICS_PORT:
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+
+
+@task_prerun.connect
+def observe_task_queue_wait(task=None, **kwargs):
+    sent_at = getattr(task.request, "sent_at", None)
+    if sent_at is not None:
+        observe_queue_wait(task.name.rsplit(".", 1)[-1], sent_at)
+
+
+@task_success.connect
+def observe_task_result_write(sender=None, **kwargs):
+    observe_result_write(sender.name.rsplit(".", 1)[-1])
+
+
+@worker_ready.connect
+def bootstrap_default_model_on_start(**kwargs):
+    # the default model is trained by a task of the training queue, sent by
+    # the workers that will run it, which accept tasks in the meantime
+    if not consumes_training_queue():
+        return
+    if get_model_meta_data("default") is None or get_serving_model_id() is None:
+        bootstrap_default_model_task.delay()
+
+
+@worker_process_init.connect
+def start_model_deployer(**kwargs):
+    # each pool process loads the serving model in the background and reports
+    # its readiness, then follows the serving model of the registry on its own
+    get_model_deployer()
+    # before the result backend opens its client, so that its pool is monitored
+    get_pool_listener()
+    # the workers of the inference queue never import the training modules
+    if settings.WORKER_PRELOAD_TRAINING and consumes_training_queue():
+        Thread(target=_import_training_stack, daemon=True).start()
+
+
+@worker_ready.connect
+def start_worker_model_deployer(sender, **kwargs):
+    # prefork sends worker_process_init in each child and solo when it is created,
+    # the threads and green pools never do: their tasks run in the worker process
+    if not isinstance(sender.pool, (prefork.TaskPool, solo.TaskPool)):
+        start_model_deployer()
+
+
+@worker_process_shutdown.connect
+def flush_prediction_results(**kwargs):
+    if isinstance(prediction_backend, PredictionResultBackend):
+        prediction_backend.writer.flush()
+
+
+def report_progress(task) -> Callable[[dict], None]:
+    """
+    Report the progress of a task as its PROGRESS state, with the progress as meta data
+    """
+
+    def progress(info: dict) -> None:
+        if task.request.id is not None:
+            task.update_state(state="PROGRESS", meta=info)
+
+    return progress
+
+
+@celery.task(shared=True, max_retries=3, bind=True)
+@instrumented_task
+def train_model_task(self, params: dict):
+    return train_model(params, default_model=False, progress=report_progress(self))
+
 
 @celery.task(shared=True, max_retries=3)
-def train_model_task(params: dict):
-    return train_model(params, default_model=False)
+@instrumented_task
+def sweep_models_task(sweep_input: dict):
+    from commons.model_sweep import run_sweep
+
+    return run_sweep(sweep_input)
 
 
 @celery.task(shared=True, max_retries=3)
+@instrumented_task
+def update_model_task(model_id: str, update_input: dict):
+    from commons.model_update import update_model
+
+    return update_model(model_id, update_input)
+
+
+@celery.task(shared=True, max_retries=3)
+@instrumented_task
+def evaluate_model_task(model_id: str, evaluation_input: dict):
+    from commons.model_evaluation import evaluate_model
+
+    return evaluate_model(model_id, evaluation_input)
+
+
+@celery.task(shared=True, max_retries=3)
+@instrumented_task
+def bootstrap_default_model_task():
+    return bootstrap_default_model()
+
+
+@celery.task(shared=True, max_retries=3, **PREDICTION_TASK_OPTIONS)
+@instrumented_task
 def check_one_email_task(email: str):
-    result = memory.model_deployed.predict_proba(pd.DataFrame([{"email": email}]))[0][0]
+    model_id, pipeline = get_serving_pipeline()
+    result = score_emails(model_id, pipeline, [email])[0]
     return {"proba": result, "email": email}
 
 
+@celery.task(shared=True, max_retries=3, **PREDICTION_TASK_OPTIONS)
+@instrumented_task
+def check_batch_emails_task(emails: list, chunk_size: int = None):
+    model_id, pipeline = get_serving_pipeline()
+    probas = score_emails(model_id, pipeline, emails, chunk_size)
+    return format_batch_result(emails, probas, model_id)
+
+
 @celery.task(shared=True, max_retries=3)
+@instrumented_task
 def setup_main_model_task(model_id: str):
     return setup_main_model(model_id)